@@ -1,3 +1,5 @@
+import uuid
+
 from django.db.models import Count, Max, Q
 from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
@@ -10,7 +12,11 @@ from rest_framework.generics import (
     RetrieveUpdateAPIView,
 )
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
 from rest_framework.views import APIView
 
 from src.goal.api.versions.v1.filters.backends import (
@@ -85,7 +91,14 @@ from src.goal.models.extensions.card_actions import (
 )
 from src.goal.models.extensions.card_actions import start_many as start_cards
 from src.goal.models.user import User
+from src.goal.services.admin_units import get_subtree_units
 from src.goal.services.card_export.service import CardExportService, ExportCardFormat
+from src.goal.services.card_generation.plan import (
+    PlanOwner,
+    PlanOwnerMismatch,
+    load_plans,
+)
+from src.goal.services.progress import get_progress
 from src.goal.tasks import (
     actualize_card,
     assess_card,
@@ -103,6 +116,10 @@ from src.goal.tasks.camunda.card_agreement.send_approve_status import (
 from src.goal.tasks.camunda.card_agreement.send_assessment_approve import (
     send_approve_assessment,
 )
+from src.goal.tasks.cards_generation import (
+    apply_cards_generation_plan,
+    generate_cards,
+)
 from src.helpers.decorators import swagger_fake_qs
 
 
@@ -250,27 +267,13 @@ class OrgstructureCardsStartView(RetrieveAPIView):
         )
         period = Period.objects.get(id=period_id)
 
-        if with_hierarchy:
-            unit_list = get_orgstructure(
-                url_params={
-                    "unit": bus_unit_id,
-                    "fields": "flat_list_subunits",
-                    "interval_start": period.date_start.isoformat(),
-                    "interval_end": period.date_end.isoformat(),
-                }
-            )
-
-            cards = self.get_queryset().filter(
-                business_unit__in=unit_list[0]["flat_list_subunits"]
-                if unit_list
-                else [bus_unit_id],
-                period_id=period_id,
-            )
-        else:
-            cards = self.get_queryset().filter(
-                business_unit=bus_unit_id,
-                period_id=period_id,
-            )
+        units_list = (
+            get_subtree_units(bus_unit_id, period) if with_hierarchy else (bus_unit_id,)
+        )
+        cards = self.get_queryset().filter(
+            business_unit__in=units_list,
+            period_id=period_id,
+        )
 
         start_cards(
             cards, self.request.user.perno, bus_unit_id, with_hierarchy=with_hierarchy
@@ -343,12 +346,50 @@ class CardGenerateView(APIView):
         bus_unit_id = self.kwargs.get("bus_unit_id")
         with_hierarchy = request.query_params.get("with_hierarchy", "false")
         with_hierarchy = bool(with_hierarchy.lower() == "true")
+        dry_run = request.query_params.get("dry_run", "false").lower() == "true"
+        plan_id = request.query_params.get("plan_id")
+        if dry_run:
+            plan_task_id = str(uuid.uuid4())
+            generate_cards.delay(
+                bus_unit_id,
+                period_id,
+                self.request.user.perno,
+                plan_task_id,
+                is_user_sysadmin=self.request.user.is_sys_admin,
+                with_hierarchy=with_hierarchy,
+                dry_run=True,
+            )
+            return Response(
+                f"Запущен расчет плана генерации {plan_task_id} "
+                f"для подразделения {bus_unit_id}"
+            )
+        if plan_id:
+            try:
+                plans = load_plans(
+                    plan_id, PlanOwner(self.request.user.perno, period_id, bus_unit_id)
+                )
+            except PlanOwnerMismatch as e:
+                return Response(str(e), status=HTTP_400_BAD_REQUEST)
+            if plans is None:
+                return Response(
+                    f"План генерации {plan_id} не найден или устарел",
+                    status=HTTP_404_NOT_FOUND,
+                )
         action_log = OrgStructureActionsLog.objects.create(
             action_type=OrgStructureActionsLog.GENERATE,
             initiator_perno=self.request.user.perno,
             business_unit=bus_unit_id,
             with_hierarchy=with_hierarchy,
         )
+        if plan_id:
+            apply_cards_generation_plan.delay(
+                plan_id,
+                self.request.user.perno,
+                period_id,
+                bus_unit_id,
+                action_log=action_log.id,
+            )
+            return Response(f"Запущено применение плана генерации {plan_id}")
         generate(
             bus_unit_id,
             period_id,
@@ -362,6 +403,22 @@ class CardGenerateView(APIView):
         return Response(message)
 
 
+class BulkTaskProgressView(APIView):
+    """Прогресс массовой задачи по подразделениям (из кэша, без запросов к БД)"""
+
+    swagger_schema = SwaggerAutoSchema
+    permission_classes = (CardManagerActionsPermission,)
+
+    def get(self, request, *args, **kwargs):
+        task_id = self.kwargs.get("task_id")
+        progress = get_progress(task_id)
+        if progress is None:
+            return Response(
+                f"Прогресс задачи {task_id} не найден", status=HTTP_404_NOT_FOUND
+            )
+        return Response(progress)
+
+
 class CardActualizeView(APIView):
     swagger_schema = SwaggerAutoSchema
     permission_classes = (CardManagerActionsPermission,)
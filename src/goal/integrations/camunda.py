@@ -1,17 +1,57 @@
 import base64
 import logging
 import os
+import threading
 import uuid
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
-from src.helpers.exceptions.camunda import NoTask
+from src.helpers.circuit_breaker import get_breaker
+from src.helpers.exceptions.camunda import CamundaHTTPError, NoTask
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TIMEOUT = 5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_LOCK_DURATION = 30000
+
+# Таймауты по умолчанию для эндпоинтов, переопределяются настройкой CAMUNDA_TIMEOUTS
+DEFAULT_TIMEOUTS = {
+    "fetch_and_lock": DEFAULT_TIMEOUT,
+    "complete": DEFAULT_TIMEOUT,
+    "extend_lock": DEFAULT_TIMEOUT,
+    "failure": DEFAULT_TIMEOUT,
+    "start_process": DEFAULT_TIMEOUT,
+    "message": DEFAULT_TIMEOUT,
+}
+
+
+# Настройки circuit breaker эндпоинтов (поверх CIRCUIT_BREAKER_DEFAULTS)
+BREAKER_DEFAULTS = {
+    # Long polling: ответ fetchAndLock ожидаемо долгий
+    "fetch_and_lock": {"latency_budget": float("inf")},
+}
+
+
+def is_camunda_failure(error: Exception) -> bool:
+    """Ошибки недоступности Camunda (в отличие от ошибок бизнес-логики 4xx)"""
+    if isinstance(error, CamundaHTTPError):
+        return error.status_code >= 500
+    return isinstance(error, requests.RequestException)
+
+
+def get_camunda_breaker(endpoint: Optional[str] = None):
+    endpoint = endpoint or "default"
+    return get_breaker(
+        f"camunda.{endpoint}",
+        is_failure=is_camunda_failure,
+        **BREAKER_DEFAULTS.get(endpoint, {}),
+    )
+
 
 def set_variable(variable: Any) -> dict:
     return {"value": variable}
@@ -21,52 +61,149 @@ def get_worker_id():
     return str(uuid.uuid4())
 
 
+class CamundaClient:
+    """HTTP-клиент Camunda с пулом keep-alive соединений
+
+    Заголовок авторизации вычисляется один раз при создании клиента, соединения
+    переиспользуются между запросами. Размер пула рассчитан на конкурентность
+    воркера Celery (и потоки внутри задачи).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        auth_header: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeouts: Optional[Mapping[str, float]] = None,
+        default_timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.base_url = f"{base_url.rstrip('/')}/engine-rest"
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = default_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "Authorization": f"Basic {base64.b64encode(str(auth_header).encode()).decode('ascii')}",
+            }
+        )
+
+    @classmethod
+    def from_settings(cls) -> "CamundaClient":
+        auth_header = os.getenv("CAMUNDA_LOGINPASSWORD_BASE64", None)
+        if not auth_header:
+            raise Exception("No auth header provided for camunda")
+        return cls(
+            base_url=settings.CAMUNDA_URL,
+            auth_header=auth_header,
+            pool_size=getattr(settings, "CAMUNDA_POOL_SIZE", None)
+            or getattr(settings, "CELERY_WORKER_CONCURRENCY", None)
+            or DEFAULT_POOL_SIZE,
+            timeouts=getattr(settings, "CAMUNDA_TIMEOUTS", None),
+            default_timeout=getattr(settings, "CAMUNDA_TIMEOUT", DEFAULT_TIMEOUT),
+        )
+
+    def request(
+        self, method: str, url: str, endpoint: Optional[str] = None, **kwargs
+    ) -> Optional[dict]:
+        """Запрос через circuit breaker эндпоинта
+
+        Пока Camunda недоступна, запросы сразу отклоняются с CircuitOpenError,
+        не дожидаясь таймаута.
+        """
+        url = f"{self.base_url}/{url.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint, self.default_timeout))
+        return get_camunda_breaker(endpoint).call(self._request, method, url, **kwargs)
+
+    def _request(self, method: str, url: str, **kwargs) -> Optional[dict]:
+        response = self.session.request(method=method, url=url, **kwargs)
+        if 200 <= response.status_code < 300:
+            if response.content:
+                return response.json()
+            return
+        raise CamundaHTTPError(response.status_code, response.content)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[CamundaClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> CamundaClient:
+    """Клиент Camunda процесса
+
+    Создается лениво и пересоздается после fork: соединения пула
+    нельзя делить между процессами воркера.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = CamundaClient.from_settings()
+                _client_pid = pid
+    return _client
+
+
 def make_request(method: str, url: str, **kwargs) -> Optional[dict]:
     """
     Общий метод для запросов в Camunda
     docs: https://docs.camunda.org/manual/7.7/reference/rest/
     :param method:
     :param url:
-    :param kwargs:
+    :param kwargs: параметры запроса, `endpoint` - имя эндпоинта для выбора таймаута
     :return: dict or None
     """
-    url = url.lstrip("/")
-    url = f"{settings.CAMUNDA_URL}/engine-rest/{url}"
-    auth_header = os.getenv("CAMUNDA_LOGINPASSWORD_BASE64", None)
-    if not auth_header:
-        raise Exception("No auth header provided for camunda")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {base64.b64encode(str(auth_header).encode()).decode('ascii')}",
-    }
-    response = requests.request(
-        method=method, url=url, headers=headers, timeout=5, **kwargs
-    )
-    if 200 <= response.status_code < 300:
-        if response.content:
-            return response.json()
-        return
-    raise Exception(f"Camunda error: {response.status_code} | {response.content}")
+    return get_client().request(method, url, **kwargs)
 
 
-def get_task(topic: str, worker_id: Any, variables: list = None) -> Dict:
+def get_task(
+    topic: str,
+    worker_id: Any,
+    variables: list = None,
+    max_tasks: Optional[int] = None,
+    lock_duration: int = DEFAULT_LOCK_DURATION,
+    async_response_timeout: Optional[int] = None,
+) -> Dict:
     """
     Метод для получения задачи за закрепления ее за конкретным воркером
     docs: https://docs.camunda.org/manual/7.7/reference/rest/external-task/fetch/
     :param topic:
     :param worker_id:
     :param variables:
+    :param max_tasks: по умолчанию settings.CAMUNDA_TASK_BATCH
+    :param lock_duration: время блокировки задачи, мс
+    :param async_response_timeout: long polling - сколько Camunda ждет задачи, мс
     :return: List - список задач
     """
     data = {
         "workerId": worker_id,
-        "maxTasks": settings.CAMUNDA_TASK_BATCH,
+        "maxTasks": max_tasks or settings.CAMUNDA_TASK_BATCH,
         "usePriority": True,
-        "topics": [{"topicName": topic, "lockDuration": 30000}],
+        "topics": [{"topicName": topic, "lockDuration": lock_duration}],
     }
+    kwargs = {}
+    if async_response_timeout:
+        data["asyncResponseTimeout"] = async_response_timeout
+        # Ответ придет не раньше, чем закончится ожидание задач
+        kwargs["timeout"] = async_response_timeout / 1000 + get_client().timeouts.get(
+            "fetch_and_lock", DEFAULT_TIMEOUT
+        )
     if variables:
         data["topics"][0].update({"variables": variables})
-    tasks = make_request(method="post", url="external-task/fetchAndLock", json=data)
+    tasks = make_request(
+        method="post",
+        url="external-task/fetchAndLock",
+        endpoint="fetch_and_lock",
+        json=data,
+        **kwargs,
+    )
     if tasks:
         return tasks
     raise NoTask
@@ -86,7 +223,64 @@ def finish_task(task_id: str, worker_id: Any, variables: dict = None) -> None:
     }
     if variables:
         data.update({"variables": variables})
-    make_request(method="post", url=f"external-task/{task_id}/complete", json=data)
+    make_request(
+        method="post",
+        url=f"external-task/{task_id}/complete",
+        endpoint="complete",
+        json=data,
+    )
+
+
+def extend_lock(task_id: str, worker_id: Any, new_duration: int) -> None:
+    """
+    Метод для продления блокировки задачи
+    docs: https://docs.camunda.org/manual/7.7/reference/rest/external-task/post-extend-lock/
+    :param task_id:
+    :param worker_id:
+    :param new_duration: новое время блокировки от текущего момента, мс
+    :return: None
+    """
+    make_request(
+        method="post",
+        url=f"external-task/{task_id}/extendLock",
+        endpoint="extend_lock",
+        json={"workerId": worker_id, "newDuration": new_duration},
+    )
+
+
+def handle_failure(
+    task_id: str,
+    worker_id: Any,
+    error_message: str,
+    retries: int,
+    retry_timeout: int,
+    error_details: str = None,
+) -> None:
+    """
+    Метод для сообщения об ошибке выполнения задачи
+    docs: https://docs.camunda.org/manual/7.7/reference/rest/external-task/post-failure/
+    :param task_id:
+    :param worker_id:
+    :param error_message:
+    :param retries: сколько попыток осталось, при 0 создается инцидент
+    :param retry_timeout: через сколько задача снова станет доступна, мс
+    :param error_details:
+    :return: None
+    """
+    data = {
+        "workerId": worker_id,
+        "errorMessage": error_message[:666],
+        "retries": retries,
+        "retryTimeout": retry_timeout,
+    }
+    if error_details:
+        data["errorDetails"] = error_details
+    make_request(
+        method="post",
+        url=f"external-task/{task_id}/failure",
+        endpoint="failure",
+        json=data,
+    )
 
 
 def start_process(business_key: str, process_id: str, variables: dict = None) -> Dict:
@@ -102,7 +296,10 @@ def start_process(business_key: str, process_id: str, variables: dict = None) ->
     if variables:
         data.update({"variables": variables})
     return make_request(
-        method="post", url=f"process-definition/key/{process_id}/start", json=data
+        method="post",
+        url=f"process-definition/key/{process_id}/start",
+        endpoint="start_process",
+        json=data,
     )
 
 
@@ -121,4 +318,4 @@ def send_message(business_key: str, message_name: str, variables: dict = None) -
     }
     if variables:
         data.update({"processVariables": variables})
-    make_request(method="post", url="message", json=data)
+    make_request(method="post", url="message", endpoint="message", json=data)
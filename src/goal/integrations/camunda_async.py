@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine, Dict, Hashable, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from src.goal.integrations import camunda
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class CamundaCall:
+    """Отложенный вызов Camunda: `func(*args, **kwargs)` с ключом для результата"""
+
+    key: Hashable
+    func: Callable
+    args: tuple = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class DispatchResult:
+    key: Hashable
+    result: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def get_concurrency() -> int:
+    return getattr(settings, "CAMUNDA_ASYNC_CONCURRENCY", DEFAULT_CONCURRENCY)
+
+
+class AsyncCamundaClient:
+    """Asyncio-клиент Camunda с ограничением числа одновременных запросов
+
+    Запросы выполняются синхронным клиентом процесса (пул keep-alive соединений)
+    в пуле потоков, одновременно в работе не больше `concurrency` запросов.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = max(1, concurrency or get_concurrency())
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def __aenter__(self) -> "AsyncCamundaClient":
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="camunda-async"
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._semaphore = None
+
+    @staticmethod
+    def _run(func: Callable, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Обработчики (например, запуск процесса карты) могут обращаться к БД
+            connections.close_all()
+
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self._run, func, args, kwargs
+            )
+
+    async def send_message(
+        self, business_key: str, message_name: str, variables: dict = None
+    ) -> None:
+        await self.call(camunda.send_message, business_key, message_name, variables)
+
+    async def start_process(
+        self, business_key: str, process_id: str, variables: dict = None
+    ) -> Dict:
+        return await self.call(
+            camunda.start_process, business_key, process_id, variables
+        )
+
+    async def _dispatch_one(self, call: CamundaCall) -> DispatchResult:
+        try:
+            result = await self.call(call.func, *call.args, **call.kwargs)
+            return DispatchResult(key=call.key, result=result)
+        except Exception as e:
+            logger.error(f"Ошибка вызова Camunda {call.key}: {type(e), e}")
+            return DispatchResult(key=call.key, error=e)
+
+    async def dispatch(self, calls: Iterable[CamundaCall]) -> List[DispatchResult]:
+        """Выполнить вызовы конкурентно, результат по каждому в порядке `calls`"""
+        return list(
+            await asyncio.gather(*(self._dispatch_one(call) for call in calls))
+        )
+
+
+def _run_coroutine(coroutine: Coroutine) -> Any:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Вызов из кода с уже запущенным циклом событий - выполняем в отдельном потоке
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def dispatch_calls(
+    calls: Iterable[CamundaCall], concurrency: Optional[int] = None
+) -> List[DispatchResult]:
+    """Синхронная обертка: конкурентно выполнить вызовы Camunda"""
+    calls = list(calls)
+    if not calls:
+        return []
+
+    async def _dispatch():
+        async with AsyncCamundaClient(concurrency) as client:
+            return await client.dispatch(calls)
+
+    return _run_coroutine(_dispatch())
@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from src.goal.integrations import camunda
+from src.helpers.exceptions.camunda import NoTask
+from src.helpers.exceptions.circuit_breaker import CircuitOpenError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_LONG_POLL = 20000
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_TIMEOUT = 60000
+# Скользящее среднее длительности обработчика
+DURATION_SMOOTHING = 0.2
+# Блокировка продлевается, когда до ее окончания осталось меньше этой доли
+LOCK_EXTEND_THRESHOLD = 1 / 3
+FETCH_ERROR_PAUSE = 5
+
+
+class ExternalTaskWorker:
+    """Воркер внешних задач Camunda
+
+    Забирает задачи топика с long polling (`asyncResponseTimeout`), выполняет
+    `handler(task)` в пуле потоков и завершает каждую задачу сразу после ее
+    обработчика. Блокировка долгих задач продлевается автоматически, а размер
+    пачки fetchAndLock подстраивается под измеренную скорость обработчиков:
+    берется столько задач, сколько пул успеет обработать за половину блокировки.
+
+    Обработчик возвращает переменные для завершения задачи (или None);
+    исключение обработчика передается в Camunda как failure.
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        handler: Callable[[Dict], Optional[Dict]],
+        variables: List[str] = None,
+        max_workers: Optional[int] = None,
+        lock_duration: int = camunda.DEFAULT_LOCK_DURATION,
+        long_poll: int = DEFAULT_LONG_POLL,
+        max_tasks: Optional[int] = None,
+        retries: int = DEFAULT_RETRIES,
+        retry_timeout: int = DEFAULT_RETRY_TIMEOUT,
+    ):
+        self.topic = topic
+        self.handler = handler
+        self.variables = variables
+        self.max_workers = max_workers or getattr(
+            settings, "CAMUNDA_WORKER_MAX_WORKERS", DEFAULT_MAX_WORKERS
+        )
+        self.lock_duration = lock_duration
+        self.long_poll = long_poll
+        self.max_tasks = max_tasks or settings.CAMUNDA_TASK_BATCH
+        self.retries = retries
+        self.retry_timeout = retry_timeout
+        self.worker_id = camunda.get_worker_id()
+        self.avg_duration: Optional[float] = None
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        # task_id -> время окончания блокировки (time.monotonic)
+        self._locks: Dict[str, float] = {}
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def batch_size(self, capacity: int) -> int:
+        """Размер пачки fetchAndLock по измеренной длительности обработчика"""
+        if self.avg_duration is None:
+            size = self.max_tasks
+        else:
+            lock_seconds = self.lock_duration / 1000
+            size = int(self.max_workers * lock_seconds / 2 / max(self.avg_duration, 1e-3))
+        return max(1, min(size, self.max_tasks, capacity))
+
+    def _record_duration(self, duration: float) -> None:
+        with self._lock:
+            if self.avg_duration is None:
+                self.avg_duration = duration
+            else:
+                self.avg_duration += DURATION_SMOOTHING * (duration - self.avg_duration)
+
+    def _fetch(self, max_tasks: int) -> List[Dict]:
+        try:
+            return camunda.get_task(
+                self.topic,
+                self.worker_id,
+                self.variables,
+                max_tasks=max_tasks,
+                lock_duration=self.lock_duration,
+                async_response_timeout=self.long_poll,
+            )
+        except NoTask:
+            return []
+
+    def _handle(self, task: Dict) -> None:
+        task_id = task["id"]
+        started = time.monotonic()
+        try:
+            variables = self.handler(task)
+        except Exception as e:
+            logger.error(f"Ошибка обработки задачи {self.topic} {task_id}: {type(e), e}")
+            retries = task.get("retries")
+            retries = self.retries if retries is None else retries - 1
+            try:
+                camunda.handle_failure(
+                    task_id,
+                    self.worker_id,
+                    error_message=str(e) or type(e).__name__,
+                    retries=max(retries, 0),
+                    retry_timeout=self.retry_timeout,
+                    error_details=traceback.format_exc(),
+                )
+            except Exception as e:
+                logger.error(f"Не удалось передать ошибку задачи {task_id}: {type(e), e}")
+            return
+        else:
+            self._record_duration(time.monotonic() - started)
+            try:
+                camunda.finish_task(task_id, self.worker_id, variables)
+            except Exception as e:
+                logger.error(f"Не удалось завершить задачу {task_id}: {type(e), e}")
+        finally:
+            with self._lock:
+                self._locks.pop(task_id, None)
+            connections.close_all()
+
+    def extend_locks(self) -> None:
+        """Продлить блокировки задач, которые скоро истекут"""
+        now = time.monotonic()
+        threshold = self.lock_duration / 1000 * LOCK_EXTEND_THRESHOLD
+        with self._lock:
+            expiring = [
+                task_id
+                for task_id, expires in self._locks.items()
+                if expires - now < threshold
+            ]
+        for task_id in expiring:
+            try:
+                camunda.extend_lock(task_id, self.worker_id, self.lock_duration)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить блокировку задачи {task_id}: {e}")
+                continue
+            with self._lock:
+                if task_id in self._locks:
+                    self._locks[task_id] = time.monotonic() + self.lock_duration / 1000
+
+    def _keep_locks(self) -> None:
+        interval = self.lock_duration / 1000 * LOCK_EXTEND_THRESHOLD / 2
+        # Блокировки продлеваются, пока не завершены все взятые задачи
+        while not self._finished.wait(interval):
+            self.extend_locks()
+
+    def run(self) -> None:
+        """Обрабатывать задачи топика до вызова `stop`"""
+        self._finished.clear()
+        keeper = threading.Thread(
+            target=self._keep_locks, name=f"camunda-lock-{self.topic}", daemon=True
+        )
+        keeper.start()
+        in_flight: List[Future] = []
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f"camunda-{self.topic}"
+        ) as executor:
+            while not self.stopped:
+                in_flight = [future for future in in_flight if not future.done()]
+                capacity = self.max_workers - len(in_flight)
+                if capacity <= 0:
+                    wait(in_flight, return_when=FIRST_COMPLETED)
+                    continue
+                try:
+                    tasks = self._fetch(self.batch_size(capacity))
+                except CircuitOpenError as e:
+                    logger.warning(f"Получение задач {self.topic} приостановлено: {e}")
+                    self._stop.wait(max(e.retry_after, FETCH_ERROR_PAUSE))
+                    continue
+                except Exception as e:
+                    logger.error(f"Ошибка получения задач {self.topic}: {type(e), e}")
+                    self._stop.wait(FETCH_ERROR_PAUSE)
+                    continue
+                expires = time.monotonic() + self.lock_duration / 1000
+                with self._lock:
+                    for task in tasks:
+                        self._locks[task["id"]] = expires
+                for task in tasks:
+                    in_flight.append(executor.submit(self._handle, task))
+        self._finished.set()
+        keeper.join()
+
+
+def run_worker(topic: str, handler: Callable[[Dict], Optional[Dict]], **kwargs: Any):
+    """Запустить воркер топика в текущем потоке"""
+    worker = ExternalTaskWorker(topic, handler, **kwargs)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return worker
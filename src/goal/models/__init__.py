@@ -6,5 +6,7 @@ from src.goal.models.card import (
     CardsAssessment,
     CardsStageHistory,
     CardStatusHistory,
+    EmployeeGenerationFingerprint,
 )
+from src.goal.models.outbox import CamundaOutboxMessage
 from src.goal.models.period import OrgPreference, Period, PeriodType
@@ -655,6 +655,33 @@ class CardProcedureState(models.Model):
         unique_together = ("period", "business_unit")
 
 
+class EmployeeGenerationFingerprint(models.Model):
+    """Отпечаток входных данных генерации карт сотрудника за период
+
+    Хэш значимых для генерации полей ответа HR EDW и настроек периода после
+    успешного запуска. Если отпечаток не изменился, сотрудник при следующей
+    генерации не пересчитывается.
+    """
+
+    objects = models.Manager()
+
+    perno = models.CharField("Табельный номер", max_length=30)
+    period = models.ForeignKey(
+        "goal.Period", verbose_name="Период", on_delete=models.CASCADE
+    )
+    fingerprint = models.CharField("Отпечаток входных данных", max_length=64)
+    card_ids = models.JSONField("Карты сотрудника по итогам генерации", default=list)
+    dt_updated = models.DateTimeField("Дата/Время обновления", auto_now=True)
+
+    class Meta:
+        app_label = "goal"
+
+        verbose_name = "Отпечаток генерации карт сотрудника"
+        verbose_name_plural = "Отпечатки генерации карт сотрудников"
+        db_table = "employee_generation_fingerprints"
+        unique_together = ("perno", "period")
+
+
 class EmployeeBonusType(models.Model):
     """Модель типов бонусов сотрудников"""
 
@@ -0,0 +1,62 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class CamundaOutboxMessage(models.Model):
+    """Сообщение Camunda, ожидающее отправки
+
+    Записывается в одной транзакции с изменением карты, отправляется
+    диспетчером `camunda.outbox.dispatch` с повторами. На время отправки
+    сообщение забирается диспетчером (SENDING) до `next_attempt_dttm`.
+    Запуск процесса ре-активированной карты хранится как сообщение
+    `start_process` с идентификатором карты и этапом в `variables`.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    STATUSES = (
+        (PENDING, "Ожидает отправки"),
+        (SENDING, "Отправляется"),
+        (SENT, "Отправлено"),
+        (FAILED, "Не отправлено"),
+        (CANCELLED, "Отменено"),
+    )
+    # Сообщения, которые еще будут отправлены
+    QUEUED_STATUSES = (PENDING, SENDING)
+
+    objects = models.Manager()
+
+    message_name = models.CharField("Имя сообщения", max_length=255)
+    business_key = models.CharField("Бизнес-ключ процесса", max_length=255)
+    variables = models.JSONField("Переменные процесса", null=True, blank=True)
+    # Одно и то же событие не ставится в очередь повторно, пока не отправлено
+    dedup_key = models.CharField("Ключ идемпотентности", max_length=255)
+    status = models.CharField(
+        "Статус", max_length=16, choices=STATUSES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField("Количество попыток", default=0)
+    next_attempt_dttm = models.DateTimeField(
+        "Дата/Время следующей попытки", default=timezone.now
+    )
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    dt_created = models.DateTimeField("Дата/Время создания", auto_now_add=True)
+    dt_sent = models.DateTimeField("Дата/Время отправки", null=True, blank=True)
+
+    class Meta:
+        app_label = "goal"
+
+        verbose_name = "Сообщение Camunda в очереди"
+        verbose_name_plural = "Сообщения Camunda в очереди"
+        db_table = "camunda_outbox"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=Q(status__in=["pending", "sending"]),
+                name="camunda_outbox_pending_dedup_key",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "next_attempt_dttm"])]
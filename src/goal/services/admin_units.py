@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List, Tuple
+
+from src.goal.api.versions.v1.permissions._helpers import (
+    has_goal_admin_permissions_unit_by_perno,
+)
+from src.goal.integrations.hr.hr_edw import get_orgstructure
+from src.goal.models.period import Period
+
+
+def get_subtree_units(bus_unit_id: str, period: Period) -> Tuple[str, ...]:
+    """Подразделение и все вложенные в него на интервале периода"""
+    unit_list_response = get_orgstructure(
+        url_params={
+            "unit": bus_unit_id,
+            "fields": "flat_list_subunits",
+            "interval_start": period.date_start.isoformat(),
+            "interval_end": period.date_end.isoformat(),
+        }
+    )
+    if len(unit_list_response) > 0:
+        return tuple(unit_list_response[0].get("flat_list_subunits", tuple()))
+    return (bus_unit_id,)
+
+
+class AdminUnitsResolver:
+    """Подразделения, которые администрирует сотрудник
+
+    Права проверяются по каждому подразделению не больше одного раза за время
+    жизни экземпляра. Источник ролей не отдает все подразделения сотрудника одним
+    запросом, поэтому права проверяются по подразделениям, как и раньше, и только
+    там, где они проверялись раньше: один раз при запуске генерации.
+    """
+
+    def __init__(self, user_perno: str, is_sysadmin: bool = False):
+        self.user_perno = user_perno
+        self.is_sysadmin = is_sysadmin
+        self._resolved: Dict[str, bool] = {}
+
+    def filter_units(self, units_list: Iterable[str]) -> List[str]:
+        """Подразделения из `units_list`, которые администрирует сотрудник
+
+        Порядок подразделений сохраняется.
+        """
+        units_list = list(units_list)
+        if self.is_sysadmin:
+            return units_list
+        for unit_id in dict.fromkeys(units_list):
+            if unit_id not in self._resolved:
+                self._resolved[unit_id] = bool(
+                    has_goal_admin_permissions_unit_by_perno(unit_id, self.user_perno)
+                )
+        return [unit_id for unit_id in units_list if self._resolved[unit_id]]
+
+    def administered_units(
+        self, bus_unit_id: str, period: Period, with_hierarchy: bool = True
+    ) -> Tuple[Tuple[str, ...], List[str]]:
+        """Подразделения поддерева и те из них, которые администрирует сотрудник"""
+        units_list = (
+            get_subtree_units(bus_unit_id, period) if with_hierarchy else (bus_unit_id,)
+        )
+        return units_list, self.filter_units(units_list)
@@ -0,0 +1,241 @@
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from src.goal.integrations import camunda
+from src.goal.integrations.camunda_async import CamundaCall, dispatch_calls
+from src.goal.models.card import Card
+from src.goal.models.extensions.camunda import start_process
+from src.goal.models.outbox import CamundaOutboxMessage
+from src.helpers.exceptions.circuit_breaker import CircuitOpenError
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 200
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_RETRY_BACKOFF = 30
+OUTBOX_MAX_RETRY_DELAY = 60 * 60
+# Аренда сообщений пачки на время отправки, должна перекрывать отправку всей пачки
+OUTBOX_CLAIM_TIMEOUT = 10 * 60
+
+# Сообщение уже было принято процессом (например, при повторе после сбоя воркера)
+ALREADY_CORRELATED_ERROR = "MismatchingMessageCorrelationException"
+# Запуск процесса ре-активированной карты: вместо сообщения вызывается start_process
+START_PROCESS_MESSAGE = "start_process"
+
+
+def outbox_message(
+    business_key: str, message_name: str, variables: dict = None
+) -> CamundaOutboxMessage:
+    return CamundaOutboxMessage(
+        business_key=business_key,
+        message_name=message_name,
+        variables=variables,
+        dedup_key=f"{message_name}:{business_key}",
+    )
+
+
+def enqueue_messages(messages: Iterable[CamundaOutboxMessage]) -> None:
+    """Поставить сообщения в очередь отправки
+
+    Вызывается в транзакции изменения данных: сообщение будет отправлено,
+    только если транзакция зафиксирована. Уже ожидающие отправки сообщения
+    с тем же ключом не дублируются.
+    """
+    messages = list(messages)
+    if messages:
+        CamundaOutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+
+
+def cancel_queued(dedup_key: str) -> bool:
+    """Отменить еще не отправленное сообщение с ключом `dedup_key`
+
+    Вызывается в транзакции изменения, после которого сообщение неактуально.
+    Сообщение, которое диспетчер отправляет прямо сейчас, отменить нельзя:
+    возвращается False, и изменение нужно отложить до результата отправки.
+    """
+    messages = list(
+        CamundaOutboxMessage.objects.select_for_update().filter(
+            dedup_key=dedup_key, status__in=CamundaOutboxMessage.QUEUED_STATUSES
+        )
+    )
+    now = timezone.now()
+    if any(
+        message.status == CamundaOutboxMessage.SENDING
+        and message.next_attempt_dttm > now
+        for message in messages
+    ):
+        return False
+    if messages:
+        # В том числе забранные упавшим диспетчером: иначе их заберут повторно
+        CamundaOutboxMessage.objects.filter(
+            pk__in=[message.pk for message in messages]
+        ).update(status=CamundaOutboxMessage.CANCELLED)
+    return True
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    backoff = getattr(settings, "CAMUNDA_OUTBOX_RETRY_BACKOFF", OUTBOX_RETRY_BACKOFF)
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY))
+
+
+def _start_card_process(message: CamundaOutboxMessage) -> None:
+    card = (
+        Card.objects.select_related("assessment")
+        .filter(pk=message.variables["card_id"])
+        .first()
+    )
+    if card is None or card.state != Card.ACTIVE.key:
+        # Карту снова деактивировали до запуска процесса
+        return
+    start_process(card, message.variables["stage"])
+
+
+def _send(message: CamundaOutboxMessage) -> None:
+    if message.message_name == START_PROCESS_MESSAGE:
+        _start_card_process(message)
+        return
+    camunda.send_message(
+        business_key=message.business_key,
+        message_name=message.message_name,
+        variables=message.variables,
+    )
+
+
+def _claim_batch(batch_size: int) -> List[CamundaOutboxMessage]:
+    """Забрать пачку готовых к отправке сообщений
+
+    Строки блокируются (`skip_locked`) только на время короткой транзакции,
+    в которой помечаются отправляемыми до окончания аренды. Если результат
+    отправки не записан до окончания аренды (например, процесс упал после
+    отправки), сообщения снова забирает следующий диспетчер.
+    """
+    now = timezone.now()
+    claim_timeout = getattr(
+        settings, "CAMUNDA_OUTBOX_CLAIM_TIMEOUT", OUTBOX_CLAIM_TIMEOUT
+    )
+    with transaction.atomic():
+        messages: List[CamundaOutboxMessage] = list(
+            CamundaOutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=CamundaOutboxMessage.QUEUED_STATUSES,
+                next_attempt_dttm__lte=now,
+            )
+            .order_by("next_attempt_dttm", "pk")[:batch_size]
+        )
+        for message in messages:
+            message.status = CamundaOutboxMessage.SENDING
+            message.attempts += 1
+            message.next_attempt_dttm = now + timedelta(seconds=claim_timeout)
+        CamundaOutboxMessage.objects.bulk_update(
+            messages, ["status", "attempts", "next_attempt_dttm"]
+        )
+    return messages
+
+
+def _apply_result(
+    message: CamundaOutboxMessage, result, max_attempts: int, counts: Dict[str, int]
+) -> None:
+    now = timezone.now()
+    if isinstance(result.error, CircuitOpenError):
+        # Сообщение не отправлялось - откладываем без траты попытки
+        message.status = CamundaOutboxMessage.PENDING
+        message.attempts -= 1
+        message.next_attempt_dttm = now + max(
+            timedelta(seconds=result.error.retry_after), _retry_delay(1)
+        )
+        counts["retried"] += 1
+        return
+    if result.ok or (
+        message.attempts > 1 and ALREADY_CORRELATED_ERROR in str(result.error)
+    ):
+        message.status = CamundaOutboxMessage.SENT
+        message.dt_sent = now
+        message.last_error = ""
+        counts["sent"] += 1
+        return
+    message.last_error = str(result.error)
+    if message.attempts >= max_attempts:
+        message.status = CamundaOutboxMessage.FAILED
+        counts["failed"] += 1
+        logger.error(
+            f"Сообщение {message.message_name} ({message.business_key}) "
+            f"не отправлено за {message.attempts} попыток: {result.error}"
+        )
+    else:
+        message.status = CamundaOutboxMessage.PENDING
+        message.next_attempt_dttm = now + _retry_delay(message.attempts)
+        counts["retried"] += 1
+
+
+def _record_results(
+    messages: List[CamundaOutboxMessage], results, max_attempts: int
+) -> Dict[str, int]:
+    """Записать результаты отправки короткой транзакцией
+
+    Записываются только сообщения, которые все еще забраны этим диспетчером:
+    после окончания аренды их мог забрать другой диспетчер или отменить
+    ре-активация карты.
+    """
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    claims = {message.pk: message.next_attempt_dttm for message in messages}
+    with transaction.atomic():
+        rows = (
+            CamundaOutboxMessage.objects.select_for_update()
+            .filter(pk__in=claims.keys(), status=CamundaOutboxMessage.SENDING)
+            .values_list("pk", "next_attempt_dttm")
+        )
+        still_claimed = {pk for pk, lease_until in rows if lease_until == claims[pk]}
+        recorded = []
+        for message, result in zip(messages, results):
+            if message.pk not in still_claimed:
+                continue
+            _apply_result(message, result, max_attempts, counts)
+            recorded.append(message)
+        CamundaOutboxMessage.objects.bulk_update(
+            recorded,
+            ["status", "attempts", "next_attempt_dttm", "last_error", "dt_sent"],
+        )
+    return counts
+
+
+def dispatch_batch(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Отправить одну пачку готовых к отправке сообщений
+
+    Сообщения забираются короткой транзакцией, отправляются вне транзакции,
+    результаты записываются второй короткой транзакцией: медленная Camunda
+    не держит транзакцию и блокировки строк открытыми.
+    """
+    batch_size = batch_size or getattr(
+        settings, "CAMUNDA_OUTBOX_BATCH_SIZE", OUTBOX_BATCH_SIZE
+    )
+    max_attempts = getattr(settings, "CAMUNDA_OUTBOX_MAX_ATTEMPTS", OUTBOX_MAX_ATTEMPTS)
+    if camunda.get_camunda_breaker("message").is_open:
+        # Camunda недоступна: сообщения остаются в очереди до закрытия цепи
+        return {"sent": 0, "retried": 0, "failed": 0}
+    messages = _claim_batch(batch_size)
+    if not messages:
+        return {"sent": 0, "retried": 0, "failed": 0}
+    results = dispatch_calls(
+        CamundaCall(message.pk, _send, (message,)) for message in messages
+    )
+    return _record_results(messages, results, max_attempts)
+
+
+def dispatch_pending(max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Отправлять пачки, пока есть готовые к отправке сообщения"""
+    total = {"sent": 0, "retried": 0, "failed": 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = dispatch_batch()
+        batches += 1
+        for key, value in counts.items():
+            total[key] += value
+        if not any(counts.values()):
+            break
+    return total
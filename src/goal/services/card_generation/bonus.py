@@ -1,18 +1,16 @@
-from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-from src.goal.models import Period
 from src.goal.services.card_generation.bonus_condition import BonusConditionManager
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.dataclasses import HistoricalRecord
 
 
 class BonusHandler:
-    def __init__(self, period: Period):
-        self._period = period
-        self.bonus_types = self._period.bonus_types
-
-    @staticmethod
-    def _dttm_from_str_to_date(str_dttm):
-        return datetime.strptime(str_dttm, "%Y-%m-%d %H:%M:%S").date()
+    def __init__(self, config: PeriodGenerationConfig):
+        self._config = config
+        self.bonus_types = self._config.bonus_type_keys
+        # Условия бонусов по hierarchy_txt: стратегия определяется один раз на иерархию
+        self._conditions: Dict[str, Tuple[str, BonusConditionManager]] = {}
 
     @staticmethod
     def have_intersection(dates_1, dates_2):
@@ -20,91 +18,59 @@ class BonusHandler:
             dates_2[0] <= dates_1[0] <= dates_2[1]
         )
 
-    def get_bonus_dates_type(self, bonus):
-        bonus_start_dt = self._dttm_from_str_to_date(bonus["business_from_dttm"])
-        bonus_end_dt = self._dttm_from_str_to_date(bonus["business_to_dttm"])
-        bonus_type = bonus["bonus_type"]
-        return bonus_start_dt, bonus_end_dt, bonus_type
-
-    def find_record_bonus_periods(self, bonus_records: List[Dict], hierarchy_txt: str):
-        bonus_periods = []
-        bonus_start_dt = None
-        bonus_end_dt = None
-        bonus_type = None
+    def _hierarchy_condition(
+        self, hierarchy_txt: str
+    ) -> Tuple[str, BonusConditionManager]:
+        """Подразделение записи и условия бонусов ее иерархии, одни на иерархию"""
+        condition = self._conditions.get(hierarchy_txt)
+        if condition is None:
+            hierarchy_list = hierarchy_txt.split("\\\\")
+            hierarchy_list.reverse()
+            condition = (
+                hierarchy_list[0],
+                BonusConditionManager(
+                    config=self._config, unit_hierarchy=hierarchy_list
+                ),
+            )
+            self._conditions[hierarchy_txt] = condition
+        return condition
 
-        hierarchy_list = hierarchy_txt.split("\\\\")
-        hierarchy_list.reverse()
-        business_unit = hierarchy_list[0]
+    def iter_bonus_periods(
+        self, historical_records: List[HistoricalRecord]
+    ) -> Iterator[Dict]:
+        """Периоды бонусов за один проход по записям
 
-        for bonus in bonus_records:
-            if BonusConditionManager(
-                period=self._period, unit_hierarchy=hierarchy_list, bonus_record=bonus
-            ).is_bonus_appropriate():
-                if not bonus_start_dt:  # Фиксируем дату начала действия бонусов
-                    (
-                        bonus_start_dt,
-                        bonus_end_dt,
-                        bonus_type,
-                    ) = self.get_bonus_dates_type(bonus)
+        Подходящие под условия бонусы идут в порядке записей и бонусов в них,
+        подряд идущие бонусы одного типа объединяются в период: начало берется
+        у первого бонуса, окончание и подразделение - у последнего.
+        """
+        period = None
+        for record in historical_records:
+            business_unit, condition = self._hierarchy_condition(record.hierarchy_txt)
+            for bonus in record.bonus:
+                if not condition.is_bonus_appropriate(bonus):
                     continue
-                if (
-                    bonus["bonus_type"] != bonus_type
-                ):  # Если сменился тип бонуса среди тех, кто попадает под условие, то периоды надо разделить
-                    bonus_periods.append(
-                        {
-                            "start": bonus_start_dt,
-                            "end": bonus_end_dt,
-                            "type": bonus_type,
-                            "business_unit": business_unit,
-                        }
-                    )
-                    (
-                        bonus_start_dt,
-                        bonus_end_dt,
-                        bonus_type,
-                    ) = self.get_bonus_dates_type(bonus)
+                if period is not None and period["type"] == bonus.bonus_type:
+                    period["end"] = bonus.date_to
+                    period["business_unit"] = business_unit
                     continue
-                _, bonus_end_dt, _ = self.get_bonus_dates_type(bonus)
-        # Добавить последний период
-        if bonus_start_dt and bonus_end_dt:
-            bonus_periods.append(
-                {
-                    "start": bonus_start_dt,
-                    "end": bonus_end_dt,
-                    "type": bonus_type,
+                # Сменился тип бонуса среди тех, кто попадает под условие
+                if period is not None:
+                    yield period
+                period = {
+                    "start": bonus.date_from,
+                    "end": bonus.date_to,
+                    "type": bonus.bonus_type,
                     "business_unit": business_unit,
                 }
-            )
+        # Последний период
+        if period is not None:
+            yield period
 
-        return bonus_periods
-
-    def merge_bonus_periods(self, current_bonuses, new_bonuses):
-        last_bonus = current_bonuses[-1]
-        for index, bonus in enumerate(new_bonuses):
-            if last_bonus["type"] == bonus["type"]:
-                last_bonus["end"] = bonus["end"]
-                last_bonus["business_unit"] = bonus["business_unit"]
-            else:
-                current_bonuses.append(bonus)
-                last_bonus = bonus
-        return current_bonuses
-
-    def find_bonus_periods(self, historical_records):
-        bonus_periods = []
-        for record in historical_records:
-            record_bonus_periods = self.find_record_bonus_periods(
-                record["bonus"], record["division"]["hierarchy_txt"]
-            )
-            if record_bonus_periods:
-                if not bonus_periods:
-                    bonus_periods.extend(record_bonus_periods)
-                    continue
-                bonus_periods = self.merge_bonus_periods(
-                    bonus_periods, record_bonus_periods
-                )
-        return bonus_periods
+    def find_bonus_periods(self, historical_records: List[HistoricalRecord]):
+        return list(self.iter_bonus_periods(historical_records))
 
-    def intersect_dates(self, bonus_dates, card_dates):
+    def intersect_dates(self, bonus_dates: Iterable[Dict], card_dates):
         """
         Bonus_dates - list of dicts
         [{'start': date_start,'end': date_end,'type': bonus_type, 'business_unit': business_unit},...]
@@ -129,5 +95,6 @@ class BonusHandler:
         return result_dates
 
     def apply_bonus_dates(self, historical_records, card_dates):
-        bonus_periods = self.find_bonus_periods(historical_records)
+        # Периоды пересекаются с датами карты по мере построения, за тот же проход
+        bonus_periods = self.iter_bonus_periods(historical_records)
         return self.intersect_dates(bonus_periods, card_dates)
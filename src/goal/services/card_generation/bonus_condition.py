@@ -1,7 +1,9 @@
 from dataclasses import dataclass
+from typing import Optional
 
-from src.goal.models.period import Period
-from src.goal.services.card_generation.consts import ParentUnits, PeriodTypes
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.consts import PeriodTypes
+from src.goal.services.card_generation.dataclasses import Bonus
 
 
 @dataclass
@@ -11,25 +13,34 @@ class Strategies:
 
 
 class BonusConditionManager:
-    def __init__(self, period: Period, unit_hierarchy: list, bonus_record: dict):
-        self.period = period
+    """Условия бонусов для иерархии подразделения
+
+    Стратегия определяется по иерархии один раз, после чего одним менеджером
+    можно проверить все бонусы записей с этой иерархией.
+    """
+
+    def __init__(
+        self,
+        config: PeriodGenerationConfig,
+        unit_hierarchy: list,
+        bonus_record: Optional[Bonus] = None,
+    ):
+        self.config = config
         self.bonus_record = bonus_record
         self.hierarchy = unit_hierarchy
-        self.tc5_units = (ParentUnits.TC5.value, ParentUnits.AdminTC5.value)
+        self.tc5_units = config.tc5_units
         self.current_strategy = None
         self.methods_to_check = []
 
     def bonus_greater_than(self, border_value):
-        return self.bonus_record["bonus_percent"] > border_value
+        return self.bonus_record.bonus_percent > border_value
 
     def bonus_type_in_settings(self):
-        return self.bonus_record["bonus_type"] in list(
-            self.period.bonus_types.values_list("key", flat=True).all()
-        )
+        return self.bonus_record.bonus_type in self.config.bonus_type_keys
 
     def define_current_strategy_methods(self):
         if (
-            self.period.period_type.name == PeriodTypes.year.value
+            self.config.period_type == PeriodTypes.year.value
             and self.current_strategy == Strategies.TC5
         ):
             self.methods_to_check = [
@@ -49,8 +60,11 @@ class BonusConditionManager:
         self.current_strategy = Strategies.CorpCenter
         self.define_current_strategy_methods()
 
-    def is_bonus_appropriate(self):
-        self.define_current_strategy()
+    def is_bonus_appropriate(self, bonus_record: Optional[Bonus] = None):
+        if bonus_record is not None:
+            self.bonus_record = bonus_record
+        if self.current_strategy is None:
+            self.define_current_strategy()
         for checker in self.methods_to_check:
             method, params = checker[0], checker[1]
             if not method(*params):
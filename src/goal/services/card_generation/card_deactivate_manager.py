@@ -1,20 +1,28 @@
 import logging
 from datetime import date, datetime
-from typing import Dict, List, Optional, Set, Tuple
+from typing import List, Optional, Set, Tuple
 
-from src.goal.integrations.camunda import send_message
-from src.goal.models import Card, Period
-from src.goal.services.card_generation.consts import EmployeeStatus
+from django.core.exceptions import ValidationError
+from django.db import transaction
 
+from src.goal.models import Card, CamundaOutboxMessage, CardApprovalHistory
+from src.goal.services.camunda_outbox import (
+    cancel_queued,
+    enqueue_messages,
+    outbox_message,
+)
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.existing_cards import ExistingCardIndex
+from src.goal.services.card_generation.write_buffer import (
+    CARD_VALIDATION_EXCLUDE,
+    send_cards_post_save,
+)
 
-logger = logging.getLogger(__name__)
 
+logger = logging.getLogger(__name__)
 
-def str_dttm_to_date(str_dttm: str) -> date:
-    return datetime.strptime(
-        str_dttm,
-        "%Y-%m-%dT%H:%M:%S%z",
-    ).date()
+DEACTIVATION_BATCH_SIZE = 500
+DEACTIVATION_FIELDS = ["state", "date_end"]
 
 
 class DeactivateException(Exception):
@@ -22,109 +30,208 @@ class DeactivateException(Exception):
 
 
 class BasicDeactivateManager:
+    plan = None
+
     @staticmethod
-    def deactivate_card(card: Card, state: str, date_end: datetime) -> Optional[bool]:
-        """Деактивирует карту `card`"""
-        previous_state = card.state
-        prev_date_end = card.date_end
-        card.state = state
-        card.date_end = date_end
-        card.save(update_fields=["state", "date_end"])
-        if (
+    def _needs_deactivate_message(card: Card, previous_state: str) -> bool:
+        # Постановка и оценка утверждена, в камунде процесса не должно быть,
+        # сообщение не шлём, а также если перевели карту из состояния неактивного в уволенного
+        return not (
             (
                 card.stage in (card.ON_SETTING.key, card.ON_ACTUALIZATION.key)
                 and card.status == card.APPROVED.key
             )
             or card.assessment.assessment_status == card.assessment.APPROVED
             or previous_state == card.NON_ACTIVE.key
-        ):
-            # Постановка и оценка утверждена, в камунде процесса не должно быть,
-            # сообщение не шлём, а также если перевели карту из состояния неактивного в уволенного
-            return True
-        try:
-            send_message(
-                business_key=f"cardAgreement_{card.pk}",
-                message_name=f"CardDeactivate-{card.pk}",
-            )
-            if card.status != card.APPROVED.key:
-                card.history_approval.all().delete()
+        )
+
+    @staticmethod
+    def _deactivate_message(card: Card) -> CamundaOutboxMessage:
+        return outbox_message(
+            business_key=f"cardAgreement_{card.pk}",
+            message_name=f"CardDeactivate-{card.pk}",
+        )
 
+    @classmethod
+    def cancel_deactivate_message(cls, card: Card) -> bool:
+        """Отменить неотправленное сообщение о деактивации карты
+
+        Вызывается в транзакции ре-активации: сообщение, доставленное после
+        запуска нового процесса карты, завершило бы его. False, если сообщение
+        уже отправляется.
+        """
+        return cancel_queued(cls._deactivate_message(card).dedup_key)
+
+    @staticmethod
+    def deactivate_card(
+        card: Card, state: str, date_end: datetime, check_unchanged: bool = False
+    ) -> Optional[bool]:
+        """Деактивирует карту `card`
+
+        Сообщение в Camunda ставится в очередь отправки в одной транзакции
+        с изменением карты. При `check_unchanged` карта блокируется и не
+        деактивируется (возвращается None), если в БД она уже не совпадает
+        с `card`: ее изменила параллельная генерация другого подразделения.
+        """
+        previous_state = card.state
+        prev_date_end = card.date_end
+        card.state = state
+        card.date_end = date_end
+        try:
+            with transaction.atomic():
+                if check_unchanged and (
+                    Card.objects.select_for_update()
+                    .filter(pk=card.pk)
+                    .values_list("state", "date_end")
+                    .first()
+                    != (previous_state, prev_date_end)
+                ):
+                    logger.warning(
+                        f"Карта {card.pk} изменена другим подразделением, "
+                        "деактивация пропущена"
+                    )
+                    card.state = previous_state
+                    card.date_end = prev_date_end
+                    return None
+                card.save(update_fields=["state", "date_end"])
+                if BasicDeactivateManager._needs_deactivate_message(
+                    card, previous_state
+                ):
+                    enqueue_messages([BasicDeactivateManager._deactivate_message(card)])
+                    if card.status != card.APPROVED.key:
+                        card.history_approval.all().delete()
             return True
         except Exception as e:
-            logger.error(
-                f"Ошибка при отправке сообщения деактивации карты {card.pk}: {type(e), e}"
-            )
+            logger.error(f"Ошибка деактивации карты {card.pk}: {type(e), e}")
             card.state = previous_state
             card.date_end = prev_date_end
-            card.save(update_fields=["state", "date_end"])
             return False
 
+    @classmethod
+    def deactivate_cards(
+        cls, deactivations: List[Tuple[Card, str, date]]
+    ) -> Tuple[int, int]:
+        """Деактивирует карты пачками, возвращает (деактивировано, ошибок)
+
+        Состояние карт пачки обновляется одним запросом, сообщения в Camunda
+        ставятся в очередь отправки, история согласования удаляется одним
+        запросом - все в одной транзакции на пачку.
+        """
+        deactivated, errors = 0, 0
+        for index in range(0, len(deactivations), DEACTIVATION_BATCH_SIZE):
+            batch_deactivated, batch_errors = cls._deactivate_batch(
+                deactivations[index : index + DEACTIVATION_BATCH_SIZE]
+            )
+            deactivated += batch_deactivated
+            errors += batch_errors
+        return deactivated, errors
+
+    @classmethod
+    def _deactivate_batch(
+        cls, deactivations: List[Tuple[Card, str, date]]
+    ) -> Tuple[int, int]:
+        previous = {}
+        cards = []
+        errors = 0
+        for card, state, date_end in deactivations:
+            previous[card.pk] = (card.state, card.date_end)
+            card.state = state
+            card.date_end = date_end
+            # bulk_update не вызывает Card.save(), проверки full_clean выполняем
+            # здесь, без запросов в БД - как в CardWriteBuffer
+            try:
+                card.clean_fields(exclude=CARD_VALIDATION_EXCLUDE)
+                card.clean()
+            except ValidationError as e:
+                logger.error(f"Карта {card.pk} не прошла валидацию: {e}")
+                card.state, card.date_end = previous[card.pk]
+                errors += 1
+                continue
+            cards.append(card)
+
+        try:
+            with transaction.atomic():
+                Card.objects.bulk_update(cards, DEACTIVATION_FIELDS)
+                send_cards_post_save(
+                    cards, created=False, update_fields=frozenset(DEACTIVATION_FIELDS)
+                )
+                to_notify = [
+                    card
+                    for card in cards
+                    if cls._needs_deactivate_message(card, previous[card.pk][0])
+                ]
+                enqueue_messages(cls._deactivate_message(card) for card in to_notify)
+                history_card_ids = [
+                    card.pk for card in to_notify if card.status != card.APPROVED.key
+                ]
+                if history_card_ids:
+                    CardApprovalHistory.objects.filter(
+                        card_id__in=history_card_ids
+                    ).delete()
+        except Exception as e:
+            logger.error(f"Ошибка пакетной деактивации карт: {type(e), e}")
+            # Пачка откатилась, деактивируем по одной, чтобы найти проблемную карту
+            deactivated = 0
+            for card in cards:
+                state, date_end = card.state, card.date_end
+                card.state, card.date_end = previous[card.pk]
+                if cls.deactivate_card(card, state, date_end):
+                    deactivated += 1
+                else:
+                    errors += 1
+            return deactivated, errors
+        return len(cards), errors
+
+    def _deactivate_cards(
+        self, deactivations: List[Tuple[Card, str, date]]
+    ) -> Tuple[int, int]:
+        if self.plan is not None:
+            for card, state, date_end in deactivations:
+                self._deactivate_card(card, state, date_end)
+            return len(deactivations), 0
+        return self.deactivate_cards(deactivations)
+
+    def _deactivate_card(self, card: Card, state: str, date_end) -> Optional[bool]:
+        if self.plan is not None:
+            # Режим плана: без записи в БД и сообщений в Camunda
+            self.plan.add_deactivate(card, state, date_end)
+            card.state = state
+            card.date_end = date_end
+            return True
+        return self.deactivate_card(card, state, date_end)
+
 
 class EmployeeCardDeactivateManager(BasicDeactivateManager):
-    def __init__(self, period: Period):
-        self.period = period
+    def __init__(
+        self,
+        config: PeriodGenerationConfig,
+        existing_cards: ExistingCardIndex,
+        plan=None,
+        check_unchanged: bool = False,
+    ):
+        self.config = config
+        # Карты сотрудников подразделения загружены индексом вместе с оценками,
+        # проверки по сотруднику идут из памяти
+        self.existing_cards = existing_cards
+        self.plan = plan
+        # Подразделения генерируются параллельно: сотрудник может числиться
+        # в нескольких, и деактивируемая карта перепроверяется в БД
+        self.check_unchanged = check_unchanged
         self.deactivated_cards_counter = 0
         self.deactivation_errors_counter = 0
 
-    def find_employee_quit_data(
-        self, historical_records: List[Optional[Dict]]
-    ) -> List[Tuple[date, str]]:
-        results = []
-        for index, record in enumerate(historical_records):
-            if (
-                record["position"]["employee_status"] == EmployeeStatus.fired.value
-                and str_dttm_to_date(record["business_from_dttm"])
-                <= self.period.cards_bonus_payout_date
-            ):
-                current_record = record
-                current_record_start = str_dttm_to_date(record["business_from_dttm"])
-
-                if len(historical_records) > index + 1:
-                    # Если сотрудник увольнялся и возвращался,
-                    # то после записи об увольнении надеемся найти запись о переустройстве
-                    tmp_index = index + 1
-                    while tmp_index < len(historical_records):
-                        if (
-                            historical_records[tmp_index]["position"]["employee_status"]
-                            == EmployeeStatus.active.value
-                        ):
-                            # Записей в состоянии "Уволен" может быть несколько подряд,
-                            # нам нужна только следующая активная запись
-                            next_record_start = str_dttm_to_date(
-                                historical_records[tmp_index]["business_from_dttm"]
-                            )
-                            # Проверяем даты переустройства
-                            if (next_record_start - current_record_start).days > 14:
-                                # Если переустройство произошло позднее 14-ти дневного периода,
-                                # то считаем, что сотрудник уволился
-                                results.append(
-                                    (
-                                        min(
-                                            self.period.date_end,
-                                            date.fromisoformat(
-                                                current_record["fire_dt"]
-                                            ),
-                                        ),
-                                        Card.NON_ACTIVE_Q.key,
-                                    )
-                                )
-                            break
-
-                        tmp_index += 1
-                else:
-                    results.append(
-                        (
-                            min(
-                                self.period.date_end,
-                                date.fromisoformat(current_record["fire_dt"]),
-                            ),
-                            Card.NON_ACTIVE_Q.key,
-                        )
-                    )
-        # На выходе получаем список из кортежей, (ДАТА, Состояние) карты.
-        # Предполагается итерироваться по списку карт, и если дата окончания карты меньше даты из текущего списка,
-        # то присвоить ей состояние из кортежа, в противном случае перейти к следующему кортежу
-        return results
+    def _deactivate_card(self, card: Card, state: str, date_end) -> Optional[bool]:
+        if self.plan is None:
+            return self.deactivate_card(
+                card, state, date_end, check_unchanged=self.check_unchanged
+            )
+        return super()._deactivate_card(card, state, date_end)
+
+    def _count_deactivation(self, deactivation: Optional[bool]) -> None:
+        if deactivation:
+            self.deactivated_cards_counter += 1
+        elif deactivation is not None:
+            self.deactivation_errors_counter += 1
 
     def check_cards_for_deactivation(
         self,
@@ -132,41 +239,38 @@ class EmployeeCardDeactivateManager(BasicDeactivateManager):
         employee_quit_data: Optional[List[Tuple]],
         exclude_card_ids: Optional[Set] = None,
     ):
-        employee_cards = (
-            Card.objects.filter(  # Possible transition: Non-Active -> Non-Active-Q
-                period=self.period,
-                perno=employee_perno,
-            ).exclude(state__in=(Card.CLOSED.key, Card.NON_ACTIVE_Q.key))
-        )
-        if exclude_card_ids:
-            employee_cards = employee_cards.exclude(pk__in=list(exclude_card_ids))
+        exclude_card_ids = exclude_card_ids or set()
+        employee_cards = [
+            card
+            for card in self.existing_cards.cards_for_perno(employee_perno)
+            # Несохраненные карты создаются текущей генерацией
+            if card.pk is not None
+            and card.pk not in exclude_card_ids
+            # Possible transition: Non-Active -> Non-Active-Q
+            and card.state not in (Card.CLOSED.key, Card.NON_ACTIVE_Q.key)
+        ]
 
         for card in employee_cards:
             if employee_quit_data:
                 # Если данные по увольнениям есть, то состояние карты может варьироваться
                 for data in employee_quit_data:
                     if card.date_start < data[0]:
-                        deactivation = self.deactivate_card(
-                            card, data[1], min(card.date_end, data[0])
+                        self._count_deactivation(
+                            self._deactivate_card(
+                                card, data[1], min(card.date_end, data[0])
+                            )
                         )
-                        if deactivation:
-                            self.deactivated_cards_counter += 1
-                        else:
-                            self.deactivation_errors_counter += 1
                         break
             else:
-                deactivation = self.deactivate_card(
-                    card, Card.NON_ACTIVE.key, card.date_end
+                self._count_deactivation(
+                    self._deactivate_card(card, Card.NON_ACTIVE.key, card.date_end)
                 )
-                if deactivation:
-                    self.deactivated_cards_counter += 1
-                else:
-                    self.deactivation_errors_counter += 1
 
 
 class UnitCardDeactivateManager(BasicDeactivateManager):
-    def __init__(self, period: Period):
-        self.period = period
+    def __init__(self, config: PeriodGenerationConfig, plan=None):
+        self.config = config
+        self.plan = plan
         self.deactivated_cards_counter = 0
         self.deactivation_errors_counter = 0
 
@@ -178,18 +282,22 @@ class UnitCardDeactivateManager(BasicDeactivateManager):
             result.extend(list_value)
         return result
 
-    def check_cards_for_deactivation(self, card_ids: List[Set], business_unit: str):
-        not_related_unit_cards = (
-            Card.actual.filter(period=self.period, business_unit=business_unit)
+    def check_cards_for_deactivation(self, card_ids: List[int], business_unit: str):
+        # Карты подразделения выбираются одним запросом, а карты генерации
+        # отсеиваются в памяти, без передачи списка id в запрос
+        card_ids = set(card_ids)
+        not_related_unit_cards = [
+            card
+            for card in Card.actual.filter(
+                period_id=self.config.period_id, business_unit=business_unit
+            )
             .exclude(state=Card.CLOSED.key)
-            .exclude(pk__in=list(card_ids))
-        )
+            .select_related("assessment")
+            if card.pk not in card_ids
+        ]
 
-        for card in not_related_unit_cards:
-            deactivation = self.deactivate_card(
-                card, Card.NON_ACTIVE.key, card.date_end
-            )
-            if deactivation:
-                self.deactivated_cards_counter += 1
-            else:
-                self.deactivation_errors_counter += 1
+        deactivated, errors = self._deactivate_cards(
+            [(card, Card.NON_ACTIVE.key, card.date_end) for card in not_related_unit_cards]
+        )
+        self.deactivated_cards_counter += deactivated
+        self.deactivation_errors_counter += errors
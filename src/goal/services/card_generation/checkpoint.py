@@ -0,0 +1,135 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TTL = 60 * 60 * 24
+# memcached не хранит значения больше 1 МБ и не сообщает об ошибке записи
+CHECKPOINT_MAX_CACHE_SIZE = 1000 * 1000
+
+
+@dataclass
+class GenerationCheckpoint:
+    """Прогресс генерации карт подразделения
+
+    Сохраняется вместе с каждой записью буфера карт. Повтор генерации
+    подразделения продолжает с `processed` сотрудника с накопленными счетчиками,
+    а не начинает заново.
+
+    Карты сотрудников хранятся частями под отдельными ключами: при сохранении
+    `employee_cards` содержит только сотрудников, у которых с прошлой точки
+    появились карты, и записывается частью номер `cards_segments - 1`;
+    при загрузке части собираются обратно.
+    """
+
+    processed: int = 0
+    last_perno: Optional[str] = None
+    results: Dict[str, int] = field(default_factory=dict)
+    employee_cards: Dict[str, List[int]] = field(default_factory=dict)
+    cards_segments: int = 0
+    failed_pernos: List[str] = field(default_factory=list)
+    deactivated: int = 0
+    deactivation_errors: int = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "processed": self.processed,
+            "last_perno": self.last_perno,
+            "results": self.results,
+            "cards_segments": self.cards_segments,
+            "failed_pernos": self.failed_pernos,
+            "deactivated": self.deactivated,
+            "deactivation_errors": self.deactivation_errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GenerationCheckpoint":
+        return cls(
+            processed=data["processed"],
+            last_perno=data["last_perno"],
+            results=dict(data["results"]),
+            cards_segments=data["cards_segments"],
+            failed_pernos=list(data["failed_pernos"]),
+            deactivated=data["deactivated"],
+            deactivation_errors=data["deactivation_errors"],
+        )
+
+
+def _checkpoint_cache_key(task_id, business_unit: str, period_id: int) -> str:
+    return f"cards_generation_checkpoint:{task_id}:{business_unit}:{period_id}"
+
+
+def _cards_cache_key(checkpoint_key: str, segment: int) -> str:
+    return f"{checkpoint_key}:cards:{segment}"
+
+
+def _set(key: str, value: Dict, timeout: int) -> bool:
+    size = len(json.dumps(value))
+    max_size = getattr(
+        settings,
+        "CARDS_GENERATION_CHECKPOINT_MAX_CACHE_SIZE",
+        CHECKPOINT_MAX_CACHE_SIZE,
+    )
+    if size > max_size:
+        logger.warning(
+            f"Контрольная точка {key} ({size} байт) больше лимита кэша и не сохранена"
+        )
+        return False
+    cache.set(key, value, timeout=timeout)
+    return True
+
+
+def save_checkpoint(
+    task_id, business_unit: str, period_id: int, checkpoint: GenerationCheckpoint
+) -> None:
+    key = _checkpoint_cache_key(task_id, business_unit, period_id)
+    timeout = getattr(settings, "CARDS_GENERATION_CHECKPOINT_TTL", CHECKPOINT_TTL)
+    if checkpoint.employee_cards and not _set(
+        _cards_cache_key(key, checkpoint.cards_segments - 1),
+        checkpoint.employee_cards,
+        timeout,
+    ):
+        # Без карт части сотрудников деактивация подразделения после повтора
+        # затронула бы их карты: повтор начнется заново
+        delete_checkpoint(task_id, business_unit, period_id)
+        return
+    _set(key, checkpoint.to_dict(), timeout)
+
+
+def load_checkpoint(
+    task_id, business_unit: str, period_id: int
+) -> Optional[GenerationCheckpoint]:
+    key = _checkpoint_cache_key(task_id, business_unit, period_id)
+    data = cache.get(key)
+    if data is None:
+        return None
+    checkpoint = GenerationCheckpoint.from_dict(data)
+    cards_keys = [
+        _cards_cache_key(key, segment) for segment in range(checkpoint.cards_segments)
+    ]
+    segments = cache.get_many(cards_keys)
+    if len(segments) != len(cards_keys):
+        logger.warning(
+            f"Контрольная точка {key} неполная: нет карт части сотрудников, "
+            "генерация начнется заново"
+        )
+        return None
+    for cards_key in cards_keys:
+        for per_no, card_ids in segments[cards_key].items():
+            checkpoint.employee_cards.setdefault(per_no, []).extend(card_ids)
+    return checkpoint
+
+
+def delete_checkpoint(task_id, business_unit: str, period_id: int) -> None:
+    key = _checkpoint_cache_key(task_id, business_unit, period_id)
+    data = cache.get(key)
+    segments = data["cards_segments"] if data else 0
+    cache.delete_many(
+        [key, *(_cards_cache_key(key, segment) for segment in range(segments))]
+    )
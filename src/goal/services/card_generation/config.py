@@ -0,0 +1,73 @@
+import hashlib
+from dataclasses import dataclass, field
+from datetime import date
+from types import MappingProxyType
+from typing import FrozenSet, Mapping
+
+from src.goal.models.card import EmployeeBonusType
+from src.goal.models.period import Period
+from src.goal.services.card_generation.consts import ParentUnits
+
+
+@dataclass(frozen=True)
+class PeriodGenerationConfig:
+    """Снимок настроек периода для генерации карт
+
+    Собирается один раз на запуск, дальше сервисы генерации не обращаются к БД
+    за настройками периода.
+    """
+
+    period_id: int
+    period_type: str
+    date_start: date
+    date_end: date
+    cards_generation_end_date: date
+    cards_bonus_payout_date: date
+    bonus_type_keys: FrozenSet[str]
+    tc5_units: FrozenSet[str]
+    bonus_types_by_key: Mapping[str, EmployeeBonusType] = field(
+        compare=False, hash=False, repr=False
+    )
+
+    @classmethod
+    def from_period(cls, period: Period) -> "PeriodGenerationConfig":
+        bonus_types = {
+            bonus_type.key: bonus_type for bonus_type in period.bonus_types.all()
+        }
+        return cls(
+            period_id=period.id,
+            period_type=period.period_type.name,
+            date_start=period.date_start,
+            date_end=period.date_end,
+            cards_generation_end_date=period.cards_generation_end_date,
+            cards_bonus_payout_date=period.cards_bonus_payout_date,
+            bonus_type_keys=frozenset(bonus_types),
+            tc5_units=frozenset(
+                (ParentUnits.TC5.value, ParentUnits.AdminTC5.value)
+            ),
+            bonus_types_by_key=MappingProxyType(bonus_types),
+        )
+
+    def get_bonus_type(self, key: str) -> EmployeeBonusType:
+        try:
+            return self.bonus_types_by_key[key]
+        except KeyError:
+            raise EmployeeBonusType.DoesNotExist(
+                f"Тип бонуса {key} не настроен для периода {self.period_id}"
+            )
+
+    def fingerprint(self) -> str:
+        """Стабильный между процессами хэш настроек, влияющих на генерацию"""
+        payload = repr(
+            (
+                self.period_id,
+                self.period_type,
+                self.date_start.isoformat(),
+                self.date_end.isoformat(),
+                self.cards_generation_end_date.isoformat(),
+                self.cards_bonus_payout_date.isoformat(),
+                sorted(self.bonus_type_keys),
+                sorted(self.tc5_units),
+            )
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
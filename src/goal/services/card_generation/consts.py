@@ -39,3 +39,10 @@ class CardActivity(Enum):
     updated = "updated"
     created = "created"
     errors = "errors"
+
+
+class CardPlanAction(Enum):
+    create = "create"
+    update = "update"
+    reactivate = "reactivate"
+    deactivate = "deactivate"
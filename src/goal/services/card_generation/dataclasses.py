@@ -1,54 +1,131 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import List
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 
-from .helpers import nested_dataclass
+from src.helpers.dates import parse_date, parse_optional_date
 
 
-@dataclass
-class Position:
+class _Slotted:
+    """Компактная запись: только нужные генерации поля, без __dict__"""
 
-    name: str
-    description: str
-    band_code: str
-    band_name: str
-    position_code: str
-    position_name: str
-    employment_rate: int
-    employee_group: int
-    employee_group_desc: str
-    staff_position_id: str
+    __slots__ = ()
 
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
 
-@dataclass
-class Division:
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
 
-    name: str
-    unit: str
-    organizational_unit_desc: str
-    parent: str
-    level: str
-    hierarchy_txt: str
 
+class Bonus(_Slotted):
+    __slots__ = ("bonus_type", "bonus_percent", "date_from", "date_to")
 
-@dataclass
-class PositionLog:
-    dismissal: bool
-    created_at: datetime
-    start_vacation: bool
-    end_vacation: bool
-    start_decree: bool
-    end_decree: bool
+    def __init__(self, bonus_type: str, bonus_percent, date_from: date, date_to: date):
+        self.bonus_type = bonus_type
+        self.bonus_percent = bonus_percent
+        self.date_from = date_from
+        self.date_to = date_to
 
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Bonus":
+        return cls(
+            bonus_type=data["bonus_type"],
+            bonus_percent=data["bonus_percent"],
+            date_from=parse_date(data["business_from_dttm"]),
+            date_to=parse_date(data["business_to_dttm"]),
+        )
 
-@nested_dataclass
-class Employee:
 
-    per_no: str
-    fullname: str
-    bonus: List[dict]
-    division: Division
-    position: Position
-    historical_records: List[dict]
-    hired_at: str
+class HistoricalRecord(_Slotted):
+    """Запись истории сотрудника из HR EDW с разобранными датами
 
+    Должность и подразделение записи развернуты в ее поля.
+    """
+
+    __slots__ = (
+        "per_no",
+        "date_from",
+        "date_to",
+        "hire_dt",
+        "fire_dt",
+        "change_reason_type",
+        "employee_group",
+        "employee_status",
+        "employment_rate",
+        "staff_position_id",
+        "unit",
+        "hierarchy_txt",
+        "bonus",
+    )
+
+    def __init__(
+        self,
+        per_no: str,
+        date_from: date,
+        date_to: date,
+        hire_dt: Optional[date],
+        fire_dt: Optional[date],
+        change_reason_type: Optional[str],
+        employee_group: str,
+        employee_status: str,
+        employment_rate,
+        staff_position_id: str,
+        unit: str,
+        hierarchy_txt: str,
+        bonus: Tuple[Bonus, ...],
+    ):
+        self.per_no = per_no
+        self.date_from = date_from
+        self.date_to = date_to
+        self.hire_dt = hire_dt
+        self.fire_dt = fire_dt
+        self.change_reason_type = change_reason_type
+        self.employee_group = employee_group
+        self.employee_status = employee_status
+        self.employment_rate = employment_rate
+        self.staff_position_id = staff_position_id
+        self.unit = unit
+        self.hierarchy_txt = hierarchy_txt
+        self.bonus = bonus
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HistoricalRecord":
+        position = data["position"]
+        division = data["division"]
+        return cls(
+            per_no=data["per_no"],
+            date_from=parse_date(data["business_from_dttm"]),
+            date_to=parse_date(data["business_to_dttm"]),
+            hire_dt=parse_optional_date(data.get("hire_dt")),
+            fire_dt=parse_optional_date(data.get("fire_dt")),
+            change_reason_type=data.get("change_reason_type"),
+            employee_group=position["employee_group"],
+            employee_status=position["employee_status"],
+            employment_rate=position.get("employment_rate"),
+            staff_position_id=position.get("staff_position_id"),
+            unit=division["unit"],
+            hierarchy_txt=division.get("hierarchy_txt"),
+            bonus=tuple(Bonus.from_dict(bonus) for bonus in data.get("bonus") or ()),
+        )
+
+
+class Employee(_Slotted):
+    """Сотрудник из ответа HR EDW, разобранный для генерации карт"""
+
+    __slots__ = ("per_no", "historical_records")
+
+    def __init__(self, per_no: str, historical_records: List[HistoricalRecord]):
+        self.per_no = per_no
+        self.historical_records = historical_records
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Employee":
+        return cls(
+            per_no=data["per_no"],
+            historical_records=[
+                HistoricalRecord.from_dict(record)
+                for record in data["historical_records"]
+            ],
+        )
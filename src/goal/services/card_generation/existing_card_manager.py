@@ -1,16 +1,54 @@
 import logging
 
-from src.goal.models.card import Card, CardsStageHistory, EmployeeBonusType
-from src.goal.models.extensions.camunda import start_process
+from django.db import transaction
+
+from src.goal.integrations.camunda import get_camunda_breaker
+from src.goal.models.card import Card, CardsStageHistory
+from src.goal.models.outbox import CamundaOutboxMessage
+from src.goal.services.camunda_outbox import (
+    START_PROCESS_MESSAGE,
+    enqueue_messages,
+    outbox_message,
+)
+from src.goal.services.card_generation.card_deactivate_manager import (
+    BasicDeactivateManager,
+)
+from src.goal.services.card_generation.config import PeriodGenerationConfig
 from src.goal.services.card_generation.consts import CardActivity
 
 
 logger = logging.getLogger(__name__)
 
+START_PROCESS_ENDPOINT = "start_process"
+
 
 class ExistingCardManager:
-    def __init__(self, card):
+    def __init__(
+        self,
+        card,
+        config: PeriodGenerationConfig,
+        write_buffer=None,
+        plan=None,
+    ):
         self.card = card
+        self.config = config
+        self.write_buffer = write_buffer
+        # В режиме плана ре-активация только записывается в план
+        self.plan = plan
+
+    @staticmethod
+    def _start_process_message(card: Card, stage: str) -> CamundaOutboxMessage:
+        return outbox_message(
+            business_key=f"cardAgreement_{card.pk}",
+            message_name=START_PROCESS_MESSAGE,
+            variables={"card_id": card.pk, "stage": stage},
+        )
+
+    def _save_fields(self, update_fields, activity):
+        if self.write_buffer is None:
+            self.card.save(update_fields=update_fields)
+            return
+        self.write_buffer.update(self.card, update_fields, activity)
 
     def reactivate_card(self) -> bool:
         last_stage = (
@@ -22,43 +60,55 @@ class ExistingCardManager:
             logger.warning("Attempt to reactivate weird card")
             return False
 
-        if last_stage.end_dt is None:
+        if self.plan is not None:
+            self.plan.add_reactivate(self.card)
             self.card.state = Card.ACTIVE.key
-            if last_stage.stage in (self.card.ON_SETTING, self.card.ON_ACTUALIZATION):
-                prev_status = self.card.status
-                self.card.status = self.card.IS_PROCESSED.key
-            if last_stage.stage == self.card.ON_ASSESSMENT:
-                prev_assessment_status = self.card.assessment.assessment_status
-                self.card.assessment.assessment_status = (
-                    self.card.assessment.IS_PROCESSED
+            return True
+
+        if last_stage.end_dt is None:
+            if get_camunda_breaker(START_PROCESS_ENDPOINT).is_open:
+                # Процесс не запустится, карту ре-активирует следующая генерация
+                logger.warning(
+                    f"Карта {self.card.pk} не ре-активирована: Camunda недоступна"
                 )
-            self.card.save(update_fields=["state", "status"])
-            try:
-                start_process(self.card, last_stage.stage)
-                return True
-            except Exception as e:
-                self.card.state = Card.NON_ACTIVE.key
+                return False
+            # Запуск процесса ставится в очередь в одной транзакции с ре-активацией:
+            # после сбоя воркера карта не останется активной без процесса
+            with transaction.atomic():
+                if not BasicDeactivateManager.cancel_deactivate_message(self.card):
+                    # Процесс запустим следующей генерацией, когда деактивация дойдет
+                    logger.warning(
+                        f"Карта {self.card.pk} не ре-активирована: "
+                        "сообщение о деактивации еще отправляется"
+                    )
+                    return False
+                self.card.state = Card.ACTIVE.key
                 if last_stage.stage in (
                     self.card.ON_SETTING,
                     self.card.ON_ACTUALIZATION,
                 ):
-                    self.card.status = prev_status
+                    self.card.status = self.card.IS_PROCESSED.key
                 if last_stage.stage == self.card.ON_ASSESSMENT:
-                    self.card.assessment.assessment_status = prev_assessment_status
+                    self.card.assessment.assessment_status = (
+                        self.card.assessment.IS_PROCESSED
+                    )
                 self.card.save(update_fields=["state", "status"])
-                logger.error(
-                    f"Не удалось ре-активировать карту {self.card.pk}. Reason: {e}"
+                enqueue_messages(
+                    [self._start_process_message(self.card, last_stage.stage)]
                 )
+            return True
         else:
-            self.card.state = Card.ACTIVE.key
-            self.card.save(update_fields=["state"])
+            with transaction.atomic():
+                BasicDeactivateManager.cancel_deactivate_message(self.card)
+                self.card.state = Card.ACTIVE.key
+                self.card.save(update_fields=["state"])
             # Stage завершен, необходимо восстановить лишь состояние карты
             # без восстановления процесса в камунде
             return True
 
     def handle_existing_card(self, dates):
         date_end = dates["end"]
-        bonus_type = EmployeeBonusType.objects.get(key=dates["type"])
+        bonus_type = self.config.get_bonus_type(dates["type"])
 
         if self.card.state in (
             Card.NON_ACTIVE.key,
@@ -69,8 +119,9 @@ class ExistingCardManager:
                 self.card.date_end = date_end
                 self.card.bonus_type = bonus_type
                 self.card.business_unit = dates["business_unit"]
-                self.card.save(
-                    update_fields=["date_end", "bonus_type", "business_unit"]
+                self._save_fields(
+                    ["date_end", "bonus_type", "business_unit"],
+                    CardActivity.reactivated.value,
                 )
                 return CardActivity.reactivated.value
         if (
@@ -83,9 +134,14 @@ class ExistingCardManager:
 
         if self.card.state != Card.CLOSED.key:
             # Карта не закрыта, можем обновить ее
+            if self.plan is not None:
+                self.plan.remember_card(self.card)
             self.card.date_end = date_end
             self.card.bonus_type = bonus_type
             self.card.business_unit = dates["business_unit"]
-            self.card.save(update_fields=["date_end", "bonus_type", "business_unit"])
+            self._save_fields(
+                ["date_end", "bonus_type", "business_unit"],
+                CardActivity.updated.value,
+            )
 
             return CardActivity.updated.value
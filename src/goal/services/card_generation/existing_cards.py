@@ -0,0 +1,107 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db.models import Q
+
+from src.goal.models.card import Card
+from src.goal.models.period import Period
+
+
+PERNO_CHUNK_SIZE = 1000
+
+
+class ExistingCardIndex:
+    """Индекс существующих карт периода в памяти
+
+    Карты загружаются один раз на подразделение (и сотрудников, которых
+    обрабатываем), дальше поиск идет по ключу (perno, date_start) без запросов в БД.
+    Табельный номер в ключах всегда строка, в методы его можно передать и числом.
+    Экземпляры карт в индексе те же, что меняет генерация, поэтому обновления и
+    ре-активации видны сразу, а созданные карты нужно зарегистрировать через `add`.
+    """
+
+    def __init__(self, period: Period):
+        self.period = period
+        self._cards: Dict[Tuple[str, date], Card] = {}
+        self._perno_cards: Dict[str, List[Card]] = defaultdict(list)
+        self._loaded_pernos: Set[str] = set()
+        self._loaded_pks: Set[int] = set()
+
+    def _queryset(self):
+        # Оценка нужна проверкам деактивации карт
+        return Card.objects.filter(period_id=self.period.id).select_related("assessment")
+
+    def _register(self, card: Card) -> None:
+        if card.pk is not None:
+            if card.pk in self._loaded_pks:
+                return
+            self._loaded_pks.add(card.pk)
+            # Period is already loaded, validation of the card must not query it again
+            card.period = self.period
+        self._perno_cards[str(card.perno)].append(card)
+        self._register_key(card)
+
+    def _register_key(self, card: Card) -> None:
+        key = (str(card.perno), card.date_start)
+        if key not in self._cards or self._precedes(card, self._cards[key]):
+            self._cards[key] = card
+
+    @staticmethod
+    def _precedes(card: Card, other: Card) -> bool:
+        # Same order as Card.Meta.ordering, so the index returns what `.first()` did
+        if (card.date_end, card.date_start) != (other.date_end, other.date_start):
+            return (card.date_end, card.date_start) < (other.date_end, other.date_start)
+        return bool(
+            card.dt_created and other.dt_created and card.dt_created < other.dt_created
+        )
+
+    def preload(self, business_unit: Optional[str], pernos: Iterable[str]) -> None:
+        """Загрузить карты подразделения и карты сотрудников `pernos`"""
+        pernos = {str(perno) for perno in pernos} - self._loaded_pernos
+        if business_unit is not None:
+            for card in self._queryset().filter(business_unit=business_unit):
+                self._register(card)
+        pernos = sorted(pernos)
+        for index in range(0, len(pernos), PERNO_CHUNK_SIZE):
+            chunk = pernos[index : index + PERNO_CHUNK_SIZE]
+            query = Q(perno__in=chunk)
+            if business_unit is not None:
+                query &= ~Q(business_unit=business_unit)
+            for card in self._queryset().filter(query):
+                self._register(card)
+        self._loaded_pernos.update(pernos)
+
+    def _ensure_loaded(self, perno: str) -> None:
+        if perno not in self._loaded_pernos:
+            # Сотрудник не был загружен заранее (например, генерация по одному сотруднику)
+            self.preload(None, (perno,))
+
+    def get(self, perno: str, date_start: date) -> Optional[Card]:
+        perno = str(perno)
+        self._ensure_loaded(perno)
+        return self._cards.get((perno, date_start))
+
+    def add(self, card: Card) -> None:
+        """Зарегистрировать карту, созданную в текущем запуске"""
+        self._ensure_loaded(str(card.perno))
+        self._register(card)
+
+    def discard(self, card: Card) -> None:
+        """Убрать карту, которую не удалось записать"""
+        perno = str(card.perno)
+        self._perno_cards[perno] = [
+            it for it in self._perno_cards[perno] if it is not card
+        ]
+        key = (perno, card.date_start)
+        if self._cards.get(key) is card:
+            del self._cards[key]
+            for it in self._perno_cards[perno]:
+                if it.date_start == card.date_start:
+                    self._register_key(it)
+
+    def cards_for_perno(self, perno: str) -> List[Card]:
+        """Все карты сотрудника в периоде, включая созданные в текущем запуске"""
+        perno = str(perno)
+        self._ensure_loaded(perno)
+        return list(self._perno_cards[perno])
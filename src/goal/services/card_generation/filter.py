@@ -1,11 +1,41 @@
 import abc
-from datetime import date, datetime
-from functools import lru_cache
+from bisect import bisect_left, bisect_right
+from datetime import date
 from typing import Dict, List
 
-from src.goal.models.period import Period
-
+from .config import PeriodGenerationConfig
 from .consts import OrganizationMethod
+from .dataclasses import HistoricalRecord
+
+
+class RecordsIntervalIndex:
+    """Индекс записей сотрудника по интервалам действия
+
+    Строится один раз на отрезок записей и отвечает, какие записи пересекаются
+    с интервалом карты, двоичным поиском вместо полного перебора.
+    """
+
+    def __init__(self, records: List[HistoricalRecord]):
+        self.records = records
+        self._sorted = sorted(records, key=lambda record: record.date_from)
+        self._starts = [record.date_from for record in self._sorted]
+        # Максимум окончаний по префиксу не убывает и подходит для bisect,
+        # даже если интервалы записей вложены друг в друга
+        self._max_ends = []
+        max_end = None
+        for record in self._sorted:
+            if max_end is None or record.date_to > max_end:
+                max_end = record.date_to
+            self._max_ends.append(max_end)
+
+    def overlapping(self, date_start: date, date_end: date) -> List[HistoricalRecord]:
+        lo = bisect_left(self._max_ends, date_start)
+        hi = bisect_right(self._starts, date_end)
+        return [
+            record
+            for record in self._sorted[lo:hi]
+            if record.date_to >= date_start
+        ]
 
 
 class FilterEmployee:
@@ -13,83 +43,73 @@ class FilterEmployee:
     We need to check out if employee is suitable for card generation with hise historical records slice
     """
 
-    def __init__(self, dates: Dict, employee_records: List[Dict], period):
+    def __init__(
+        self,
+        employee_records: List[HistoricalRecord],
+        config: PeriodGenerationConfig,
+    ):
         """
-        dates - {"start": Date start, "end": Date end}
-
         employee_records - List of employee historical records
         """
-        self.dates = dates
-        self.employee_records = employee_records
-        self.period = period
+        self.records_index = RecordsIntervalIndex(employee_records)
+        self.config = config
 
-    def is_suited(self) -> bool:
+    def is_suited(self, dates: Dict) -> bool:
+        """
+        dates - {"start": Date start, "end": Date end}
+        """
         if self.suitable_by_position_status(
-            self.employee_records, self.period, self.dates
-        ) and self.suitable_by_position(self.employee_records, self.period, self.dates):
+            self.records_index, self.config, dates
+        ) and self.suitable_by_position(self.records_index, self.config, dates):
             return True
         return False
 
     @staticmethod
-    def suitable_by_position(employee, period, dates):
-        return PositionFilter(employee, period, dates).is_suitable_employee()
+    def suitable_by_position(records_index, config, dates):
+        return PositionFilter(records_index, config, dates).is_suitable_employee()
 
     @staticmethod
-    def suitable_by_position_status(employee, period, dates):
-        return PositionStatusFilter(employee, period, dates).is_suitable_employee()
+    def suitable_by_position_status(records_index, config, dates):
+        return PositionStatusFilter(records_index, config, dates).is_suitable_employee()
 
 
 class SuitableFilter(abc.ABC):
 
-    def __init__(self, employee: List[Dict], period: Period, dates: Dict):
-        self.employee = employee
-        self.period = period
+    def __init__(
+        self,
+        records_index: RecordsIntervalIndex,
+        config: PeriodGenerationConfig,
+        dates: Dict,
+    ):
+        self.records_index = records_index
+        self.employee = records_index.records
+        self.config = config
         self.dates = dates
 
     @abc.abstractmethod
     def is_suitable_employee(self) -> bool:
         pass
 
-    @staticmethod
-    def _dttm_from_str_to_date(str_dttm):
-        return datetime.strptime(str_dttm, "%Y-%m-%dT%H:%M:%S%z").date()
-
-    @staticmethod
-    def have_intersection(dates_1, dates_2):
-        return (dates_1[0] <= dates_2[0] <= dates_1[1]) or (
-            dates_2[0] <= dates_1[0] <= dates_2[1]
-        )
-
-    @lru_cache()
-    def find_appropriate_records(self):
-        result = []
-        card_dates = (self.dates["start"], self.dates["end"])
-        for record in self.employee:
-            record_dates = (
-                self._dttm_from_str_to_date(record["business_from_dttm"]),
-                self._dttm_from_str_to_date(record["business_to_dttm"]),
-            )
-            if self.have_intersection(record_dates, card_dates):
-                result.append(record)
-        return result
+    def find_appropriate_records(self) -> List[HistoricalRecord]:
+        return self.records_index.overlapping(self.dates["start"], self.dates["end"])
 
 
 class PositionFilter(SuitableFilter):
     def is_suitable_employee(self) -> bool:
-        return self._rate() and self._method()
+        records = self.find_appropriate_records()
+        return self._rate(records) and self._method(records)
 
-    def _rate(self) -> bool:
-        for record in self.find_appropriate_records():
-            if (
-                record["position"]["employment_rate"]
-                and record["position"]["employment_rate"] > 0
-            ):
+    @staticmethod
+    def _rate(records: List[HistoricalRecord]) -> bool:
+        for record in records:
+            if record.employment_rate and record.employment_rate > 0:
                 return True
         return False
 
-    def _method(self) -> bool:
-        for record in self.find_appropriate_records():
-            if record["position"]["employee_group"] in (
+    @staticmethod
+    def _method(records: List[HistoricalRecord]) -> bool:
+        for record in records:
+            if record.employee_group in (
                 OrganizationMethod.hourly.value,
                 OrganizationMethod.salary.value,
             ):
@@ -103,7 +123,4 @@ class PositionStatusFilter(SuitableFilter):
 
     def _hired_at(self) -> bool:
         # All hire_dt in self.employee are the same, so take the first one as definition mark
-        return (
-            date.fromisoformat(self.employee[0]["hire_dt"])
-            <= self.period.cards_generation_end_date
-        )
+        return self.employee[0].hire_dt <= self.config.cards_generation_end_date
@@ -0,0 +1,148 @@
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.utils import timezone
+
+from src.goal.models.card import Card, EmployeeGenerationFingerprint
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.dataclasses import Employee
+
+
+# Увеличить при изменении логики генерации, чтобы сбросить сохраненные отпечатки
+FINGERPRINT_VERSION = 2
+FINGERPRINT_CHUNK_SIZE = 1000
+
+# Поля записи истории, от которых зависит результат генерации
+RECORD_FIELDS = (
+    "per_no",
+    "date_from",
+    "date_to",
+    "hire_dt",
+    "fire_dt",
+    "change_reason_type",
+    "employee_group",
+    "employee_status",
+    "employment_rate",
+    "staff_position_id",
+    "unit",
+    "hierarchy_txt",
+)
+BONUS_FIELDS = ("bonus_type", "bonus_percent", "date_from", "date_to")
+
+# Состояния карт, которые повторная генерация не трогает
+SETTLED_STATES = (Card.CLOSED.key, Card.NON_ACTIVE.key, Card.NON_ACTIVE_Q.key)
+DEACTIVATED_STATES = (Card.NON_ACTIVE.key, Card.NON_ACTIVE_Q.key)
+
+
+def _pick(obj, fields) -> List:
+    return [getattr(obj, name) for name in fields]
+
+
+def employee_fingerprint(employee: Employee, config_fingerprint: str) -> str:
+    """Отпечаток входных данных сотрудника
+
+    Считается до того, как генерация изменит `historical_records`.
+    """
+    records = [
+        [
+            _pick(record, RECORD_FIELDS),
+            [_pick(bonus, BONUS_FIELDS) for bonus in record.bonus],
+        ]
+        for record in employee.historical_records
+    ]
+    payload = json.dumps(
+        [FINGERPRINT_VERSION, config_fingerprint, employee.per_no, records],
+        default=str,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class EmployeeFingerprintStore:
+    """Отпечатки сотрудников периода для инкрементальной генерации
+
+    Отпечатки загружаются окнами вместе с картами сотрудников, новые
+    запоминаются только для сотрудников, обработанных без ошибок, и
+    записываются пачкой после записи карт окна.
+    """
+
+    def __init__(self, config: PeriodGenerationConfig):
+        self.config = config
+        self.config_fingerprint = config.fingerprint()
+        self._stored: Dict[str, EmployeeGenerationFingerprint] = {}
+        self._loaded_pernos: Set[str] = set()
+        self._pending: Dict[str, str] = {}
+
+    def compute(self, employee: Employee) -> str:
+        return employee_fingerprint(employee, self.config_fingerprint)
+
+    def preload(self, pernos: Iterable[str]) -> None:
+        pernos = sorted({str(perno) for perno in pernos} - self._loaded_pernos)
+        for index in range(0, len(pernos), FINGERPRINT_CHUNK_SIZE):
+            chunk = pernos[index : index + FINGERPRINT_CHUNK_SIZE]
+            for stored in EmployeeGenerationFingerprint.objects.filter(
+                period_id=self.config.period_id, perno__in=chunk
+            ):
+                self._stored[stored.perno] = stored
+        self._loaded_pernos.update(pernos)
+
+    def unchanged_card_ids(
+        self, perno: str, fingerprint: str, cards: List[Card]
+    ) -> Optional[Set[int]]:
+        """Карты сотрудника, если его можно пропустить, иначе None
+
+        Кроме отпечатка проверяется, что карты в БД остались такими, какими их
+        оставила прошлая генерация: карты прошлого запуска на месте и не
+        деактивированы, а остальные карты сотрудника закрыты или неактивны.
+        """
+        self.preload((perno,))
+        stored = self._stored.get(perno)
+        if stored is None or stored.fingerprint != fingerprint:
+            return None
+        card_ids = set(stored.card_ids)
+        cards_by_id = {card.pk: card for card in cards if card.pk is not None}
+        if not card_ids <= cards_by_id.keys():
+            return None
+        for card_id, card in cards_by_id.items():
+            if card_id in card_ids:
+                if card.state in DEACTIVATED_STATES:
+                    return None
+            elif card.state not in SETTLED_STATES:
+                return None
+        return card_ids
+
+    def remember(self, perno: str, fingerprint: str) -> None:
+        self._pending[perno] = fingerprint
+
+    def save(self, employee_cards: Dict[str, Set], failed_pernos: Set[str]) -> None:
+        """Записать отпечатки сотрудников, карты которых записаны без ошибок"""
+        to_create, to_update = [], []
+        for perno, fingerprint in self._pending.items():
+            if perno in failed_pernos:
+                continue
+            card_ids = sorted(card_id for card_id in employee_cards[perno] if card_id)
+            stored = self._stored.get(perno)
+            if stored is None:
+                stored = EmployeeGenerationFingerprint(
+                    perno=perno, period_id=self.config.period_id
+                )
+                to_create.append(stored)
+            else:
+                to_update.append(stored)
+            stored.fingerprint = fingerprint
+            stored.card_ids = card_ids
+            stored.dt_updated = timezone.now()
+            self._stored[perno] = stored
+        self._pending = {}
+        if to_create:
+            # Сотрудник мог быть записан параллельной генерацией другого подразделения
+            EmployeeGenerationFingerprint.objects.bulk_create(
+                to_create, batch_size=FINGERPRINT_CHUNK_SIZE, ignore_conflicts=True
+            )
+        if to_update:
+            EmployeeGenerationFingerprint.objects.bulk_update(
+                to_update,
+                ["fingerprint", "card_ids", "dt_updated"],
+                batch_size=FINGERPRINT_CHUNK_SIZE,
+            )
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from src.helpers.json_stream import iter_json_array
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = 60 * 60 * 24
+# memcached не хранит значения больше 1 МБ: снимок крупнее пишется в файл
+# в CARDS_GENERATION_SNAPSHOT_DIR (общее хранилище воркеров), а в кэш - путь к нему
+SNAPSHOT_MAX_CACHE_SIZE = 1000 * 1000
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+# gzip-формат: снимок, выгруженный в файл, читается обычными утилитами
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class EmployeesSnapshot:
+    """Сжатый снимок ответа HR EDW по сотрудникам подразделения
+
+    Ответ сжимается по мере чтения, в памяти хранится только сжатый JSON-массив.
+    Итерация распаковывает снимок заново, поэтому один снимок можно пройти
+    несколько раз (повторы генерации), получая каждый раз новые объекты.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    def from_employees(cls, employees: Iterable[Dict]) -> "EmployeesSnapshot":
+        compressor = zlib.compressobj(wbits=GZIP_WBITS)
+        chunks = [compressor.compress(b"[")]
+        for index, employee in enumerate(employees):
+            if index:
+                chunks.append(compressor.compress(b","))
+            chunks.append(
+                compressor.compress(
+                    json.dumps(employee, separators=(",", ":")).encode()
+                )
+            )
+        chunks.append(compressor.compress(b"]"))
+        chunks.append(compressor.flush())
+        return cls(b"".join(chunks))
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+        for start in range(0, len(self.data), SNAPSHOT_CHUNK_SIZE):
+            yield decompressor.decompress(self.data[start : start + SNAPSHOT_CHUNK_SIZE])
+        yield decompressor.flush()
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter_json_array(self._iter_chunks())
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def dump(self, path: str) -> None:
+        """Сохранить снимок в файл (.json.gz) для нагрузочных и регрессионных тестов"""
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+    @classmethod
+    def from_file(cls, path: str) -> "EmployeesSnapshot":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+
+def _snapshot_cache_key(task_id, business_unit: str, period_id: int, bonus_type_keys):
+    bonus_types = ",".join(sorted(bonus_type_keys))
+    return f"hr_employees_snapshot:{task_id}:{business_unit}:{period_id}:{bonus_types}"
+
+
+def save_snapshot(
+    task_id,
+    business_unit: str,
+    period_id: int,
+    bonus_type_keys: Iterable[str],
+    snapshot: EmployeesSnapshot,
+) -> None:
+    key = _snapshot_cache_key(task_id, business_unit, period_id, bonus_type_keys)
+    timeout = getattr(settings, "CARDS_GENERATION_SNAPSHOT_TTL", SNAPSHOT_TTL)
+    max_size = getattr(
+        settings, "CARDS_GENERATION_SNAPSHOT_MAX_CACHE_SIZE", SNAPSHOT_MAX_CACHE_SIZE
+    )
+    if snapshot.size <= max_size:
+        cache.set(key, snapshot.data, timeout=timeout)
+        return
+
+    directory = getattr(settings, "CARDS_GENERATION_SNAPSHOT_DIR", None)
+    if not directory:
+        logger.warning(
+            f"Снимок сотрудников подразделения {business_unit} ({snapshot.size} байт) "
+            "больше лимита кэша и не сохранен, повтор запросит HR EDW заново"
+        )
+        return
+    path = os.path.join(
+        directory, f"{hashlib.sha1(key.encode()).hexdigest()}.json.gz"
+    )
+    snapshot.dump(path)
+    cache.set(key, {"path": path}, timeout=timeout)
+
+
+def load_snapshot(
+    task_id, business_unit: str, period_id: int, bonus_type_keys: Iterable[str]
+) -> Optional[EmployeesSnapshot]:
+    data = cache.get(
+        _snapshot_cache_key(task_id, business_unit, period_id, bonus_type_keys)
+    )
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        try:
+            return EmployeesSnapshot.from_file(data["path"])
+        except OSError as e:
+            logger.warning(f"Снимок сотрудников {data['path']} не прочитан: {e}")
+            return None
+    return EmployeesSnapshot(data)
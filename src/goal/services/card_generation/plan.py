@@ -0,0 +1,332 @@
+import logging
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from src.goal.models.card import Card
+from src.goal.models.period import Period
+from src.goal.services.card_generation.card_deactivate_manager import (
+    BasicDeactivateManager,
+)
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.consts import CardActivity, CardPlanAction
+from src.goal.services.card_generation.existing_card_manager import ExistingCardManager
+from src.goal.services.card_generation.existing_cards import ExistingCardIndex
+from src.goal.services.card_generation.write_buffer import CardWriteBuffer, FlushResult
+
+
+logger = logging.getLogger(__name__)
+
+PLAN_TTL = 60 * 60 * 24
+# План применяется одной задачей: блокировка снимается по завершении или по таймауту
+PLAN_APPLY_LOCK_TTL = 60 * 60
+# Действия, пропущенные при применении: карта изменилась после расчета плана
+PLAN_CONFLICTS = "conflicts"
+
+
+def _card_version(card: Card) -> Dict:
+    return {
+        "state": card.state,
+        "date_end": card.date_end.isoformat(),
+        "bonus_type_id": card.bonus_type_id,
+        "business_unit": card.business_unit,
+    }
+
+
+@dataclass
+class GenerationPlan:
+    """План генерации карт подразделения
+
+    Список действий (создание, изменение, ре-активация, деактивация), вычисленный
+    без записи в БД и без вызовов Camunda. Хранит только то, что нужно для
+    применения, поэтому применяется без повторного расчета. Для изменяемых карт
+    хранится их версия на момент расчета: карты, измененные после него, при
+    применении пропускаются.
+    """
+
+    task_id: str
+    period_id: int
+    business_unit: str
+    actions: List[Dict] = field(default_factory=list)
+    card_versions: Dict[int, Dict] = field(default_factory=dict)
+
+    def remember_card(self, card: Card) -> None:
+        """Запомнить версию карты до ее изменения планом"""
+        if card.pk not in self.card_versions:
+            self.card_versions[card.pk] = _card_version(card)
+
+    def add_create(self, card: Card) -> None:
+        self.actions.append(
+            {
+                "action": CardPlanAction.create.value,
+                "perno": card.perno,
+                "business_unit": card.business_unit,
+                "bonus_type": card.bonus_type.key,
+                "date_start": card.date_start.isoformat(),
+                "date_end": card.date_end.isoformat(),
+            }
+        )
+
+    def add_update(self, card: Card, update_fields: List[str]) -> None:
+        values = {}
+        for field_name in update_fields:
+            value = getattr(card, field_name)
+            if field_name == "bonus_type":
+                value = value.key
+            elif isinstance(value, date):
+                value = value.isoformat()
+            values[field_name] = value
+        self.actions.append(
+            {
+                "action": CardPlanAction.update.value,
+                "card_id": card.pk,
+                "fields": values,
+            }
+        )
+
+    def add_reactivate(self, card: Card) -> None:
+        self.remember_card(card)
+        self.actions.append(
+            {"action": CardPlanAction.reactivate.value, "card_id": card.pk}
+        )
+
+    def add_deactivate(self, card: Card, state: str, date_end: date) -> None:
+        self.remember_card(card)
+        self.actions.append(
+            {
+                "action": CardPlanAction.deactivate.value,
+                "card_id": card.pk,
+                "state": state,
+                "date_end": date_end.isoformat(),
+            }
+        )
+
+    def summary(self) -> Dict[str, int]:
+        counter = Counter(action["action"] for action in self.actions)
+        return {action.value: counter[action.value] for action in CardPlanAction}
+
+    def to_dict(self) -> Dict:
+        return {
+            "task_id": self.task_id,
+            "period_id": self.period_id,
+            "business_unit": self.business_unit,
+            "actions": self.actions,
+            "card_versions": self.card_versions,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GenerationPlan":
+        return cls(
+            task_id=data["task_id"],
+            period_id=data["period_id"],
+            business_unit=data["business_unit"],
+            actions=list(data["actions"]),
+            card_versions={
+                int(card_id): version
+                for card_id, version in data.get("card_versions", {}).items()
+            },
+        )
+
+
+class GenerationPlanRecorder:
+    """Замена CardWriteBuffer в режиме плана: записи попадают в план, а не в БД"""
+
+    def __init__(self, plan: GenerationPlan):
+        self.plan = plan
+        self._created: List[Card] = []
+
+    def __len__(self):
+        return len(self._created)
+
+    @property
+    def is_full(self) -> bool:
+        return False
+
+    def create(self, card: Card) -> None:
+        self.plan.add_create(card)
+        self._created.append(card)
+
+    def update(self, card: Card, update_fields: List[str], activity: str) -> None:
+        self.plan.add_update(card, update_fields)
+
+    def flush(self) -> FlushResult:
+        result = FlushResult(created=self._created)
+        self._created = []
+        return result
+
+
+class PlanOwnerMismatch(Exception):
+    pass
+
+
+@dataclass
+class PlanOwner:
+    """Кто и для чего рассчитал план: применить его можно только с теми же параметрами"""
+
+    perno: str
+    period_id: int
+    business_unit: str
+
+    def __post_init__(self):
+        # Параметры приходят и из URL (строками), и из задач
+        self.perno = str(self.perno)
+        self.period_id = int(self.period_id)
+        self.business_unit = str(self.business_unit)
+
+
+def _plan_cache_key(task_id) -> str:
+    return f"cards_generation_plan:{task_id}"
+
+
+def _plan_lock_key(task_id) -> str:
+    return f"cards_generation_plan_apply:{task_id}"
+
+
+def save_plans(task_id, plans: List[GenerationPlan], owner: PlanOwner) -> None:
+    cache.set(
+        _plan_cache_key(task_id),
+        {"owner": asdict(owner), "plans": [plan.to_dict() for plan in plans]},
+        timeout=getattr(settings, "CARDS_GENERATION_PLAN_TTL", PLAN_TTL),
+    )
+
+
+def load_plans(task_id, owner: PlanOwner) -> Optional[List[GenerationPlan]]:
+    """Планы задачи `task_id` или None, если план не найден или устарел
+
+    PlanOwnerMismatch, если план рассчитан другим пользователем, для другого
+    периода или подразделения.
+    """
+    data = cache.get(_plan_cache_key(task_id))
+    if data is None:
+        return None
+    if PlanOwner(**data["owner"]) != owner:
+        raise PlanOwnerMismatch(
+            f"План генерации {task_id} рассчитан для другого пользователя, "
+            "периода или подразделения"
+        )
+    return [GenerationPlan.from_dict(plan) for plan in data["plans"]]
+
+
+def delete_plans(task_id) -> None:
+    cache.delete(_plan_cache_key(task_id))
+
+
+def lock_plans(task_id) -> bool:
+    """Занять план для применения, False - план уже применяется"""
+    return cache.add(_plan_lock_key(task_id), 1, timeout=PLAN_APPLY_LOCK_TTL)
+
+
+def unlock_plans(task_id) -> None:
+    cache.delete(_plan_lock_key(task_id))
+
+
+def apply_plan(plan: GenerationPlan, config: PeriodGenerationConfig) -> Dict[str, int]:
+    """Применить ранее рассчитанный план генерации
+
+    Действия над картами, которые изменились после расчета плана, и создания
+    карт, которые уже появились, пропускаются и считаются в `conflicts`.
+    """
+    period = Period.objects.get(id=plan.period_id)
+    results = {activity.value: 0 for activity in CardActivity}
+    results["deactivated"] = 0
+    results[PLAN_CONFLICTS] = 0
+    write_buffer = CardWriteBuffer()
+    cards = Card.objects.select_related("assessment").in_bulk(
+        {action["card_id"] for action in plan.actions if "card_id" in action}
+    )
+    conflicts = set()
+    for card_id, version in plan.card_versions.items():
+        if card_id in cards and _card_version(cards[card_id]) != version:
+            logger.warning(
+                f"Карта {card_id} изменилась после расчета плана {plan.task_id}, "
+                "действия плана по ней пропущены"
+            )
+            conflicts.add(card_id)
+    existing_cards = ExistingCardIndex(period)
+    existing_cards.preload(
+        None,
+        {
+            action["perno"]
+            for action in plan.actions
+            if action["action"] == CardPlanAction.create.value
+        },
+    )
+    reactivated = set()
+
+    for action in plan.actions:
+        try:
+            if action["action"] == CardPlanAction.create.value:
+                date_start = date.fromisoformat(action["date_start"])
+                if existing_cards.get(action["perno"], date_start) is not None:
+                    logger.warning(
+                        f"Карта {action['perno']} с {date_start} уже создана, "
+                        f"создание из плана {plan.task_id} пропущено"
+                    )
+                    results[PLAN_CONFLICTS] += 1
+                    continue
+                write_buffer.create(
+                    Card(
+                        perno=action["perno"],
+                        business_unit=action["business_unit"],
+                        bonus_type=config.get_bonus_type(action["bonus_type"]),
+                        period=period,
+                        date_start=date_start,
+                        date_end=date.fromisoformat(action["date_end"]),
+                        generation_task_id=plan.task_id,
+                    )
+                )
+                continue
+
+            card = cards.get(action["card_id"])
+            if card is None:
+                logger.warning(f"Карта {action['card_id']} из плана не найдена")
+                results[CardActivity.errors.value] += 1
+                continue
+            if card.pk in conflicts:
+                results[PLAN_CONFLICTS] += 1
+                continue
+            card.period = period
+
+            if action["action"] == CardPlanAction.reactivate.value:
+                if ExistingCardManager(card, config).reactivate_card():
+                    reactivated.add(card.pk)
+                else:
+                    results[CardActivity.errors.value] += 1
+            elif action["action"] == CardPlanAction.update.value:
+                update_fields = []
+                for field_name, value in action["fields"].items():
+                    if field_name == "bonus_type":
+                        value = config.get_bonus_type(value)
+                    elif field_name in ("date_start", "date_end"):
+                        value = date.fromisoformat(value)
+                    setattr(card, field_name, value)
+                    update_fields.append(field_name)
+                activity = (
+                    CardActivity.reactivated.value
+                    if card.pk in reactivated
+                    else CardActivity.updated.value
+                )
+                results[activity] += 1
+                write_buffer.update(card, update_fields, activity)
+            elif action["action"] == CardPlanAction.deactivate.value:
+                if BasicDeactivateManager.deactivate_card(
+                    card, action["state"], date.fromisoformat(action["date_end"])
+                ):
+                    results["deactivated"] += 1
+                else:
+                    results[CardActivity.errors.value] += 1
+        except Exception as e:
+            logger.error(f"Ошибка применения плана генерации {action}: {type(e), e}")
+            results[CardActivity.errors.value] += 1
+
+    flush_result = write_buffer.flush()
+    results[CardActivity.created.value] += len(flush_result.created)
+    results[CardActivity.errors.value] += len(flush_result.failed_creates)
+    for activity in flush_result.failed_updates:
+        results[activity] -= 1
+        results[CardActivity.errors.value] += 1
+    return results
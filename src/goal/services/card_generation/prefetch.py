@@ -0,0 +1,71 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH_DEPTH = 1
+
+
+class UnitEmployeesPrefetcher:
+    """Фоновая подгрузка сотрудников следующих подразделений
+
+    Пока обрабатывается текущее подразделение, в пуле потоков уже запрошены
+    сотрудники следующих `depth` подразделений. В памяти одновременно не больше
+    `depth + 1` ответов HR EDW.
+    Если подгрузка упала, для подразделения отдается None, и сотрудников нужно
+    запросить заново в основном потоке.
+    """
+
+    def __init__(
+        self,
+        units_list: Iterable[str],
+        fetch: Callable[[str], List[Dict]],
+        depth: int = DEFAULT_PREFETCH_DEPTH,
+    ):
+        self.units_list = units_list
+        self.fetch = fetch
+        self.depth = depth
+
+    def _fetch(self, unit_id: str) -> List[Dict]:
+        try:
+            return self.fetch(unit_id)
+        finally:
+            # Соединения с БД у потока свои, не оставляем их открытыми
+            connections.close_all()
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[List[Dict]]]]:
+        units = iter(self.units_list)
+        if self.depth <= 0:
+            for unit_id in units:
+                yield unit_id, None
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=self.depth, thread_name_prefix="hr-prefetch"
+        ) as executor:
+            pending = deque()
+            for unit_id in units:
+                pending.append((unit_id, executor.submit(self._fetch, unit_id)))
+                if len(pending) >= self.depth:
+                    break
+            while pending:
+                unit_id, future = pending.popleft()
+                try:
+                    employees = future.result()
+                except Exception as e:
+                    logger.warning(
+                        f"Не удалось заранее получить сотрудников подразделения {unit_id}: "
+                        f"{type(e), e}"
+                    )
+                    employees = None
+                next_unit_id = next(units, None)
+                if next_unit_id is not None:
+                    pending.append(
+                        (next_unit_id, executor.submit(self._fetch, next_unit_id))
+                    )
+                yield unit_id, employees
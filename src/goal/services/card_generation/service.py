@@ -1,10 +1,10 @@
 import logging
 from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict, List
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Tuple
 from uuid import UUID
 
-from django.apps import apps
+from django.conf import settings
 
 from src.goal.models.card import Card
 from src.goal.models.period import Period
@@ -13,244 +13,344 @@ from src.goal.services.card_generation.card_deactivate_manager import (
     EmployeeCardDeactivateManager,
     UnitCardDeactivateManager,
 )
-from src.goal.services.card_generation.consts import (
-    CardActivity,
-    ChangeReasonType,
-    EmployeeStatus,
-    OrganizationMethod,
+from src.goal.services.card_generation.checkpoint import (
+    GenerationCheckpoint,
+    delete_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
 )
-from src.goal.services.card_generation.existing_card_manager import ExistingCardManager
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.consts import CardActivity
+from src.goal.services.card_generation.dataclasses import Employee, HistoricalRecord
+from src.goal.services.card_generation.existing_card_manager import (
+    ExistingCardManager,
+)
+from src.goal.services.card_generation.existing_cards import ExistingCardIndex
 from src.goal.services.card_generation.filter import FilterEmployee
+from src.goal.services.card_generation.fingerprint import EmployeeFingerprintStore
+from src.goal.services.card_generation.plan import (
+    GenerationPlan,
+    GenerationPlanRecorder,
+)
+from src.goal.services.card_generation.timeline import EmployeeTimeline
+from src.goal.services.card_generation.write_buffer import CardWriteBuffer
 
 
 logger = logging.getLogger(__name__)
 
+EMPLOYEES_WINDOW_SIZE = 500
+
 
 class CardGenerationService:
     """Сервис для генерации карт в разрезе периода"""
 
-    def __init__(self, period: Period, task_id: UUID):
+    def __init__(
+        self,
+        period: Period,
+        task_id: UUID,
+        dry_run: bool = False,
+        incremental: bool = None,
+        resumable: bool = True,
+        parallel_units: bool = False,
+    ):
         self.period = period
         self.task_id = task_id
-        self.bonus_handler = BonusHandler(self.period)
-        self.employee_deactivate_manager = EmployeeCardDeactivateManager(self.period)
-        self.unit_deactivate_manager = UnitCardDeactivateManager(self.period)
+        self.config = PeriodGenerationConfig.from_period(self.period)
+        # В режиме плана (dry_run) действия записываются в план без записи в БД и Camunda
+        self.plan = (
+            GenerationPlan(task_id=str(task_id), period_id=period.id, business_unit="")
+            if dry_run
+            else None
+        )
+        self.bonus_handler = BonusHandler(self.config)
+        self.unit_deactivate_manager = UnitCardDeactivateManager(
+            self.config, plan=self.plan
+        )
         self.results = {s.value: 0 for s in CardActivity}
         self.employee_cards = defaultdict(set)
+        # Сколько карт сотрудников уже в контрольной точке и из скольких частей
+        self._checkpoint_card_counts: Dict[str, int] = {}
+        self._checkpoint_cards_segments = 0
         self.employee_fired = {}
+        self.existing_cards = ExistingCardIndex(self.period)
+        # При параллельной генерации подразделений деактивируемые карты
+        # перепроверяются в БД: сотрудник может числиться в нескольких
+        self.employee_deactivate_manager = EmployeeCardDeactivateManager(
+            self.config,
+            self.existing_cards,
+            plan=self.plan,
+            check_unchanged=parallel_units,
+        )
+        self.write_buffer = (
+            GenerationPlanRecorder(self.plan) if dry_run else CardWriteBuffer()
+        )
+        if incremental is None:
+            # Выключено, пока таблица отпечатков не создана миграцией на окружении
+            incremental = getattr(settings, "CARDS_GENERATION_INCREMENTAL", False)
+        # Сотрудники, входные данные которых не изменились с прошлой генерации, пропускаются
+        self.fingerprints = EmployeeFingerprintStore(self.config) if incremental else None
+        self.failed_pernos = set()
+        # План пересчитывается целиком, контрольные точки нужны только при записи в БД
+        self.resumable = resumable and not dry_run
 
-    @staticmethod
-    def _dttm_from_str_to_date(str_dttm):
-        return datetime.strptime(str_dttm, "%Y-%m-%dT%H:%M:%S%z").date()
-
-    def _recalculate_hire_dt(self, historical_records: List[Dict]):
-        # need to pass through all record actual hire_dt if employee turned back/re-hired in 2 weeks
-        prev_record = None
-        for record in historical_records:
-            if (
-                record["position"]["employee_group"]
-                in (
-                    OrganizationMethod.hourly.value,
-                    OrganizationMethod.salary.value,
-                )
-                and record["position"]["employee_status"] == EmployeeStatus.active.value
-            ):
-                if (
-                    prev_record
-                    and (
-                        self._dttm_from_str_to_date(record["business_from_dttm"])
-                        - self._dttm_from_str_to_date(prev_record["business_to_dttm"])
-                    ).days
-                    < 14
-                ):
-                    record["hire_dt"] = prev_record["hire_dt"]
-                prev_record = record
-
-    def _intent_to_create_card(self, records: List[Dict]) -> None:
-        Card = apps.get_model("goal.Card")
-        EmployeeBonusType = apps.get_model("goal.EmployeeBonusType")
-        card_start_dt = max(
-            self.period.date_start,
-            self._dttm_from_str_to_date(records[0]["business_from_dttm"]),
+    def generate_cards_for_employees(
+        self, business_unit: str, employees: Iterable[Dict]
+    ) -> None:
+        """Генерация карт для потока сотрудников подразделения
+
+        Сотрудники читаются окнами по EMPLOYEES_WINDOW_SIZE: карты окна загружаются
+        одним запросом, а в памяти одновременно находится не больше одного окна.
+        Буфер записывается только между сотрудниками (в конце окна или когда он
+        заполнен), и вместе с каждой записью сохраняется контрольная точка:
+        повтор после сбоя продолжает с первого незаписанного сотрудника и не
+        теряет счетчики уже записанных карт.
+        """
+        if self.plan is not None:
+            self.plan.business_unit = business_unit
+        employees, processed = self._resume(business_unit, employees)
+        preload_unit = business_unit
+        while True:
+            # Сотрудники разбираются сразу при чтении, исходные ответы HR EDW не хранятся
+            window = [
+                Employee.from_dict(employee)
+                for employee in islice(employees, EMPLOYEES_WINDOW_SIZE)
+            ]
+            if not window:
+                break
+            self.existing_cards.preload(
+                preload_unit, (employee.per_no for employee in window)
+            )
+            if self.fingerprints is not None:
+                self.fingerprints.preload(employee.per_no for employee in window)
+            preload_unit = None
+            for position, employee in enumerate(window, start=1):
+                self.generate_cards_for_employee(employee)
+                if self.write_buffer.is_full or position == len(window):
+                    self.flush_writes()
+                    self.save_fingerprints()
+                    self.save_checkpoint(
+                        business_unit, processed + position, employee.per_no
+                    )
+            processed += len(window)
+
+    def _resume(
+        self, business_unit: str, employees: Iterable[Dict]
+    ) -> Tuple[Iterator[Dict], int]:
+        """Продолжить с контрольной точки прошлой попытки, если она есть
+
+        Возвращает оставшихся сотрудников и число уже обработанных.
+        """
+        employees = iter(employees)
+        if not self.resumable:
+            return employees, 0
+        checkpoint = load_checkpoint(self.task_id, business_unit, self.period.id)
+        if checkpoint is None or not checkpoint.processed:
+            return employees, 0
+
+        skipped = list(islice(employees, checkpoint.processed))
+        if (
+            len(skipped) != checkpoint.processed
+            or skipped[-1]["per_no"] != checkpoint.last_perno
+        ):
+            # Состав сотрудников изменился, начинаем подразделение заново
+            logger.warning(
+                f"Контрольная точка генерации подразделения {business_unit} "
+                "не соответствует сотрудникам, генерация начата заново"
+            )
+            delete_checkpoint(self.task_id, business_unit, self.period.id)
+            return chain(skipped, employees), 0
+
+        self.results.update(checkpoint.results)
+        for per_no, card_ids in checkpoint.employee_cards.items():
+            self.employee_cards[per_no].update(card_ids)
+            self._checkpoint_card_counts[per_no] = len(self.employee_cards[per_no])
+        self._checkpoint_cards_segments = checkpoint.cards_segments
+        self.failed_pernos.update(checkpoint.failed_pernos)
+        self.employee_deactivate_manager.deactivated_cards_counter = (
+            checkpoint.deactivated
+        )
+        self.employee_deactivate_manager.deactivation_errors_counter = (
+            checkpoint.deactivation_errors
         )
-        card_end_dt = min(
-            self.period.date_end,
-            self._dttm_from_str_to_date(records[-1]["business_to_dttm"]),
+        logger.info(
+            f"Генерация подразделения {business_unit} продолжена "
+            f"с {checkpoint.processed} сотрудника"
         )
+        return employees, checkpoint.processed
+
+    def save_checkpoint(self, business_unit: str, processed: int, last_perno: str):
+        """Сохранить контрольную точку
+
+        Сохраняются только карты сотрудников, у которых с прошлой точки
+        появились новые карты.
+        """
+        if not self.resumable:
+            return
+        new_cards = {
+            per_no: sorted(card_ids)
+            for per_no, card_ids in self.employee_cards.items()
+            if len(card_ids) != self._checkpoint_card_counts.get(per_no)
+        }
+        if new_cards:
+            self._checkpoint_cards_segments += 1
+        save_checkpoint(
+            self.task_id,
+            business_unit,
+            self.period.id,
+            GenerationCheckpoint(
+                processed=processed,
+                last_perno=last_perno,
+                results=dict(self.results),
+                employee_cards=new_cards,
+                cards_segments=self._checkpoint_cards_segments,
+                failed_pernos=sorted(self.failed_pernos),
+                deactivated=self.employee_deactivate_manager.deactivated_cards_counter,
+                deactivation_errors=(
+                    self.employee_deactivate_manager.deactivation_errors_counter
+                ),
+            ),
+        )
+        self._checkpoint_card_counts.update(
+            (per_no, len(card_ids)) for per_no, card_ids in new_cards.items()
+        )
+
+    def delete_checkpoint(self, business_unit: str) -> None:
+        if self.resumable:
+            delete_checkpoint(self.task_id, business_unit, self.period.id)
+
+    def flush_writes(self) -> None:
+        """Записать накопленные в буфере создания и изменения карт"""
+        result = self.write_buffer.flush()
+        for card in result.created:
+            self.results[CardActivity.created.value] += 1
+            if card.id:
+                self.employee_cards[card.perno].add(card.id)
+        for card in result.failed_creates:
+            self.existing_cards.discard(card)
+            self.results[CardActivity.errors.value] += 1
+        for activity in result.failed_updates:
+            self.results[activity] -= 1
+            self.results[CardActivity.errors.value] += 1
+        self.failed_pernos.update(result.failed_pernos)
+
+    def save_fingerprints(self) -> None:
+        """Запомнить отпечатки сотрудников, карты которых записаны без ошибок"""
+        if self.fingerprints is None or self.plan is not None:
+            return
+        self.fingerprints.save(self.employee_cards, self.failed_pernos)
+
+    def _intent_to_create_card(self, records: List[HistoricalRecord]) -> None:
+        card_start_dt = max(self.config.date_start, records[0].date_from)
+        card_end_dt = min(self.config.date_end, records[-1].date_to)
 
         result_card_dates = self.bonus_handler.apply_bonus_dates(
             records, (card_start_dt, card_end_dt)
         )
 
+        employee_filter = FilterEmployee(records, self.config)
         for dates in result_card_dates:
-            if FilterEmployee(dates, records, self.period).is_suited():
-                existing_card = Card.objects.filter(
-                    perno=records[0]["per_no"],
-                    period_id=self.period.id,
-                    date_start=dates["start"],
-                ).first()
+            if employee_filter.is_suited(dates):
+                existing_card = self.existing_cards.get(
+                    records[0].per_no, dates["start"]
+                )
 
                 if existing_card and existing_card.generation_task_id != self.task_id:
                     # it means that other generation run already created card with such parameters
-                    activity = ExistingCardManager(existing_card).handle_existing_card(
-                        dates
-                    )
+                    activity = ExistingCardManager(
+                        existing_card,
+                        self.config,
+                        self.write_buffer,
+                        plan=self.plan,
+                    ).handle_existing_card(dates)
                     self.results[activity] += 1
-                    self.employee_cards[records[0]["per_no"]].add(existing_card.id)
+                    self.employee_cards[records[0].per_no].add(existing_card.id)
                     continue
 
                 elif existing_card and existing_card.generation_task_id == self.task_id:
-                    self.employee_cards[records[0]["per_no"]].add(existing_card.id)
+                    if existing_card.pk:
+                        # Created cards are collected by flush_writes once they are written
+                        self.employee_cards[records[0].per_no].add(existing_card.id)
                     continue
 
-                bonus_type = EmployeeBonusType.objects.get(key=dates["type"])
-                card = Card.objects.create(
-                    perno=records[0]["per_no"],
+                bonus_type = self.config.get_bonus_type(dates["type"])
+                card = Card(
+                    perno=records[0].per_no,
                     business_unit=dates["business_unit"],
                     bonus_type=bonus_type,
-                    period_id=self.period.id,
+                    period=self.period,
                     date_start=dates["start"],
                     date_end=dates["end"],
                     generation_task_id=self.task_id,
                 )
+                self.write_buffer.create(card)
+                self.existing_cards.add(card)
 
-                self.results[CardActivity.created.value] += 1
-                self.employee_cards[records[0]["per_no"]].add(card.id)
-
-    @staticmethod
-    def get_last_record(historical_records, per_no):
-        for record in reversed(historical_records):
-            if record["per_no"] == per_no:
-                return record
-
-    def get_last_fired_record(self, historical_records):
-        return_index, return_record = -1, {}
-        for index, record in enumerate(historical_records):
-            if (
-                record["position"]["employee_status"] == EmployeeStatus.fired.value
-                and record["position"]["employee_group"]
-                in (
-                    OrganizationMethod.hourly.value,
-                    OrganizationMethod.salary.value,
-                )
-                and datetime.fromisoformat(record["fire_dt"]).date()
-                == (
-                    self._dttm_from_str_to_date(record["business_from_dttm"])
-                    - timedelta(days=1)
-                )
-            ):
-                return_index = index
-                return_record = record
-        return return_index, return_record
-
-    def generate_cards_for_employee(self, employee):
-        """Генерация карт для сотрудника за период"""
-        prev_record = {}
-        records_to_perform_creation = []
-        per_no = employee["per_no"]
-        # Only main employee_group
-        employee["historical_records"] = [
-            it
-            for it in employee["historical_records"]
-            if it["position"]["employee_group"]
-            in (
-                OrganizationMethod.salary.value,
-                OrganizationMethod.hourly.value,
-            )
-        ]
-        # Check if employee generally has data about it's work leaving
-        fire_data = self.employee_deactivate_manager.find_employee_quit_data(
-            employee["historical_records"]
+    def generate_cards_for_employee(self, employee: Employee):
+        """Генерация карт для сотрудника за период
+
+        Если входные данные сотрудника не изменились с прошлой успешной генерации,
+        его карты засчитываются как проверенные без пересчета.
+        """
+        if self.fingerprints is None:
+            self._generate_cards_for_employee(employee)
+            return
+
+        per_no = employee.per_no
+        fingerprint = self.fingerprints.compute(employee)
+        card_ids = self.fingerprints.unchanged_card_ids(
+            per_no, fingerprint, self.existing_cards.cards_for_perno(per_no)
         )
-        self.employee_fired[per_no] = fire_data if fire_data else None
-        self._recalculate_hire_dt(employee["historical_records"])
+        if card_ids is not None:
+            self.employee_cards[per_no].update(card_ids)
+            self.results[CardActivity.checked.value] += len(card_ids)
+            return
+
+        errors = self.results[CardActivity.errors.value]
+        deactivation_errors = self.employee_deactivate_manager.deactivation_errors_counter
+        self._generate_cards_for_employee(employee)
         if (
-            self.employee_fired[per_no]
-            and self.get_last_record(employee["historical_records"], per_no)[
-                "position"
-            ]["employee_status"]
-            == EmployeeStatus.fired.value
+            self.results[CardActivity.errors.value] == errors
+            and self.employee_deactivate_manager.deactivation_errors_counter
+            == deactivation_errors
         ):
+            self.fingerprints.remember(per_no, fingerprint)
+
+    def _generate_cards_for_employee(self, employee: Employee):
+        per_no = employee.per_no
+        timeline = EmployeeTimeline(per_no, employee.historical_records, self.config)
+        # Only main employee_group
+        employee.historical_records = timeline.records
+        # Check if employee generally has data about it's work leaving
+        self.employee_fired[per_no] = timeline.quit_data or None
+        if self.employee_fired[per_no] and timeline.last_record_fired:
             # if employee was fired and the last record is only about it, so we need to only deactivate current cards
             self.employee_deactivate_manager.check_cards_for_deactivation(
                 per_no, self.employee_fired[per_no]
             )
             return
 
-        if self.employee_fired[
-            per_no
-        ]:  
+        segments = timeline.segments
+        if self.employee_fired[per_no]:
             # if it was fired, but now works - let's check all the cards before fire
-            fired_record_index, fired_record = self.get_last_fired_record(
-                employee["historical_records"]
-            )
-            old_cards_ids = (
-                Card.objects.filter(period=self.period, perno=per_no)
-                .exclude(
-                    date_end__gt=datetime.fromisoformat(fired_record["fire_dt"]),
-                )
-                .values_list("pk", flat=True)
-            )
+            fire_dt = timeline.last_fired_record.fire_dt
+            old_cards_ids = {
+                card.pk
+                for card in self.existing_cards.cards_for_perno(per_no)
+                if card.pk is not None and card.date_end <= fire_dt
+            }
             self.employee_deactivate_manager.check_cards_for_deactivation(
-                per_no, self.employee_fired[per_no], set(old_cards_ids)
+                per_no, self.employee_fired[per_no], old_cards_ids
             )
             # only fresh records now make interest
-            employee["historical_records"] = employee["historical_records"][
-                fired_record_index + 1 :
-            ]
-        for record in employee["historical_records"]:
-            business_to_dttm = self._dttm_from_str_to_date(record["business_to_dttm"])
-            if business_to_dttm < self.period.date_start or record["per_no"] != per_no:
-                # Its' agreement that records are coming from old to new one
-                continue
-            if (
-                self._dttm_from_str_to_date(record["business_from_dttm"])
-                > self.period.date_end
-            ):  
-                break
-            if not prev_record:
-                prev_record = record
-                records_to_perform_creation.append(record)
-                continue
-            if (
-                prev_record["division"]["unit"]
-                == record["division"][
-                    "unit"
-                ]  
-                and prev_record["position"]["staff_position_id"]
-                == record["position"][
-                    "staff_position_id"
-                ]  
-            ) or (
-                record["change_reason_type"]
-                and int(record["change_reason_type"])
-                == ChangeReasonType.technical.value
-                and prev_record["per_no"] == record["per_no"]
-            ):
-                prev_record = record
-                records_to_perform_creation.append(record)
-                continue
-            else:
-                try:
-                    self._intent_to_create_card(records_to_perform_creation)
-                except Exception as e:
-
-                    logger.error(
-                        f"Autogeneration erorr. Details: {per_no}: {type(e), e.with_traceback(None)}"
-                    )
-                    self.results[CardActivity.errors.value] += 1
-
-            prev_record = record
-            records_to_perform_creation = [record]
-        try:
-            if records_to_perform_creation:
-                self._intent_to_create_card(records_to_perform_creation)
-
-        except Exception as e:
-            logger.error(
-                f"Autogeneration error. Details: {per_no}: {type(e), e.with_traceback(None)}"
-            )
-            self.results[CardActivity.errors.value] += 1
+            segments = timeline.segments_after_fired
+        for records in segments:
+            try:
+                self._intent_to_create_card(records)
+            except Exception as e:
+                logger.error(
+                    f"Autogeneration error. Details: {per_no}: {type(e), e.with_traceback(None)}"
+                )
+                self.results[CardActivity.errors.value] += 1
 
         self.employee_deactivate_manager.check_cards_for_deactivation(
             per_no, self.employee_fired[per_no], self.employee_cards[per_no]
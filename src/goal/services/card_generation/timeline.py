@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from src.goal.models.card import Card
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.consts import (
+    ChangeReasonType,
+    EmployeeStatus,
+    OrganizationMethod,
+)
+from src.goal.services.card_generation.dataclasses import HistoricalRecord
+
+
+# Учитываются только записи основных групп сотрудников
+MAIN_EMPLOYEE_GROUPS = (OrganizationMethod.salary.value, OrganizationMethod.hourly.value)
+# Возврат в течение этого числа дней не считается увольнением
+REHIRE_DAYS = 14
+
+
+class _SegmentsBuilder:
+    """Группировка записей периода в отрезки непрерывной работы на одной позиции"""
+
+    def __init__(self, per_no: str, date_start: date, date_end: date):
+        self.per_no = per_no
+        self.date_start = date_start
+        self.date_end = date_end
+        self.segments: List[List[HistoricalRecord]] = []
+        self._current: List[HistoricalRecord] = []
+        self._prev: Optional[HistoricalRecord] = None
+        self._stopped = False
+
+    @staticmethod
+    def _is_technical(record: HistoricalRecord) -> bool:
+        change_reason_type = record.change_reason_type
+        return bool(
+            change_reason_type
+            and int(change_reason_type) == ChangeReasonType.technical.value
+        )
+
+    def add(self, record: HistoricalRecord) -> None:
+        if self._stopped:
+            return
+        if record.date_to < self.date_start or record.per_no != self.per_no:
+            # Записи приходят от старых к новым
+            return
+        if record.date_from > self.date_end:
+            self._stopped = True
+            return
+        prev = self._prev
+        self._prev = record
+        if prev is None or (
+            prev.unit == record.unit
+            and prev.staff_position_id == record.staff_position_id
+        ) or (self._is_technical(record) and prev.per_no == record.per_no):
+            self._current.append(record)
+            return
+        self.segments.append(self._current)
+        self._current = [record]
+
+    def finish(self) -> List[List[HistoricalRecord]]:
+        if self._current:
+            self.segments.append(self._current)
+            self._current = []
+        return self.segments
+
+
+class EmployeeTimeline:
+    """История сотрудника, разобранная за один проход
+
+    За один проход по записям основной группы вычисляются:
+    - увольнения без возврата в течение REHIRE_DAYS дней (`quit_data`);
+    - фактическая дата приема при быстром возврате (`hire_dt` записи заменяется
+      датой приема предыдущей активной записи);
+    - последняя запись об увольнении (`last_fired_record`);
+    - отрезки работы на одной позиции в границах периода: по всей истории
+      (`segments`) и после последнего увольнения (`segments_after_fired`).
+    """
+
+    def __init__(
+        self,
+        per_no: str,
+        historical_records: List[HistoricalRecord],
+        config: PeriodGenerationConfig,
+    ):
+        self.per_no = per_no
+        self.config = config
+        self.records: List[HistoricalRecord] = []
+        self.quit_data: List[Tuple[date, str]] = []
+        self.last_fired_record: Optional[HistoricalRecord] = None
+        self.last_record_fired = False
+        self._build(historical_records)
+
+    def _quit(self, record: HistoricalRecord) -> Tuple[date, str]:
+        return (min(self.config.date_end, record.fire_dt), Card.NON_ACTIVE_Q.key)
+
+    @staticmethod
+    def _is_fire_record(record: HistoricalRecord) -> bool:
+        return (
+            record.fire_dt is not None
+            and record.fire_dt == record.date_from - timedelta(days=1)
+        )
+
+    def _build(self, historical_records: List[HistoricalRecord]) -> None:
+        segments = _SegmentsBuilder(
+            self.per_no, self.config.date_start, self.config.date_end
+        )
+        segments_after_fired = _SegmentsBuilder(
+            self.per_no, self.config.date_start, self.config.date_end
+        )
+        # Увольнения, для которых еще не встретилась следующая активная запись
+        pending_fired: List[HistoricalRecord] = []
+        prev_active: Optional[HistoricalRecord] = None
+        last: Optional[HistoricalRecord] = None
+
+        for record in historical_records:
+            if record.employee_group not in MAIN_EMPLOYEE_GROUPS:
+                continue
+            self.records.append(record)
+            last = record
+
+            if record.employee_status == EmployeeStatus.active.value:
+                for fired in pending_fired:
+                    if (record.date_from - fired.date_from).days > REHIRE_DAYS:
+                        self.quit_data.append(self._quit(fired))
+                pending_fired = []
+                if (
+                    prev_active is not None
+                    and (record.date_from - prev_active.date_to).days < REHIRE_DAYS
+                ):
+                    record.hire_dt = prev_active.hire_dt
+                prev_active = record
+            elif record.employee_status == EmployeeStatus.fired.value:
+                if record.date_from <= self.config.cards_bonus_payout_date:
+                    pending_fired.append(record)
+
+            is_fired = record.employee_status == EmployeeStatus.fired.value
+            if record.per_no == self.per_no:
+                self.last_record_fired = is_fired
+
+            segments.add(record)
+            segments_after_fired.add(record)
+            if is_fired and self._is_fire_record(record):
+                # Нужны только записи после последнего увольнения
+                self.last_fired_record = record
+                segments_after_fired = _SegmentsBuilder(
+                    self.per_no, self.config.date_start, self.config.date_end
+                )
+
+        # Увольнение последней записью истории - без возврата
+        if pending_fired and pending_fired[-1] is last:
+            self.quit_data.append(self._quit(last))
+        self.segments = segments.finish()
+        self.segments_after_fired = segments_after_fired.finish()
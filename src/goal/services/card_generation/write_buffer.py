@@ -0,0 +1,167 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models.signals import post_save
+
+from src.goal.models.card import Card
+
+
+logger = logging.getLogger(__name__)
+
+CARD_WRITE_CHUNK_SIZE = 500
+
+# FK are assigned from already loaded objects, there is no need to check them in the DB
+CARD_VALIDATION_EXCLUDE = ["period", "bonus_type"]
+
+
+def send_cards_post_save(cards: List[Card], created: bool, update_fields=None) -> None:
+    # bulk-операции не отправляют сигналы, а на сохранение карты завязаны обработчики
+    using = router.db_for_write(Card)
+    for card in cards:
+        post_save.send(
+            sender=Card,
+            instance=card,
+            created=created,
+            update_fields=update_fields,
+            raw=False,
+            using=using,
+        )
+
+
+@dataclass
+class FlushResult:
+    created: List[Card] = field(default_factory=list)
+    failed_creates: List[Card] = field(default_factory=list)
+    # Activities (CardActivity values) of the updates which were not written
+    failed_updates: List[str] = field(default_factory=list)
+    # Employees whose cards were not written completely
+    failed_pernos: Set[str] = field(default_factory=set)
+
+
+class CardWriteBuffer:
+    """Буфер записи карт генерации
+
+    Копит создания и изменения карт подразделения и записывает их пачками через
+    bulk_create/bulk_update. Валидация выполняется один раз на пачку без запросов в БД.
+    """
+
+    def __init__(self, chunk_size: int = CARD_WRITE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._creates: List[Card] = []
+        self._updates: Dict[int, Tuple[Card, Set[str], List[str]]] = {}
+
+    def __len__(self):
+        return len(self._creates) + len(self._updates)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self) >= self.chunk_size
+
+    def create(self, card: Card) -> None:
+        self._creates.append(card)
+
+    def update(self, card: Card, update_fields: List[str], activity: str) -> None:
+        _, fields, activities = self._updates.setdefault(card.pk, (card, set(), []))
+        fields.update(update_fields)
+        activities.append(activity)
+
+    @staticmethod
+    def _validate(card: Card) -> None:
+        card.clean_fields(exclude=CARD_VALIDATION_EXCLUDE)
+        card.clean()
+
+    def _validate_creates(self, cards: List[Card]) -> Tuple[List[Card], List[Card]]:
+        valid, invalid = [], []
+        unique_keys = set()
+        for card in cards:
+            key = (
+                card.perno,
+                card.business_unit,
+                card.period_id,
+                card.date_start,
+                card.date_end,
+            )
+            try:
+                self._validate(card)
+                if key in unique_keys:
+                    raise ValidationError(f"Дубликат карты в пачке: {key}")
+            except ValidationError as e:
+                logger.error(f"Карта {card.perno} не прошла валидацию: {e}")
+                invalid.append(card)
+                continue
+            unique_keys.add(key)
+            valid.append(card)
+        return valid, invalid
+
+    def _flush_creates(self, result: FlushResult) -> None:
+        cards, invalid = self._validate_creates(self._creates)
+        result.failed_creates.extend(invalid)
+        for index in range(0, len(cards), self.chunk_size):
+            chunk = cards[index : index + self.chunk_size]
+            try:
+                with transaction.atomic():
+                    Card.objects.bulk_create(chunk)
+                    send_cards_post_save(chunk, created=True)
+                result.created.extend(chunk)
+            except Exception as e:
+                logger.error(f"Ошибка пакетного создания карт: {type(e), e}")
+                # Пачка откатилась, сохраняем по одной, чтобы найти проблемную карту
+                for card in chunk:
+                    card.pk = None
+                    try:
+                        with transaction.atomic():
+                            card.save()
+                        result.created.append(card)
+                    except Exception as e:
+                        logger.error(f"Ошибка создания карты {card.perno}: {type(e), e}")
+                        result.failed_creates.append(card)
+
+    def _flush_updates(self, result: FlushResult) -> None:
+        by_fields = defaultdict(list)
+        for card, fields, activities in self._updates.values():
+            try:
+                self._validate(card)
+            except ValidationError as e:
+                logger.error(f"Карта {card.pk} не прошла валидацию: {e}")
+                result.failed_updates.extend(activities)
+                result.failed_pernos.add(card.perno)
+                continue
+            by_fields[tuple(sorted(fields))].append((card, activities))
+
+        for fields, items in by_fields.items():
+            for index in range(0, len(items), self.chunk_size):
+                chunk = items[index : index + self.chunk_size]
+                cards = [card for card, _ in chunk]
+                try:
+                    with transaction.atomic():
+                        Card.objects.bulk_update(cards, fields)
+                        send_cards_post_save(
+                            cards, created=False, update_fields=frozenset(fields)
+                        )
+                except Exception as e:
+                    logger.error(f"Ошибка пакетного обновления карт: {type(e), e}")
+                    for card, activities in chunk:
+                        try:
+                            with transaction.atomic():
+                                card.save(update_fields=list(fields))
+                        except Exception as e:
+                            logger.error(
+                                f"Ошибка обновления карты {card.pk}: {type(e), e}"
+                            )
+                            result.failed_updates.extend(activities)
+                            result.failed_pernos.add(card.perno)
+
+    def flush(self) -> FlushResult:
+        result = FlushResult()
+        if self._creates:
+            self._flush_creates(result)
+        if self._updates:
+            self._flush_updates(result)
+        self._creates = []
+        self._updates = {}
+        result.failed_pernos.update(card.perno for card in result.failed_creates)
+        return result
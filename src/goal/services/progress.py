@@ -0,0 +1,235 @@
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from src.goal.models import Notify, OrgStructureActionsLog
+
+
+PROGRESS_TTL = 60 * 60 * 24
+# Уведомление о прогрессе обновляется не чаще раза в PROGRESS_NOTIFY_INTERVAL секунд
+PROGRESS_NOTIFY_INTERVAL = 15
+# Счетчики журнала действий записываются пачками по ACTION_LOG_FLUSH_UNITS
+# подразделений, но не реже раза в ACTION_LOG_FLUSH_INTERVAL секунд
+ACTION_LOG_FLUSH_UNITS = 50
+ACTION_LOG_FLUSH_INTERVAL = 30
+# Блокировка записи счетчиков одной частью задачи
+ACTION_LOG_FLUSH_LOCK_TTL = 60
+# Число подразделений, счетчики которых еще не записаны в журнал
+PENDING_UNITS = "units"
+
+# Счетчик результата -> поле OrgStructureActionsLog
+ACTION_LOG_FIELDS = {
+    "created": "created_count",
+    "updated": "updated_count",
+    "deactivated": "deactivated_count",
+    "reactivated": "reactivated_count",
+    "errors": "errors",
+}
+
+
+def _progress_key(task_id) -> str:
+    return f"bulk_task_progress:{task_id}"
+
+
+def _done_key(task_id) -> str:
+    return f"bulk_task_progress_done:{task_id}"
+
+
+def _notify_throttle_key(task_id) -> str:
+    return f"bulk_task_progress_notify:{task_id}"
+
+
+def _counter_key(task_id, field: str) -> str:
+    return f"bulk_task_progress_counter:{task_id}:{field}"
+
+
+def _flushed_at_key(task_id) -> str:
+    return f"bulk_task_progress_flushed_at:{task_id}"
+
+
+def _flush_lock_key(task_id) -> str:
+    return f"bulk_task_progress_flush_lock:{task_id}"
+
+
+def _counter_keys(task_id) -> Dict[str, str]:
+    return {
+        field: _counter_key(task_id, field)
+        for field in (*ACTION_LOG_FIELDS.values(), PENDING_UNITS)
+    }
+
+
+def _incr(key: str, delta: int) -> int:
+    cache.add(key, 0, timeout=PROGRESS_TTL)
+    return cache.incr(key, delta)
+
+
+def get_progress(task_id) -> Optional[Dict]:
+    """Прогресс массовой задачи из кэша, без обращения к БД"""
+    return cache.get(_progress_key(task_id))
+
+
+class ProgressReporter:
+    """Прогресс массовой задачи по подразделениям
+
+    Прогресс пишется в кэш после каждого подразделения и читается оттуда
+    (`get_progress`). Счетчик обработанных подразделений общий для всех частей
+    задачи (параллельные задачи подразделений). Уведомление пользователя
+    обновляется не чаще раза в `notify_interval` секунд. Счетчики журнала
+    действий тоже общие: они копятся в кэше и записываются одним UPDATE
+    на `flush_units` подразделений всей задачи или раз в `flush_interval`
+    секунд, остаток записывает `finish` в конце задачи.
+    """
+
+    def __init__(
+        self,
+        task_id,
+        total: int,
+        message: str = "",
+        notify_id: Optional[int] = None,
+        action_log: Optional[int] = None,
+        notify_interval: Optional[float] = None,
+        flush_units: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        self.task_id = task_id
+        self.total = total
+        self.message = message
+        self.notify_id = notify_id
+        self.action_log = action_log
+        self.notify_interval = (
+            notify_interval
+            if notify_interval is not None
+            else getattr(settings, "PROGRESS_NOTIFY_INTERVAL", PROGRESS_NOTIFY_INTERVAL)
+        )
+        self.flush_units = flush_units or getattr(
+            settings, "ACTION_LOG_FLUSH_UNITS", ACTION_LOG_FLUSH_UNITS
+        )
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else getattr(settings, "ACTION_LOG_FLUSH_INTERVAL", ACTION_LOG_FLUSH_INTERVAL)
+        )
+        self._last_notify = None
+        if self.action_log:
+            # Интервал записи счетчиков отсчитывается от запуска задачи
+            cache.add(_flushed_at_key(task_id), time.time(), timeout=PROGRESS_TTL)
+
+    def unit_done(self, counts: Optional[Dict[str, int]] = None) -> int:
+        """Отметить обработанное подразделение, вернуть число обработанных"""
+        if counts and self.action_log:
+            for key, field in ACTION_LOG_FIELDS.items():
+                if counts.get(key):
+                    _incr(_counter_key(self.task_id, field), counts[key])
+            pending_units = _incr(_counter_key(self.task_id, PENDING_UNITS), 1)
+            if pending_units >= self.flush_units or self._flush_interval_passed():
+                self.flush_counts()
+        key = _done_key(self.task_id)
+        cache.add(key, 0, timeout=PROGRESS_TTL)
+        done = cache.incr(key)
+        self._publish(done)
+        return done
+
+    def _percent(self, done: int) -> int:
+        return int(done / self.total * 100) if self.total else 100
+
+    def _publish(self, done: int) -> None:
+        percent = self._percent(done)
+        cache.set(
+            _progress_key(self.task_id),
+            {
+                "done": done,
+                "total": self.total,
+                "percent": percent,
+                "message": self.message,
+                "finished": False,
+            },
+            timeout=PROGRESS_TTL,
+        )
+        if self.notify_id is None or not self._should_notify(done):
+            return
+        Notify.objects.filter(pk=self.notify_id).update(
+            message=self.message
+            + "\nОбработано подразделений: "
+            + f"{done}/{self.total} ({percent}%)",
+            is_new=True,
+            date_created=timezone.now(),
+        )
+
+    def _should_notify(self, done: int) -> bool:
+        if done >= self.total:
+            return True
+        now = time.monotonic()
+        if self._last_notify is not None and now - self._last_notify < self.notify_interval:
+            return False
+        # Интервал общий для всех частей задачи: пишет тот, кто первым занял окно
+        if not cache.add(
+            _notify_throttle_key(self.task_id), 1, timeout=self.notify_interval
+        ):
+            return False
+        self._last_notify = now
+        return True
+
+    def _flush_interval_passed(self) -> bool:
+        flushed_at = cache.get(_flushed_at_key(self.task_id))
+        return flushed_at is None or time.time() - flushed_at >= self.flush_interval
+
+    def flush_counts(self) -> None:
+        """Записать накопленные счетчики задачи в журнал действий
+
+        Пишет одна часть задачи за раз: если запись уже идет, счетчики
+        остаются в кэше до следующей записи.
+        """
+        if not self.action_log:
+            return
+        lock_key = _flush_lock_key(self.task_id)
+        if not cache.add(lock_key, 1, timeout=ACTION_LOG_FLUSH_LOCK_TTL):
+            return
+        try:
+            self._write_counts()
+        finally:
+            cache.delete(lock_key)
+
+    def _write_counts(self) -> None:
+        cache.set(_flushed_at_key(self.task_id), time.time(), timeout=PROGRESS_TTL)
+        keys = _counter_keys(self.task_id)
+        values = cache.get_many(keys.values())
+        increments = {}
+        for field, key in keys.items():
+            value = values.get(key)
+            if not value:
+                continue
+            # Вычитаем прочитанное: счетчики, добавленные после чтения, сохраняются
+            cache.decr(key, value)
+            if field != PENDING_UNITS:
+                increments[field] = value
+        if increments:
+            OrgStructureActionsLog.objects.filter(id=self.action_log).update(
+                **{field: F(field) + value for field, value in increments.items()}
+            )
+
+    def finish(self) -> None:
+        """Записать оставшиеся счетчики всей задачи
+
+        Вызывается, когда все части задачи завершены.
+        """
+        if self.action_log:
+            self._write_counts()
+
+    @classmethod
+    def complete(cls, task_id) -> None:
+        """Отметить завершение всей задачи"""
+        progress = get_progress(task_id) or {}
+        progress["finished"] = True
+        cache.set(_progress_key(task_id), progress, timeout=PROGRESS_TTL)
+        cache.delete_many(
+            [
+                _done_key(task_id),
+                _notify_throttle_key(task_id),
+                _flushed_at_key(task_id),
+                *_counter_keys(task_id).values(),
+            ]
+        )
@@ -0,0 +1,24 @@
+import logging
+
+from src.celery import LogErrorsTask, app
+from src.goal.services.camunda_outbox import dispatch_pending
+from src.helpers.circuit_breaker import breakers_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="camunda.outbox.dispatch", base=LogErrorsTask)
+def dispatch_camunda_outbox(max_batches=None):
+    """Отправка сообщений Camunda из очереди
+
+    Запускается периодически (beat) и после генерации карт.
+    """
+    counts = dispatch_pending(max_batches=max_batches)
+    if any(counts.values()):
+        logger.info(
+            f"Очередь сообщений Camunda: отправлено {counts['sent']}, "
+            f"отложено {counts['retried']}, не отправлено {counts['failed']}"
+        )
+    counts["breakers"] = breakers_metrics()
+    return counts
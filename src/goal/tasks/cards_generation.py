@@ -1,43 +1,160 @@
 import logging
+import math
+import random
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import partial
 
+from celery import chord, group
 from django.apps import apps
-from django.db.models import F
+from django.conf import settings
+from django.core.cache import cache
 
 from src.celery import LogErrorsTask, app
-from src.goal.api.versions.v1.permissions._helpers import (
-    has_goal_admin_permissions_unit_by_perno,
-)
-from src.goal.integrations.hr.hr_edw import (
-    get_employees_by_orgstructure,
-    get_orgstructure,
-)
-from src.goal.models import OrgStructureActionsLog
+from src.goal.integrations.camunda import get_camunda_breaker
+from src.goal.integrations.hr.hr_edw import get_employees_by_orgstructure
 from src.goal.models.card import CardProcedureState
+from src.goal.services.admin_units import AdminUnitsResolver
+from src.goal.services.card_generation.config import PeriodGenerationConfig
 from src.goal.services.card_generation.consts import CardActivity
+from src.goal.services.card_generation.hr_snapshot import (
+    EmployeesSnapshot,
+    load_snapshot,
+    save_snapshot,
+)
+from src.goal.services.card_generation.plan import (
+    GenerationPlan,
+    PlanOwner,
+    PlanOwnerMismatch,
+    apply_plan,
+    delete_plans,
+    load_plans,
+    lock_plans,
+    save_plans,
+    unlock_plans,
+)
+from src.goal.services.card_generation.prefetch import (
+    DEFAULT_PREFETCH_DEPTH,
+    UnitEmployeesPrefetcher,
+)
 from src.goal.services.card_generation.service import CardGenerationService
+from src.goal.services.progress import ProgressReporter
+from src.goal.tasks.camunda_outbox import dispatch_camunda_outbox
 from src.goal.tasks.camunda.card_agreement._helpers import (
     create_notify,
     get_organization_name,
 )
+from src.helpers.circuit_breaker import get_breaker
 from src.helpers.decorators import retry
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_PARALLEL_UNITS = 4
+# Слот параллельной генерации освобождается по таймауту, если воркер упал;
+# пока подразделение генерируется, слот продлевается раз в UNIT_SLOT_HEARTBEAT
+UNIT_SLOT_TTL = 10 * 60
+UNIT_SLOT_HEARTBEAT = UNIT_SLOT_TTL // 3
+# Подразделение без свободного слота пробует снова через UNIT_SLOT_RETRY_COUNTDOWN
+# секунд с удвоением до UNIT_SLOT_MAX_COUNTDOWN, не больше UNIT_SLOT_MAX_WAITS раз
+UNIT_SLOT_RETRY_COUNTDOWN = 15
+UNIT_SLOT_MAX_COUNTDOWN = 5 * 60
+UNIT_SLOT_MAX_WAITS = 50
+HR_EDW_BREAKER = "hr_edw.employees"
+HR_EDW_LATENCY_BUDGET = 60.0
+# Сколько раз подразделение, пропущенное из-за недоступности HR EDW, ставится
+# в очередь повторно, и минимальная задержка повтора (секунды)
+HR_EDW_MAX_REQUEUES = 3
+HR_EDW_REQUEUE_MIN_COUNTDOWN = 30
+
+
+def _hr_edw_breaker():
+    # Выгрузка сотрудников крупного подразделения ожидаемо долгая
+    return get_breaker(HR_EDW_BREAKER, latency_budget=HR_EDW_LATENCY_BUDGET)
 
-def _generate_cards_for_unit(bus_unit_id, period_id, task_id, action_log=None):
+
+def _fetch_unit_employees(bus_unit_id, period, bonus_type_keys, task_id=None):
+    """Сотрудники подразделения из снимка задачи или из HR EDW
+
+    Ответ HR EDW сохраняется сжатым снимком под `task_id`: повторы и перезапуски
+    задачи читают снимок и не обращаются к HR EDW повторно.
+    """
+    if task_id is not None:
+        snapshot = load_snapshot(task_id, bus_unit_id, period.id, bonus_type_keys)
+        if snapshot is not None:
+            return snapshot
+    # Ответ читается целиком внутри вызова, чтобы сбой чтения учитывался breaker
+    snapshot = _hr_edw_breaker().call(
+        lambda: EmployeesSnapshot.from_employees(
+            get_employees_by_orgstructure(bus_unit_id, period, bonus_type_keys)
+        )
+    )
+    if task_id is not None:
+        save_snapshot(task_id, bus_unit_id, period.id, bonus_type_keys, snapshot)
+    return snapshot
+
+
+def _hr_edw_unavailable_error(unit_id):
+    """Текст ошибки, если HR EDW недоступна и подразделение нужно пропустить"""
+    if _hr_edw_breaker().is_open:
+        return (
+            f"Подразделение {unit_id} пропущено: HR EDW недоступна, "
+            "генерацию нужно повторить позже"
+        )
+
+
+def _hr_edw_requeue_countdown():
+    """Задержка повтора подразделения: не раньше пробного вызова HR EDW"""
+    return max(math.ceil(_hr_edw_breaker().retry_after), HR_EDW_REQUEUE_MIN_COUNTDOWN)
+
+
+def _dispatch_camunda_outbox():
+    # При открытой цепи сообщения отправит периодический запуск
+    if not get_camunda_breaker("message").is_open:
+        dispatch_camunda_outbox.delay()
+
+
+def _prefetch_units_employees(units_list, period, depth=None, task_id=None):
+    """Сотрудники подразделений `units_list` с фоновой подгрузкой следующих"""
+    if depth is None:
+        depth = getattr(
+            settings, "CARDS_GENERATION_PREFETCH_DEPTH", DEFAULT_PREFETCH_DEPTH
+        )
+    return UnitEmployeesPrefetcher(
+        units_list,
+        partial(
+            _fetch_unit_employees,
+            period=period,
+            bonus_type_keys=sorted(period.bonus_types.values_list("key", flat=True)),
+            task_id=task_id,
+        ),
+        depth,
+    )
+
+
+def _generate_cards_for_unit(
+    bus_unit_id,
+    period_id,
+    task_id,
+    employees=None,
+    dry_run=False,
+    parallel_units=False,
+):
 
     Period = apps.get_model("goal.Period")
     period = Period.objects.get(id=period_id)
-    all_suited_employees = get_employees_by_orgstructure(
-        bus_unit_id,
-        period,
-        list(period.bonus_types.values_list("key", flat=True).all()),
+    generation_service = CardGenerationService(
+        period, task_id, dry_run=dry_run, parallel_units=parallel_units
     )
-    generation_service = CardGenerationService(period, task_id)
-
-    for employee in all_suited_employees:
-        generation_service.generate_cards_for_employee(employee)
+    if employees is None:
+        employees = _fetch_unit_employees(
+            bus_unit_id,
+            period,
+            sorted(generation_service.config.bonus_type_keys),
+            task_id=task_id,
+        )
+    generation_service.generate_cards_for_employees(bus_unit_id, employees)
 
     created, updated, reactivated, checked, errors = (
         generation_service.results[CardActivity.created.value],
@@ -70,22 +187,12 @@ def _generate_cards_for_unit(bus_unit_id, period_id, task_id, action_log=None):
         + generation_service.unit_deactivate_manager.deactivation_errors_counter
     )
     errors += deactivate_errors
-    if action_log and any(
-        [
-            created,
-            updated,
-            reactivated,
-            deactivate_count,
-            errors,
-        ]
-    ):
-        OrgStructureActionsLog.objects.filter(id=action_log).update(
-            created_count=F("created_count") + created,
-            updated_count=F("updated_count") + updated,
-            deactivated_count=F("deactivated_count") + deactivate_count,
-            reactivated_count=F("reactivated_count") + reactivated,
-            errors=F("errors") + errors,
-        )
+    # Подразделение обработано, повтор генерации начнется заново
+    generation_service.delete_checkpoint(bus_unit_id)
+    if (deactivate_count or reactivated) and not dry_run:
+        # Сообщения о деактивации и запуски процессов ре-активированных карт
+        # записаны в очередь, отправляем их в фоне
+        _dispatch_camunda_outbox()
     logger.info(
         f"Оргструктура {bus_unit_id}. Создано карт: {created}, "
         f"обновлено карт: {updated}, "
@@ -94,7 +201,7 @@ def _generate_cards_for_unit(bus_unit_id, period_id, task_id, action_log=None):
         f"ошибок: {errors}, "
         f"проверено {checked}"
     )
-    return {
+    counts = {
         "created": created,
         "updated": updated,
         "checked": checked,
@@ -102,6 +209,113 @@ def _generate_cards_for_unit(bus_unit_id, period_id, task_id, action_log=None):
         "errors": errors,
         "deactivated": deactivate_count,
     }
+    if dry_run:
+        counts["plan"] = generation_service.plan.to_dict()
+    return counts
+
+
+def _empty_total_counts():
+    return {
+        "created": 0,
+        "updated": 0,
+        "checked": 0,
+        "errors": 0,
+        "deactivated": 0,
+        "reactivated": 0,
+        "units": 0,
+    }
+
+
+def _add_unit_counts(total_counts, error_list, unit_id, counts, plans=None):
+    plan = counts.pop("plan", None)
+    if plan is not None and plans is not None:
+        plans.append(GenerationPlan.from_dict(plan))
+    for key, value in counts.items():
+        total_counts[key] = total_counts.get(key, 0) + value
+    total_counts["units"] += 1
+
+    if counts.get("errors", 0) > 0:
+        error_list.append(
+            f"Ошибка при генерации карт для подразделения {unit_id} "
+            f"({counts['errors']} шт)"
+        )
+
+
+def _notify_generation_result(
+    user_perno,
+    bus_unit_id,
+    with_hierarchy,
+    total_counts,
+    error_list,
+    task_id=None,
+    plans=None,
+    period_id=None,
+):
+    if plans is not None:
+        save_plans(task_id, plans, PlanOwner(user_perno, period_id, bus_unit_id))
+    bus_unit_name = get_organization_name(bus_unit_id)
+    subunits_count = (
+        f" c учетом вложенных {total_counts['units']} подразделений"
+        if with_hierarchy
+        else ""
+    )
+    message = f"""Для орг. единицы "{bus_unit_name}" ({bus_unit_id}) {subunits_count}
+    - Создано: {total_counts['created']} карт
+    - Обновлено: {total_counts['updated']} карт
+    - Деактивировано (удалено): {total_counts['deactivated']} карт
+    - Активировано заново: {total_counts['reactivated']} карт
+    - Проверено: {total_counts['checked']} карт
+    - Ошибок: {total_counts['errors']}"""
+    if error_list:
+        message += "\n\nОшибки:\n" + "\n".join(error_list[:10])
+    if plans is not None:
+        message = (
+            f"План генерации {task_id} (карты не изменены, "
+            f"Camunda не вызывалась):\n{message}"
+        )
+    create_notify(user_perno, message)
+
+
+def _unit_slot_key(task_id, slot: int) -> str:
+    return f"cards_generation_slot:{task_id}:{slot}"
+
+
+def _acquire_unit_slot(task_id, max_parallel_units: int):
+    """Занять слот параллельной генерации задачи, None - свободных слотов нет"""
+    for slot in range(max_parallel_units):
+        if cache.add(_unit_slot_key(task_id, slot), 1, timeout=UNIT_SLOT_TTL):
+            return slot
+    return None
+
+
+def _release_unit_slot(task_id, slot: int) -> None:
+    cache.delete(_unit_slot_key(task_id, slot))
+
+
+@contextmanager
+def _hold_unit_slot(task_id, slot: int):
+    """Продлевать слот, пока подразделение генерируется, и освободить в конце"""
+    key = _unit_slot_key(task_id, slot)
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(UNIT_SLOT_HEARTBEAT):
+            cache.touch(key, UNIT_SLOT_TTL)
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+        _release_unit_slot(task_id, slot)
+
+
+def _unit_slot_countdown(slot_waits: int) -> int:
+    """Задержка ожидания слота: с удвоением и разбросом, чтобы не будить разом"""
+    countdown = min(UNIT_SLOT_RETRY_COUNTDOWN * 2**slot_waits, UNIT_SLOT_MAX_COUNTDOWN)
+    return countdown + random.randint(0, UNIT_SLOT_RETRY_COUNTDOWN)
 
 
 @app.task(name="camunda.agreement.generate_cards", base=LogErrorsTask)
@@ -113,128 +327,478 @@ def generate_cards(
     action_log=None,
     is_user_sysadmin=False,
     with_hierarchy=True,
+    parallel=None,
+    max_parallel_units=None,
+    dry_run=False,
+    hr_requeues=0,
 ):
+    """Генерация карт подразделения (и вложенных при `with_hierarchy`)
+
+    При `dry_run` карты не изменяются: план действий по подразделениям сохраняется
+    под `task_id` и применяется задачей `apply_cards_generation_plan`.
+    Подразделения, пропущенные из-за недоступности HR EDW, запускаются отдельной
+    генерацией после открытия цепи (не больше HR_EDW_MAX_REQUEUES раз).
+    """
     Period = apps.get_model("goal.Period")
     period = Period.objects.get(id=period_id)
-    units_list = (bus_unit_id,)
-    if with_hierarchy:
-        unit_list_response = get_orgstructure(
-            url_params={
-                "unit": bus_unit_id,
-                "fields": "flat_list_subunits",
-                "interval_start": period.date_start.isoformat(),
-                "interval_end": period.date_end.isoformat(),
-            }
-        )
-
-        if len(unit_list_response) > 0:
-            units_list = unit_list_response[0].get("flat_list_subunits", tuple())
+    units_list, allowed_units = AdminUnitsResolver(
+        user_perno, is_sysadmin=is_user_sysadmin
+    ).administered_units(bus_unit_id, period, with_hierarchy)
 
-    total_counts = {
-        "created": 0,
-        "updated": 0,
-        "checked": 0,
-        "errors": 0,
-        "deactivated": 0,
-        "reactivated": 0,
-        "units": 0,
-    }
+    total_counts = _empty_total_counts()
     error_list = []
+    plans = [] if dry_run else None
     progress_message = (
         f"Запущена генерация в {period.period} периоде для подразделения {bus_unit_id}"
     )
     if with_hierarchy:
         progress_message += " и его вложенных подразделений"
     notify = create_notify(user_perno, progress_message)
-    done_percent = 0
-    for index, unit_id in enumerate(units_list):
-        if is_user_sysadmin or has_goal_admin_permissions_unit_by_perno(
-            unit_id, user_perno
-        ):
-            try:
-                counts = generate_cards_for_unit(
-                    bus_unit_id=unit_id,
-                    period_id=period_id,
-                    task_id=task_id,
-                    action_log=action_log,
-                )
-                for key, value in counts.items():
-                    total_counts[key] = total_counts.get(key, 0) + value
-                total_counts["units"] += 1
 
-                if counts.get("errors", 0) > 0:
+    if parallel is None:
+        parallel = getattr(settings, "CARDS_GENERATION_PARALLEL", False)
+    if with_hierarchy and parallel:
+        if allowed_units:
+            _generate_cards_parallel(
+                allowed_units,
+                bus_unit_id,
+                period_id,
+                user_perno,
+                task_id,
+                None if dry_run else action_log,
+                notify.id,
+                progress_message,
+                max_parallel_units,
+                dry_run,
+            )
+            return
+        units_list = ()
+
+    # При генерации для всей иерархии обновляется статус прогресса
+    progress = ProgressReporter(
+        task_id,
+        len(units_list),
+        message=progress_message,
+        notify_id=notify.id if with_hierarchy else None,
+        action_log=None if dry_run else action_log,
+    )
+    allowed_units_set = set(allowed_units)
+    prefetched_units = iter(
+        _prefetch_units_employees(allowed_units, period, task_id=task_id)
+    )
+    try:
+        for unit_id in units_list:
+            counts = None
+            if unit_id in allowed_units_set:
+                _, employees = next(prefetched_units)
+                unavailable_error = employees is None and _hr_edw_unavailable_error(
+                    unit_id
+                )
+                if unavailable_error and hr_requeues < HR_EDW_MAX_REQUEUES:
+                    # Не ждем таймаутов и повторов по каждому подразделению
+                    countdown = _hr_edw_requeue_countdown()
+                    generate_cards.apply_async(
+                        args=(unit_id, period_id, user_perno, str(uuid.uuid4())),
+                        kwargs={
+                            "action_log": action_log,
+                            "is_user_sysadmin": is_user_sysadmin,
+                            "with_hierarchy": False,
+                            "dry_run": dry_run,
+                            "hr_requeues": hr_requeues + 1,
+                        },
+                        countdown=countdown,
+                    )
                     error_list.append(
-                        f"Ошибка при генерации карт для подразделения {unit_id} "
-                        f"({counts['errors']} шт)"
+                        f"Подразделение {unit_id} отложено: HR EDW недоступна, "
+                        f"генерация повторится через {countdown} с"
                     )
-            except:
-                logger.error(f"Ошибка при генерации карт для подразделения {unit_id}")
-        if with_hierarchy:
-            # При генерации для всей иерархии, обновляем статус прогресса
-            curr_percent = int((index + 1) / len(units_list) * 100)
-            if curr_percent > done_percent:
-                done_percent = curr_percent
-                notify.message = (
-                    progress_message
-                    + "\nОбработано подразделений: "
-                    + f"{index + 1}/{len(units_list)} ({done_percent}%)"
+                elif unavailable_error:
+                    error_list.append(unavailable_error)
+                    total_counts["errors"] += 1
+                else:
+                    try:
+                        counts = generate_cards_for_unit(
+                            bus_unit_id=unit_id,
+                            period_id=period_id,
+                            task_id=task_id,
+                            employees=employees,
+                            dry_run=dry_run,
+                        )
+                        _add_unit_counts(
+                            total_counts, error_list, unit_id, counts, plans
+                        )
+                    except:
+                        logger.error(
+                            f"Ошибка при генерации карт для подразделения {unit_id}"
+                        )
+            progress.unit_done(counts)
+    finally:
+        # Счетчики журнала действий не теряются и при ошибке задачи
+        progress.finish()
+    ProgressReporter.complete(task_id)
+
+    _notify_generation_result(
+        user_perno,
+        bus_unit_id,
+        with_hierarchy,
+        total_counts,
+        error_list,
+        task_id=task_id,
+        plans=plans,
+        period_id=period_id,
+    )
+
+
+def _generation_units(
+    units_list, period_id, task_id, max_parallel_units=None, **unit_kwargs
+):
+    """Группа задач `generate_cards_unit`, по задаче на подразделение
+
+    Одновременно выполняется не больше `max_parallel_units` подразделений:
+    освободившийся слот занимает следующее подразделение из очереди, поэтому
+    медленное подразделение не задерживает остальные.
+    """
+    if not max_parallel_units:
+        max_parallel_units = getattr(
+            settings,
+            "CARDS_GENERATION_MAX_PARALLEL_UNITS",
+            DEFAULT_MAX_PARALLEL_UNITS,
+        )
+    return group(
+        generate_cards_unit.s(
+            unit_id,
+            period_id,
+            task_id,
+            max_parallel_units=max_parallel_units,
+            units_count=len(units_list),
+            **unit_kwargs,
+        )
+        for unit_id in units_list
+    )
+
+
+def _collect_units_results(units_results, plans=None):
+    """Сложить результаты подразделений, упавшее подразделение считается ошибкой"""
+    total_counts = _empty_total_counts()
+    error_list = []
+    for result in units_results:
+        if result.get("error"):
+            error_list.append(result["error"])
+            total_counts["errors"] += 1
+        elif result["counts"] is None:
+            error_list.append(
+                f"Ошибка при генерации карт для подразделения {result['unit_id']}"
+            )
+            total_counts["errors"] += 1
+        if result["counts"] is not None:
+            _add_unit_counts(
+                total_counts,
+                error_list,
+                result["unit_id"],
+                result["counts"],
+                plans,
+            )
+    return total_counts, error_list
+
+
+def _generate_cards_parallel(
+    units_list,
+    bus_unit_id,
+    period_id,
+    user_perno,
+    task_id,
+    action_log,
+    notify_id,
+    progress_message,
+    max_parallel_units=None,
+    dry_run=False,
+):
+    """Раздать подразделения иерархии по параллельным задачам
+
+    Каждое подразделение обрабатывается своей задачей, не больше
+    `max_parallel_units` одновременно, итог собирает `generate_cards_finish`.
+    """
+    chord(
+        _generation_units(
+            units_list,
+            period_id,
+            task_id,
+            max_parallel_units,
+            action_log=action_log,
+            notify_id=notify_id,
+            progress_message=progress_message,
+            dry_run=dry_run,
+        ),
+        generate_cards_finish.s(
+            bus_unit_id=bus_unit_id,
+            period_id=period_id,
+            user_perno=user_perno,
+            task_id=task_id,
+            action_log=action_log,
+            dry_run=dry_run,
+        ),
+    ).apply_async()
+
+
+@app.task(
+    bind=True, name="camunda.agreement.generate_cards_unit", base=LogErrorsTask
+)
+def generate_cards_unit(
+    self,
+    unit_id,
+    period_id,
+    task_id,
+    max_parallel_units=DEFAULT_MAX_PARALLEL_UNITS,
+    units_count=0,
+    action_log=None,
+    notify_id=None,
+    progress_message="",
+    dry_run=False,
+    hr_requeues=0,
+    slot_waits=0,
+):
+    """Генерация карт подразделения в составе параллельной задачи
+
+    Если все `max_parallel_units` слотов задачи заняты, подразделение
+    откладывается с растущей задержкой; не дождавшись слота за
+    UNIT_SLOT_MAX_WAITS попыток, подразделение считается ошибкой. Если HR EDW
+    недоступна, подразделение откладывается до пробного вызова (не больше
+    HR_EDW_MAX_REQUEUES раз).
+    """
+    result = {"unit_id": unit_id, "counts": None}
+    slot = _acquire_unit_slot(task_id, max_parallel_units)
+    if slot is None and slot_waits < UNIT_SLOT_MAX_WAITS:
+        raise self.retry(
+            countdown=_unit_slot_countdown(slot_waits),
+            max_retries=None,
+            kwargs={**self.request.kwargs, "slot_waits": slot_waits + 1},
+        )
+    if slot is None:
+        result["error"] = (
+            f"Подразделение {unit_id} не дождалось очереди параллельной генерации"
+        )
+    else:
+        with _hold_unit_slot(task_id, slot):
+            unavailable_error = _hr_edw_unavailable_error(unit_id)
+            if unavailable_error and hr_requeues < HR_EDW_MAX_REQUEUES:
+                raise self.retry(
+                    countdown=_hr_edw_requeue_countdown(),
+                    max_retries=None,
+                    kwargs={**self.request.kwargs, "hr_requeues": hr_requeues + 1},
                 )
-                notify.is_new = True
-                notify.save(update_fields=["message", "date_created", "is_new"])
+            if unavailable_error:
+                result["error"] = unavailable_error
+            else:
+                try:
+                    result["counts"] = generate_cards_for_unit(
+                        bus_unit_id=unit_id,
+                        period_id=period_id,
+                        task_id=task_id,
+                        dry_run=dry_run,
+                        parallel_units=True,
+                    )
+                except Exception:
+                    logger.error(
+                        f"Ошибка при генерации карт для подразделения {unit_id}"
+                    )
+    progress = ProgressReporter(
+        task_id,
+        units_count,
+        message=progress_message,
+        notify_id=notify_id,
+        action_log=None if dry_run else action_log,
+    )
+    # Счетчики журнала копятся общими для задачи, остаток пишет итоговая задача
+    progress.unit_done(result["counts"])
+    return result
 
-    # notify
-    bus_unit_name = get_organization_name(bus_unit_id)
-    subunits_count = (
-        f" c учетом вложенных {total_counts['units']} подразделений"
-        if with_hierarchy
-        else ""
+
+@app.task(name="camunda.agreement.generate_cards_finish", base=LogErrorsTask)
+def generate_cards_finish(
+    units_results,
+    bus_unit_id,
+    user_perno,
+    task_id,
+    period_id=None,
+    action_log=None,
+    dry_run=False,
+):
+    plans = [] if dry_run else None
+    total_counts, error_list = _collect_units_results(units_results, plans)
+    ProgressReporter(task_id, len(units_results), action_log=action_log).finish()
+    ProgressReporter.complete(task_id)
+    _notify_generation_result(
+        user_perno,
+        bus_unit_id,
+        True,
+        total_counts,
+        error_list,
+        task_id=task_id,
+        plans=plans,
+        period_id=period_id,
     )
-    message = f"""Для орг. единицы "{bus_unit_name}" ({bus_unit_id}) {subunits_count}
+
+
+@app.task(name="camunda.agreement.apply_cards_generation_plan", base=LogErrorsTask)
+def apply_cards_generation_plan(
+    plan_task_id, user_perno, period_id, bus_unit_id, action_log=None
+):
+    """Применить план, рассчитанный generate_cards с dry_run
+
+    План применяется только тем, кто его рассчитал, для тех же периода и
+    подразделения. План удаляется после применения без ошибок; если часть
+    подразделений не применилась, план остается, и повтор пропустит уже
+    примененные действия как конфликты.
+    """
+    try:
+        plans = load_plans(plan_task_id, PlanOwner(user_perno, period_id, bus_unit_id))
+    except PlanOwnerMismatch as e:
+        create_notify(user_perno, str(e))
+        return
+    if plans is None:
+        create_notify(
+            user_perno, f"План генерации {plan_task_id} не найден или устарел"
+        )
+        return
+    if not lock_plans(plan_task_id):
+        create_notify(user_perno, f"План генерации {plan_task_id} уже применяется")
+        return
+
+    total_counts = _empty_total_counts()
+    total_counts["conflicts"] = 0
+    error_list = []
+    failed_units = 0
+    configs = {}
+    Period = apps.get_model("goal.Period")
+    progress = ProgressReporter(plan_task_id, len(plans), action_log=action_log)
+    try:
+        for plan in plans:
+            counts = None
+            try:
+                if plan.period_id not in configs:
+                    configs[plan.period_id] = PeriodGenerationConfig.from_period(
+                        Period.objects.get(id=plan.period_id)
+                    )
+                counts = apply_plan(plan, configs[plan.period_id])
+                _add_unit_counts(total_counts, error_list, plan.business_unit, counts)
+            except Exception as e:
+                logger.error(
+                    f"Ошибка применения плана подразделения {plan.business_unit}: "
+                    f"{type(e), e}"
+                )
+                error_list.append(
+                    "Ошибка при применении плана для подразделения "
+                    f"{plan.business_unit}"
+                )
+                total_counts["errors"] += 1
+                failed_units += 1
+            progress.unit_done(counts)
+        if not failed_units:
+            # План применяется один раз
+            delete_plans(plan_task_id)
+    finally:
+        progress.finish()
+        unlock_plans(plan_task_id)
+    ProgressReporter.complete(plan_task_id)
+    if total_counts["deactivated"] or total_counts["reactivated"]:
+        _dispatch_camunda_outbox()
+    message = f"""Применен план генерации {plan_task_id} для {total_counts['units']} подразделений:
     - Создано: {total_counts['created']} карт
     - Обновлено: {total_counts['updated']} карт
     - Деактивировано (удалено): {total_counts['deactivated']} карт
     - Активировано заново: {total_counts['reactivated']} карт
-    - Проверено: {total_counts['checked']} карт
+    - Пропущено (карты изменены после расчета плана): {total_counts['conflicts']}
     - Ошибок: {total_counts['errors']}"""
     if error_list:
         message += "\n\nОшибки:\n" + "\n".join(error_list[:10])
+    if failed_units:
+        message += f"\n\nПлан {plan_task_id} сохранен, его можно применить повторно"
     create_notify(user_perno, message)
 
 
+def generate_cards_for_unit(
+    bus_unit_id,
+    period_id,
+    task_id,
+    employees=None,
+    dry_run=False,
+    parallel_units=False,
+):
+    """Генерация карт подразделения с повторами
+
+    Повтор продолжает с контрольной точки: уже записанные окна сотрудников
+    не обрабатываются и не учитываются в счетчиках повторно. Сотрудники
+    передаются в попытки снимком: каждая попытка читает свою копию, а не
+    объекты, измененные или прочитанные прошлой попыткой.
+    """
+    if employees is not None and not isinstance(employees, EmployeesSnapshot):
+        employees = EmployeesSnapshot.from_employees(employees)
+    return _generate_cards_for_unit_with_retry(
+        bus_unit_id,
+        period_id,
+        task_id,
+        employees=employees,
+        dry_run=dry_run,
+        parallel_units=parallel_units,
+    )
+
+
 @retry(max_retry=5, backoff=1, retry_on_exceptions=(Exception,))
-def generate_cards_for_unit(bus_unit_id, period_id, task_id, action_log=None):
+def _generate_cards_for_unit_with_retry(
+    bus_unit_id,
+    period_id,
+    task_id,
+    employees=None,
+    dry_run=False,
+    parallel_units=False,
+):
     return _generate_cards_for_unit(
-        bus_unit_id, period_id, task_id, action_log=action_log
+        bus_unit_id,
+        period_id,
+        task_id,
+        employees=employees,
+        dry_run=dry_run,
+        parallel_units=parallel_units,
     )
 
 
 @app.task(name="camunda.agreement.generate_cards_from_state", base=LogErrorsTask)
-def generate_cards_from_state(user_perno, period_id, task_id):
-    states = CardProcedureState.objects.filter(
-        is_generation_enabled=True, period_id=period_id
+def generate_cards_from_state(user_perno, period_id, task_id, max_parallel_units=None):
+    """Генерация карт подразделений с включенной генерацией в настройках
+
+    Подразделения обрабатываются параллельными задачами, итог собирает
+    `generate_cards_from_state_finish`. Ошибка подразделения не прерывает
+    остальные и учитывается в итоге.
+    """
+    units_list = list(
+        CardProcedureState.objects.filter(
+            is_generation_enabled=True, period_id=period_id
+        ).values_list("business_unit", flat=True)
+    )
+    finish = generate_cards_from_state_finish.s(
+        user_perno=user_perno, period_id=period_id, task_id=task_id
     )
+    if not units_list:
+        finish.delay([])
+        return
+    chord(
+        _generation_units(units_list, period_id, task_id, max_parallel_units),
+        finish,
+    ).apply_async()
+
+
+@app.task(
+    name="camunda.agreement.generate_cards_from_state_finish", base=LogErrorsTask
+)
+def generate_cards_from_state_finish(units_results, user_perno, period_id, task_id):
     Period = apps.get_model("goal.Period")
     period = Period.objects.get(id=period_id)
-    total_counts = {
-        "created": 0,
-        "updated": 0,
-        "checked": 0,
-        "errors": 0,
-        "deactivated": 0,
-        "units": 0,
-    }
-    for state in states:
-        counts = generate_cards_for_unit(
-            bus_unit_id=state.business_unit,
-            period_id=state.period_id,
-            task_id=task_id,
-        )
-        for key, value in counts.items():
-            total_counts[key] = total_counts.get(key, 0) + value
-        total_counts["units"] += 1
+    total_counts, _ = _collect_units_results(units_results)
+    units_count = len(units_results)
+    ProgressReporter.complete(task_id)
     create_notify(
         user_perno,
-        f"""В результате ручного запуска генерации карт в {period.period} периоде для {total_counts['units']} подразделений:
+        f"""В результате ручного запуска генерации карт в {period.period} периоде для {units_count} подразделений:
     - Создано: {total_counts['created']} карт
     - Обновлено: {total_counts['updated']} карт
     - Деактивировано (удалено): {total_counts['deactivated']} карт
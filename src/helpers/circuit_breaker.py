@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from src.helpers.exceptions.circuit_breaker import CircuitOpenError
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Настройки по умолчанию, переопределяются CIRCUIT_BREAKER_DEFAULTS и
+# CIRCUIT_BREAKERS[<имя>] в settings
+DEFAULTS = {
+    # Размер скользящего окна последних вызовов
+    "window_size": 20,
+    # Меньше вызовов в окне - решение об открытии не принимается
+    "min_calls": 10,
+    # Доля ошибок и медленных вызовов, при которой цепь открывается
+    "failure_rate_threshold": 0.5,
+    # Вызов дольше бюджета (секунды) считается медленным
+    "latency_budget": 2.0,
+    # Сколько секунд цепь открыта до пробного вызова
+    "open_duration": 30.0,
+}
+
+
+class CircuitBreaker:
+    """Circuit breaker внешней системы
+
+    Считает ошибки и медленные вызовы в скользящем окне. Когда их доля
+    превышает порог, цепь открывается и вызовы сразу отклоняются с
+    CircuitOpenError. Через `open_duration` пропускается один пробный вызов:
+    успех закрывает цепь, ошибка открывает снова.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = DEFAULTS["window_size"],
+        min_calls: int = DEFAULTS["min_calls"],
+        failure_rate_threshold: float = DEFAULTS["failure_rate_threshold"],
+        latency_budget: float = DEFAULTS["latency_budget"],
+        open_duration: float = DEFAULTS["open_duration"],
+        is_failure: Callable[[Exception], bool] = None,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.latency_budget = latency_budget
+        self.open_duration = open_duration
+        self.is_failure = is_failure or (lambda error: True)
+        # (ошибка, медленный, длительность)
+        self._calls = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened_count = 0
+        self.rejected_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if (
+            self._state == OPEN
+            and time.monotonic() - self._opened_at >= self.open_duration
+        ):
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    @property
+    def retry_after(self) -> float:
+        """Через сколько секунд цепь пропустит пробный вызов (0, если не открыта)"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return self._open_remaining()
+
+    def _open_remaining(self) -> float:
+        return max(0.0, self.open_duration - (time.monotonic() - self._opened_at))
+
+    def _acquire(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected_count += 1
+            retry_after = self._open_remaining()
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.opened_count += 1
+
+    def _record(self, failed: bool, duration: float) -> None:
+        slow = duration > self.latency_budget
+        with self._lock:
+            self._calls.append((failed, slow, duration))
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                    self._calls.clear()
+                    self._probe_in_flight = False
+                return
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                bad = sum(
+                    1 for is_failed, is_slow, _ in self._calls if is_failed or is_slow
+                )
+                if bad / len(self._calls) >= self.failure_rate_threshold:
+                    self._open()
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        self._acquire()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record(self.is_failure(e), time.monotonic() - started)
+            raise
+        self._record(False, time.monotonic() - started)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            calls = list(self._calls)
+        durations = sorted(duration for _, _, duration in calls)
+        return {
+            "name": self.name,
+            "state": state,
+            "calls": len(calls),
+            "failure_rate": (
+                sum(1 for is_failed, _, _ in calls if is_failed) / len(calls)
+                if calls
+                else 0.0
+            ),
+            "slow_rate": (
+                sum(1 for _, is_slow, _ in calls if is_slow) / len(calls)
+                if calls
+                else 0.0
+            ),
+            "latency_avg": sum(durations) / len(durations) if durations else 0.0,
+            "latency_p95": (
+                durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+                if durations
+                else 0.0
+            ),
+            "opened_count": self.opened_count,
+            "rejected_count": self.rejected_count,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def _breaker_options(name: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "CIRCUIT_BREAKER_DEFAULTS", None) or {})
+    options.update(defaults)
+    options.update((getattr(settings, "CIRCUIT_BREAKERS", None) or {}).get(name, {}))
+    return options
+
+
+def get_breaker(
+    name: str, is_failure: Optional[Callable[[Exception], bool]] = None, **defaults
+) -> CircuitBreaker:
+    """Circuit breaker процесса для эндпоинта `name`
+
+    `defaults` - настройки эндпоинта, settings.CIRCUIT_BREAKERS[name] важнее.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    name, is_failure=is_failure, **_breaker_options(name, defaults)
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def breakers_metrics() -> Dict[str, Dict[str, Any]]:
+    """Состояние всех circuit breaker процесса"""
+    return {name: breaker.metrics() for name, breaker in list(_breakers.items())}
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
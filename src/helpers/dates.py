@@ -0,0 +1,27 @@
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+
+
+# Одни и те же даты записей повторяются у всех сотрудников подразделения
+DATE_CACHE_SIZE = 4096
+# Символы, которые могут следовать за датой: конец строки или начало времени
+_DATE_TAIL = ("", "T", " ")
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value: str) -> date:
+    """Дата из строки HR EDW
+
+    Поддерживаются форматы `YYYY-MM-DD`, `%Y-%m-%d %H:%M:%S` и
+    `%Y-%m-%dT%H:%M:%S%z`. Дата берется из строки как есть, без перевода
+    в другой часовой пояс, так же как `datetime.strptime(...).date()`.
+    Строки другого вида разбираются через `datetime.fromisoformat`.
+    """
+    if value[4:5] == "-" and value[7:8] == "-" and value[10:11] in _DATE_TAIL:
+        return date.fromisoformat(value[:10])
+    return datetime.fromisoformat(value).date()
+
+
+def parse_optional_date(value: Optional[str]) -> Optional[date]:
+    return parse_date(value) if value else None
@@ -1,2 +1,9 @@
 class NoTask(Exception):
     pass
+
+
+class CamundaHTTPError(Exception):
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+        super().__init__(f"Camunda error: {status_code} | {content}")
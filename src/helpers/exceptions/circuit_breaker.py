@@ -0,0 +1,9 @@
+class CircuitOpenError(Exception):
+    """Вызов отклонен: внешняя система недоступна (circuit breaker открыт)"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(
+            f"Circuit breaker {name} открыт, повтор через {retry_after:.0f} с"
+        )
@@ -0,0 +1,71 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Union
+
+
+JSON_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]]) -> Iterator[Any]:
+    """Инкрементальный разбор JSON-массива верхнего уровня
+
+    Элементы отдаются по одному по мере чтения `chunks` (распакованный снимок
+    ответа HR EDW или `response.iter_content(chunk_size)` при `stream=True`),
+    поэтому в памяти держится только текущий элемент и недочитанный хвост.
+    """
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    started = False
+    finished = False
+
+    def skip_whitespace(pos):
+        while pos < len(buffer) and buffer[pos] in JSON_WHITESPACE:
+            pos += 1
+        return pos
+
+    def drain(is_final):
+        nonlocal position, started, finished
+        while not finished:
+            position = skip_whitespace(position)
+            if position >= len(buffer):
+                return
+            char = buffer[position]
+            if not started:
+                if char != "[":
+                    raise ValueError("Ожидался JSON-массив")
+                started = True
+                position += 1
+            elif char == "]":
+                finished = True
+            elif char == ",":
+                position += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if is_final:
+                        raise
+                    # Элемент еще не дочитан
+                    return
+                if end == len(buffer) and not is_final:
+                    # Число на границе чанка может оказаться недочитанным
+                    return
+                position = end
+                yield item
+
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = utf8_decoder.decode(chunk)
+        buffer = buffer[position:] + chunk
+        position = 0
+        yield from drain(is_final=False)
+        if finished:
+            return
+
+    buffer = buffer[position:] + utf8_decoder.decode(b"", final=True)
+    position = 0
+    yield from drain(is_final=True)
+    if not finished:
+        raise ValueError("JSON-массив не завершен")
@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+from tests.factories.card import EmployeeBonusTypeFactory
+from tests.factories.period import PeriodFactory, PeriodTypeFactory
+
+
+BENCHMARK_OPTION = "--run-benchmarks"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        BENCHMARK_OPTION,
+        action="store_true",
+        default=False,
+        help="Запустить замеры производительности (тесты с меткой benchmark)",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        f"benchmark: замер производительности по времени, запускается с {BENCHMARK_OPTION}",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # Замеры по времени зависят от нагрузки на машину и не входят в обычный прогон
+    if config.getoption(BENCHMARK_OPTION):
+        return
+    skip_benchmark = pytest.mark.skip(reason=f"запускается с {BENCHMARK_OPTION}")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture
+def create_period_settings(request, django_db_setup):
+    """Годовой период 2022 (II) с типами бонусов 9GA1 и 9GF1
+
+    Объекты доступны в тесте как атрибуты: `period_type`, `bonus_type_ga`,
+    `bonus_type_gf` и `period`.
+    """
+    test = request.instance
+    test.period_type = PeriodTypeFactory.create(name="Год")
+    test.bonus_type_ga = EmployeeBonusTypeFactory.create(key="9GA1")
+    test.bonus_type_gf = EmployeeBonusTypeFactory.create(key="9GF1")
+
+    test.period = PeriodFactory.create(
+        year=2022,
+        period="2022 (II)",
+        is_active=True,
+        date_start=datetime.date(year=2022, month=7, day=1),
+        date_end=datetime.date(year=2022, month=12, day=31),
+        cards_generation_end_date=datetime.date(year=2022, month=10, day=1),
+        cards_assessment_end_date=datetime.date(year=2023, month=2, day=28),
+        cards_bonus_payout_date=datetime.date(year=2023, month=3, day=10),
+        worked_days_number=90,
+        period_type=test.period_type,
+    )
+    test.period.bonus_types.set([test.bonus_type_ga, test.bonus_type_gf])
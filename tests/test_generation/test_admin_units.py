@@ -0,0 +1,23 @@
+from src.goal.services.admin_units import AdminUnitsResolver
+
+
+class TestAdminUnitsResolver:
+    def test_units_are_checked_once(self, mocker):
+        has_permissions = mocker.patch(
+            "src.goal.services.admin_units.has_goal_admin_permissions_unit_by_perno",
+            side_effect=lambda unit_id, perno: unit_id != "2",
+        )
+
+        resolver = AdminUnitsResolver("1000001")
+        assert resolver.filter_units(["1", "2", "3", "1"]) == ["1", "3", "1"]
+        assert resolver.filter_units(["3", "2"]) == ["3"]
+        assert has_permissions.call_count == 3
+
+    def test_sysadmin_is_not_checked(self, mocker):
+        has_permissions = mocker.patch(
+            "src.goal.services.admin_units.has_goal_admin_permissions_unit_by_perno"
+        )
+        resolver = AdminUnitsResolver("1000001", is_sysadmin=True)
+
+        assert resolver.filter_units(["1", "2"]) == ["1", "2"]
+        has_permissions.assert_not_called()
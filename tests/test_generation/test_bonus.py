@@ -0,0 +1,196 @@
+import datetime
+import random
+import timeit
+
+import pytest
+
+from src.goal.services.card_generation.bonus import BonusHandler
+from src.goal.services.card_generation.bonus_condition import BonusConditionManager
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.dataclasses import Bonus, HistoricalRecord
+
+
+CONFIG = PeriodGenerationConfig(
+    period_id=1,
+    period_type="Год",
+    date_start=datetime.date(year=2022, month=7, day=1),
+    date_end=datetime.date(year=2022, month=12, day=31),
+    cards_generation_end_date=datetime.date(year=2022, month=10, day=1),
+    cards_bonus_payout_date=datetime.date(year=2023, month=3, day=10),
+    bonus_type_keys=frozenset({"9GA1", "9GF1"}),
+    tc5_units=frozenset({"51047541", "52692242"}),
+    bonus_types_by_key={},
+)
+HIERARCHIES = (
+    "50611734\\\\53822103",
+    "51047541\\\\53822103",
+    "51047541\\\\52692242\\\\53822104",
+)
+
+
+class ReferenceBonusHandler:
+    """Построение периодов бонусов до перехода на один проход, для сравнения"""
+
+    def __init__(self, config):
+        self._config = config
+
+    @staticmethod
+    def have_intersection(dates_1, dates_2):
+        return (dates_1[0] <= dates_2[0] <= dates_1[1]) or (
+            dates_2[0] <= dates_1[0] <= dates_2[1]
+        )
+
+    def find_record_bonus_periods(self, bonus_records, hierarchy_txt):
+        bonus_periods = []
+        bonus_start_dt = bonus_end_dt = bonus_type = None
+        hierarchy_list = hierarchy_txt.split("\\\\")
+        hierarchy_list.reverse()
+        business_unit = hierarchy_list[0]
+        for bonus in bonus_records:
+            if BonusConditionManager(
+                config=self._config, unit_hierarchy=hierarchy_list, bonus_record=bonus
+            ).is_bonus_appropriate():
+                if not bonus_start_dt:
+                    bonus_start_dt, bonus_end_dt = bonus.date_from, bonus.date_to
+                    bonus_type = bonus.bonus_type
+                    continue
+                if bonus.bonus_type != bonus_type:
+                    bonus_periods.append(
+                        {
+                            "start": bonus_start_dt,
+                            "end": bonus_end_dt,
+                            "type": bonus_type,
+                            "business_unit": business_unit,
+                        }
+                    )
+                    bonus_start_dt, bonus_end_dt = bonus.date_from, bonus.date_to
+                    bonus_type = bonus.bonus_type
+                    continue
+                bonus_end_dt = bonus.date_to
+        if bonus_start_dt and bonus_end_dt:
+            bonus_periods.append(
+                {
+                    "start": bonus_start_dt,
+                    "end": bonus_end_dt,
+                    "type": bonus_type,
+                    "business_unit": business_unit,
+                }
+            )
+        return bonus_periods
+
+    def apply_bonus_dates(self, historical_records, card_dates):
+        bonus_periods = []
+        for record in historical_records:
+            for period in self.find_record_bonus_periods(
+                record.bonus, record.hierarchy_txt
+            ):
+                if bonus_periods and bonus_periods[-1]["type"] == period["type"]:
+                    bonus_periods[-1]["end"] = period["end"]
+                    bonus_periods[-1]["business_unit"] = period["business_unit"]
+                else:
+                    bonus_periods.append(period)
+        result_dates = []
+        for period in bonus_periods:
+            if self.have_intersection((period["start"], period["end"]), card_dates):
+                result_dates.append(
+                    {
+                        "start": max(period["start"], card_dates[0]),
+                        "end": min(period["end"], card_dates[1]),
+                        "type": period["type"],
+                        "business_unit": period["business_unit"],
+                    }
+                )
+        return result_dates
+
+
+def day(offset):
+    return datetime.date(year=2022, month=1, day=1) + datetime.timedelta(days=offset)
+
+
+def make_records(rng, records_count, bonuses_count):
+    records = []
+    offset = 0
+    for _ in range(records_count):
+        bonuses = []
+        for _ in range(bonuses_count):
+            length = rng.randint(0, 30)
+            bonuses.append(
+                Bonus(
+                    bonus_type=rng.choice(("9GA1", "9GA1", "9GF1", "9XX1")),
+                    bonus_percent=rng.choice((5, 10, 15, 20)),
+                    date_from=day(offset),
+                    date_to=day(offset + length),
+                )
+            )
+            offset += length + rng.choice((1, 1, 1, 10))
+        records.append(
+            HistoricalRecord(
+                per_no="2000001",
+                date_from=bonuses[0].date_from if bonuses else day(offset),
+                date_to=day(offset),
+                hire_dt=day(0),
+                fire_dt=None,
+                change_reason_type=None,
+                employee_group="2",
+                employee_status="3",
+                employment_rate=1,
+                staff_position_id="50000001",
+                unit="53822103",
+                hierarchy_txt=rng.choice(HIERARCHIES),
+                bonus=tuple(bonuses),
+            )
+        )
+    return records
+
+
+class TestBonusHandler:
+    def test_bonus_periods_match_reference(self):
+        rng = random.Random(11)
+        for _ in range(2000):
+            records = make_records(rng, rng.randint(0, 6), rng.randint(0, 6))
+            start = rng.randint(-30, 400)
+            card_dates = (day(start), day(start + rng.randint(0, 200)))
+
+            assert BonusHandler(CONFIG).apply_bonus_dates(
+                records, card_dates
+            ) == ReferenceBonusHandler(CONFIG).apply_bonus_dates(records, card_dates)
+
+    def test_strategy_is_defined_once_per_hierarchy(self, mocker):
+        define = mocker.spy(BonusConditionManager, "define_current_strategy")
+        records = make_records(random.Random(3), 50, 20)
+
+        BonusHandler(CONFIG).apply_bonus_dates(records, (day(0), day(5000)))
+
+        assert define.call_count == len(
+            {record.hierarchy_txt for record in records}
+        )
+
+    def test_long_bonus_history_matches_reference(self):
+        records = make_records(random.Random(5), 200, 50)
+        card_dates = (day(0), day(20000))
+
+        assert BonusHandler(CONFIG).apply_bonus_dates(
+            records, card_dates
+        ) == ReferenceBonusHandler(CONFIG).apply_bonus_dates(records, card_dates)
+
+    @pytest.mark.benchmark
+    def test_long_bonus_history_is_faster_than_reference(self):
+        records = make_records(random.Random(5), 200, 50)
+        card_dates = (day(0), day(20000))
+        reference = ReferenceBonusHandler(CONFIG)
+
+        handler_time = min(
+            timeit.repeat(
+                lambda: BonusHandler(CONFIG).apply_bonus_dates(records, card_dates),
+                number=3,
+                repeat=3,
+            )
+        )
+        reference_time = min(
+            timeit.repeat(
+                lambda: reference.apply_bonus_dates(records, card_dates),
+                number=3,
+                repeat=3,
+            )
+        )
+        assert handler_time < reference_time
@@ -0,0 +1,152 @@
+import uuid
+from functools import partial
+
+import pytest
+from django.core.cache import cache
+
+from src.goal.models.card import Card
+from src.goal.services.card_generation import service
+from src.goal.services.card_generation.checkpoint import (
+    GenerationCheckpoint,
+    _cards_cache_key,
+    _checkpoint_cache_key,
+    load_checkpoint,
+    save_checkpoint,
+)
+from src.goal.services.card_generation.service import CardGenerationService
+from src.goal.services.card_generation.write_buffer import CardWriteBuffer
+from src.goal.tasks.cards_generation import _generate_cards_for_unit
+from tests.test_generation.test_plan import BUS_UNIT_ID, employee_payload
+
+
+@pytest.mark.django_db
+class TestGenerationCheckpoint:
+    def test_retry_resumes_from_checkpoint(self, create_period_settings, mocker):
+        mocker.patch.object(service, "EMPLOYEES_WINDOW_SIZE", 1)
+        task_id = uuid.uuid4()
+        employees = [employee_payload(f"200000{index}") for index in range(1, 4)]
+
+        generate = CardGenerationService._generate_cards_for_employee
+        processed = []
+
+        def failing_generate(generation_service, employee):
+            processed.append(employee.per_no)
+            if employee.per_no == "2000003" and processed.count("2000003") == 1:
+                raise ConnectionError("HR EDW недоступна")
+            return generate(generation_service, employee)
+
+        mocker.patch.object(
+            CardGenerationService, "_generate_cards_for_employee", failing_generate
+        )
+        with pytest.raises(ConnectionError):
+            _generate_cards_for_unit(
+                BUS_UNIT_ID, self.period.id, task_id, employees=employees
+            )
+        checkpoint = load_checkpoint(task_id, BUS_UNIT_ID, self.period.id)
+        assert checkpoint.processed == 2
+        assert checkpoint.last_perno == "2000002"
+
+        processed.clear()
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID, self.period.id, task_id, employees=employees
+        )
+
+        assert processed == ["2000003"]
+        assert data["created"] == 3
+        assert Card.objects.filter(period=self.period).count() == 3
+        assert load_checkpoint(task_id, BUS_UNIT_ID, self.period.id) is None
+
+    def test_retry_keeps_counts_of_cards_flushed_within_window(
+        self, create_period_settings, mocker
+    ):
+        # Окно больше буфера: карты записываются до конца окна
+        mocker.patch.object(service, "CardWriteBuffer", partial(CardWriteBuffer, 1))
+        task_id = uuid.uuid4()
+        employees = [employee_payload(f"200000{index}") for index in range(1, 4)]
+
+        generate = CardGenerationService._generate_cards_for_employee
+        calls = []
+
+        def failing_generate(generation_service, employee):
+            calls.append(employee.per_no)
+            if employee.per_no == "2000003" and calls.count("2000003") == 1:
+                raise ConnectionError("HR EDW недоступна")
+            return generate(generation_service, employee)
+
+        mocker.patch.object(
+            CardGenerationService, "_generate_cards_for_employee", failing_generate
+        )
+        with pytest.raises(ConnectionError):
+            _generate_cards_for_unit(
+                BUS_UNIT_ID, self.period.id, task_id, employees=employees
+            )
+        checkpoint = load_checkpoint(task_id, BUS_UNIT_ID, self.period.id)
+        assert checkpoint.processed == 2
+        assert checkpoint.results["created"] == 2
+
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID, self.period.id, task_id, employees=employees
+        )
+
+        assert data["created"] == 3
+        assert Card.objects.filter(period=self.period).count() == 3
+
+    def test_changed_employees_restart_unit(self, create_period_settings, mocker):
+        mocker.patch.object(service, "EMPLOYEES_WINDOW_SIZE", 1)
+        task_id = uuid.uuid4()
+        generation_service = CardGenerationService(self.period, task_id)
+        generation_service.generate_cards_for_employees(
+            BUS_UNIT_ID, [employee_payload("2000001")]
+        )
+
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            task_id,
+            employees=[employee_payload("2000002"), employee_payload("2000003")],
+        )
+
+        assert data["created"] == 2
+        assert load_checkpoint(task_id, BUS_UNIT_ID, self.period.id) is None
+
+    def test_employee_cards_are_saved_by_segments(self, create_period_settings):
+        task_id = uuid.uuid4()
+        key = _checkpoint_cache_key(task_id, BUS_UNIT_ID, self.period.id)
+        for segment, per_no in enumerate(("2000001", "2000002"), start=1):
+            save_checkpoint(
+                task_id,
+                BUS_UNIT_ID,
+                self.period.id,
+                GenerationCheckpoint(
+                    processed=segment,
+                    last_perno=per_no,
+                    employee_cards={per_no: [segment]},
+                    cards_segments=segment,
+                ),
+            )
+
+        assert cache.get(_cards_cache_key(key, 1)) == {"2000002": [2]}
+        checkpoint = load_checkpoint(task_id, BUS_UNIT_ID, self.period.id)
+        assert checkpoint.employee_cards == {"2000001": [1], "2000002": [2]}
+
+        # Без части карт продолжать нельзя: деактивация затронула бы их карты
+        cache.delete(_cards_cache_key(key, 0))
+        assert load_checkpoint(task_id, BUS_UNIT_ID, self.period.id) is None
+
+    def test_oversized_checkpoint_is_not_saved(self, create_period_settings, settings):
+        settings.CARDS_GENERATION_CHECKPOINT_MAX_CACHE_SIZE = 10
+        task_id = uuid.uuid4()
+
+        save_checkpoint(
+            task_id,
+            BUS_UNIT_ID,
+            self.period.id,
+            GenerationCheckpoint(
+                processed=1,
+                last_perno="2000001",
+                employee_cards={"2000001": [1]},
+                cards_segments=1,
+            ),
+        )
+
+        assert load_checkpoint(task_id, BUS_UNIT_ID, self.period.id) is None
@@ -0,0 +1,27 @@
+import pytest
+
+from src.goal.services.card_generation.bonus_condition import BonusConditionManager
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.dataclasses import Bonus
+
+
+@pytest.mark.django_db
+class TestPeriodGenerationConfig:
+    def test_config_is_hashable(self, create_period_settings):
+        config = PeriodGenerationConfig.from_period(self.period)
+        assert config == PeriodGenerationConfig.from_period(self.period)
+        assert hash(config) == hash(PeriodGenerationConfig.from_period(self.period))
+        assert config.bonus_type_keys == {"9GA1", "9GF1"}
+        assert config.get_bonus_type("9GA1") == self.bonus_type_ga
+
+    def test_bonus_check_without_queries(
+        self, create_period_settings, django_assert_num_queries
+    ):
+        config = PeriodGenerationConfig.from_period(self.period)
+        with django_assert_num_queries(0):
+            for bonus_percent in (5, 15):
+                assert BonusConditionManager(
+                    config,
+                    ["51047541"],
+                    Bonus("9GA1", bonus_percent, None, None),
+                ).is_bonus_appropriate() == (bonus_percent > 10)
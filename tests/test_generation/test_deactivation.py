@@ -5,8 +5,7 @@ import pytest
 from src.goal.models.card import Card
 from src.goal import tasks
 from src.goal.tasks.cards_generation import _generate_cards_for_unit
-from tests.factories.card import CardNoSignalFactory, EmployeeBonusTypeFactory
-from tests.factories.period import PeriodTypeFactory, PeriodFactory
+from tests.factories.card import CardNoSignalFactory
 
 
 @pytest.fixture
@@ -21,26 +20,6 @@ def mock_get_employees_by_orgstructure(mocker):
 @pytest.mark.django_db
 class TestDeactivation:
 
-    @pytest.fixture
-    def create_period_settings(self, django_db_setup):
-        self.period_type = PeriodTypeFactory.create(name="Год")
-        self.bonus_type_ga = EmployeeBonusTypeFactory.create(key="9GA1")
-        self.bonus_type_gf = EmployeeBonusTypeFactory.create(key="9GF1")
-
-        self.period = PeriodFactory.create(
-            year=2022,
-            period="2022 (II)",
-            is_active=True,
-            date_start=datetime.date(year=2022, month=7, day=1),
-            date_end=datetime.date(year=2022, month=12, day=31),
-            cards_generation_end_date=datetime.date(year=2022, month=10, day=1),
-            cards_assessment_end_date=datetime.date(year=2023, month=2, day=28),
-            cards_bonus_payout_date=datetime.date(year=2023, month=3, day=10),
-            worked_days_number=90,
-            period_type=self.period_type,
-        )
-        self.period.bonus_types.set([self.bonus_type_ga, self.bonus_type_gf])
-
     def test_2047458(self, create_period_settings, mock_get_employees_by_orgstructure):
         """Удаление второстепенных атрибутов у уволенного сотрудника (дублирование записи об увольнении спустя время)"""
         bus_unit_id = "53822103"
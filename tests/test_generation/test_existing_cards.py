@@ -0,0 +1,101 @@
+import datetime
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from src.goal.models.card import Card
+from src.goal.services.card_generation.service import CardGenerationService
+from tests.factories.card import CardNoSignalFactory
+from tests.test_generation.test_plan import employee_payload
+
+
+@pytest.mark.django_db
+class TestExistingCardIndex:
+    bus_unit_id = "53822103"
+
+    def create_cards(self, count):
+        employees = []
+        for index in range(count):
+            perno = str(2000000 + index)
+            CardNoSignalFactory.create(
+                perno=perno,
+                business_unit=self.bus_unit_id,
+                status=Card.APPROVED.key,
+                state=Card.ACTIVE.key,
+                stage=Card.ON_SETTING.key,
+                period=self.period,
+                date_start=datetime.date(year=2022, month=7, day=1),
+                date_end=datetime.date(year=2022, month=12, day=31),
+                bonus_type=self.bonus_type_ga,
+            )
+            employees.append({"per_no": perno})
+        return employees
+
+    def count_lookup_queries(self, employees):
+        service = CardGenerationService(self.period, uuid.uuid4())
+        with CaptureQueriesContext(connection) as context:
+            service.existing_cards.preload(
+                self.bus_unit_id, (employee["per_no"] for employee in employees)
+            )
+            for employee in employees:
+                assert service.existing_cards.get(
+                    employee["per_no"], datetime.date(year=2022, month=7, day=1)
+                )
+        return len(context.captured_queries)
+
+    def test_lookup_queries_do_not_grow_with_employees(self, create_period_settings):
+        employees = self.create_cards(50)
+        assert self.count_lookup_queries(employees[:1]) == self.count_lookup_queries(
+            employees
+        )
+
+    def test_created_card_is_resolved_from_index(self, create_period_settings):
+        service = CardGenerationService(self.period, uuid.uuid4())
+        service.existing_cards.preload(self.bus_unit_id, ["2047458"])
+        card = CardNoSignalFactory.create(
+            perno="2047458",
+            business_unit=self.bus_unit_id,
+            state=Card.ACTIVE.key,
+            period=self.period,
+            date_start=datetime.date(year=2022, month=8, day=1),
+            date_end=datetime.date(year=2022, month=12, day=31),
+            bonus_type=self.bonus_type_ga,
+        )
+        assert (
+            service.existing_cards.get("2047458", datetime.date(year=2022, month=8, day=1))
+            is None
+        )
+        service.existing_cards.add(card)
+        assert (
+            service.existing_cards.get("2047458", datetime.date(year=2022, month=8, day=1))
+            is card
+        )
+
+    def test_int_perno_resolves_cards(self, create_period_settings):
+        self.create_cards(1)
+        service = CardGenerationService(self.period, uuid.uuid4())
+        service.existing_cards.preload(self.bus_unit_id, [2000000])
+
+        card = service.existing_cards.get(
+            2000000, datetime.date(year=2022, month=7, day=1)
+        )
+        assert card is not None
+        assert service.existing_cards.cards_for_perno(2000000) == [card]
+
+    def count_generation_queries(self, employees):
+        service = CardGenerationService(self.period, uuid.uuid4(), incremental=False)
+        payload = [employee_payload(employee["per_no"]) for employee in employees]
+        with CaptureQueriesContext(connection) as context:
+            service.generate_cards_for_employees(self.bus_unit_id, payload)
+        assert service.results["checked"] == len(employees)
+        return len(context.captured_queries)
+
+    def test_generation_queries_do_not_grow_with_employees(
+        self, create_period_settings
+    ):
+        employees = self.create_cards(20)
+        assert self.count_generation_queries(
+            employees[:1]
+        ) == self.count_generation_queries(employees)
@@ -0,0 +1,74 @@
+import datetime
+import random
+
+from src.goal.services.card_generation.dataclasses import HistoricalRecord
+from src.goal.services.card_generation.filter import (
+    FilterEmployee,
+    RecordsIntervalIndex,
+)
+from tests.test_generation.test_timeline import CONFIG
+
+
+def record(date_from, date_to, employment_rate=1):
+    return HistoricalRecord(
+        per_no="2000001",
+        date_from=date_from,
+        date_to=date_to,
+        hire_dt=datetime.date(year=2020, month=1, day=1),
+        fire_dt=None,
+        change_reason_type=None,
+        employee_group="2",
+        employee_status="3",
+        employment_rate=employment_rate,
+        staff_position_id="50000001",
+        unit="53822103",
+        hierarchy_txt="51047541\\\\53822103",
+        bonus=(),
+    )
+
+
+def day(offset):
+    return datetime.date(year=2022, month=1, day=1) + datetime.timedelta(days=offset)
+
+
+class TestRecordsIntervalIndex:
+    def test_overlapping_matches_full_scan(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            records = []
+            for _ in range(rng.randint(1, 12)):
+                start = rng.randint(0, 365)
+                records.append(record(day(start), day(start + rng.randint(0, 200))))
+            index = RecordsIntervalIndex(records)
+
+            for _ in range(5):
+                start = rng.randint(-50, 400)
+                date_start, date_end = day(start), day(start + rng.randint(0, 200))
+                expected = [
+                    item
+                    for item in records
+                    if item.date_from <= date_end and item.date_to >= date_start
+                ]
+                found = index.overlapping(date_start, date_end)
+                assert sorted(map(id, found)) == sorted(map(id, expected))
+
+    def test_bounds_are_inclusive(self):
+        records = [record(day(0), day(9)), record(day(10), day(19))]
+        index = RecordsIntervalIndex(records)
+
+        assert index.overlapping(day(9), day(9)) == records[:1]
+        assert index.overlapping(day(19), day(30)) == records[1:]
+        assert index.overlapping(day(20), day(30)) == []
+
+
+class TestFilterEmployee:
+    def test_filter_checks_records_of_each_card_interval(self):
+        records = [
+            record(day(181), day(240), employment_rate=0),
+            record(day(241), day(364)),
+        ]
+        employee_filter = FilterEmployee(records, CONFIG)
+
+        assert not employee_filter.is_suited({"start": day(181), "end": day(240)})
+        assert employee_filter.is_suited({"start": day(181), "end": day(300)})
+
@@ -0,0 +1,65 @@
+import datetime
+import uuid
+
+import pytest
+
+from src.goal.models.card import Card, EmployeeGenerationFingerprint
+from src.goal.services.card_generation.service import CardGenerationService
+from src.goal.tasks.cards_generation import _generate_cards_for_unit
+from tests.test_generation.test_plan import BUS_UNIT_ID, employee_payload
+
+
+@pytest.mark.django_db
+class TestIncrementalGeneration:
+    @pytest.fixture(autouse=True)
+    def enable_incremental(self, settings):
+        settings.CARDS_GENERATION_INCREMENTAL = True
+
+    def generate(self, employees):
+        return _generate_cards_for_unit(
+            BUS_UNIT_ID, self.period.id, uuid.uuid4(), employees=employees
+        )
+
+    def test_unchanged_employee_is_skipped(self, create_period_settings, mocker):
+        data = self.generate([employee_payload("2000001")])
+        assert data["created"] == 1
+        card = Card.objects.get(period=self.period, perno="2000001")
+        stored = EmployeeGenerationFingerprint.objects.get(
+            period=self.period, perno="2000001"
+        )
+        assert stored.card_ids == [card.pk]
+
+        generate = mocker.spy(CardGenerationService, "_generate_cards_for_employee")
+        data = self.generate([employee_payload("2000001")])
+
+        generate.assert_not_called()
+        assert data["checked"] == 1
+        assert data["created"] == 0
+        card.refresh_from_db()
+        assert card.state == Card.ACTIVE.key
+
+    def test_changed_employee_is_regenerated(self, create_period_settings, mocker):
+        self.generate([employee_payload("2000001")])
+
+        employee = employee_payload("2000001")
+        employee["historical_records"][0]["business_to_dttm"] = (
+            "2022-11-30T00:00:00+03:00"
+        )
+        generate = mocker.spy(CardGenerationService, "_generate_cards_for_employee")
+        data = self.generate([employee])
+
+        generate.assert_called_once()
+        assert data["updated"] == 1
+        card = Card.objects.get(period=self.period, perno="2000001")
+        assert card.date_end == datetime.date(year=2022, month=11, day=30)
+
+    def test_deactivated_card_is_regenerated(self, create_period_settings, mocker):
+        self.generate([employee_payload("2000001")])
+        Card.objects.filter(period=self.period, perno="2000001").update(
+            state=Card.NON_ACTIVE.key
+        )
+
+        generate = mocker.spy(CardGenerationService, "_generate_cards_for_employee")
+        self.generate([employee_payload("2000001")])
+
+        generate.assert_called_once()
@@ -0,0 +1,180 @@
+import time
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from src.goal.models import OrgStructureActionsLog
+from src.goal.tasks.cards_generation import (
+    HR_EDW_MAX_REQUEUES,
+    UNIT_SLOT_MAX_WAITS,
+    _acquire_unit_slot,
+    _hold_unit_slot,
+    generate_cards_finish,
+    generate_cards_from_state_finish,
+    generate_cards_unit,
+)
+from tests.test_generation.test_plan import BUS_UNIT_ID, employee_payload
+
+
+@pytest.mark.django_db
+class TestGenerationFromState:
+    def test_failed_unit_does_not_abort_run(self, create_period_settings, mocker):
+        def get_employees(bus_unit_id, period, bonus_type_keys):
+            if bus_unit_id == "failing":
+                raise ValueError("Некорректный ответ HR EDW")
+            return [employee_payload("2000001")]
+
+        mocker.patch(
+            "src.goal.tasks.cards_generation.get_employees_by_orgstructure",
+            side_effect=get_employees,
+        )
+        create_notify = mocker.patch("src.goal.tasks.cards_generation.create_notify")
+        task_id = str(uuid.uuid4())
+
+        units_results = [
+            generate_cards_unit(unit_id, self.period.id, task_id, units_count=2)
+            for unit_id in ("failing", BUS_UNIT_ID)
+        ]
+        assert units_results[0]["counts"] is None
+        assert units_results[1]["counts"]["created"] == 1
+
+        generate_cards_from_state_finish(
+            units_results, "1000001", self.period.id, task_id
+        )
+
+        message = create_notify.call_args[0][1]
+        assert "для 2 подразделений" in message
+        assert "Создано: 1 карт" in message
+        assert "Ошибок: 1" in message
+
+    def test_unit_waits_for_free_slot(self, create_period_settings, mocker):
+        generate = mocker.patch(
+            "src.goal.tasks.cards_generation.generate_cards_for_unit"
+        )
+        retry = mocker.patch.object(
+            generate_cards_unit, "retry", side_effect=RuntimeError("retry")
+        )
+        task_id = str(uuid.uuid4())
+        assert _acquire_unit_slot(task_id, 1) == 0
+
+        with pytest.raises(RuntimeError):
+            generate_cards_unit(
+                BUS_UNIT_ID, self.period.id, task_id, max_parallel_units=1
+            )
+
+        generate.assert_not_called()
+        retry.assert_called_once()
+        assert retry.call_args.kwargs["kwargs"]["slot_waits"] == 1
+        # Не дождавшись слота, подразделение считается ошибкой
+        result = generate_cards_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            task_id,
+            max_parallel_units=1,
+            slot_waits=UNIT_SLOT_MAX_WAITS,
+        )
+        assert result["error"]
+        retry.assert_called_once()
+        generate.assert_not_called()
+        # Другой задаче слоты этой задачи не мешают
+        generate_cards_unit(
+            BUS_UNIT_ID, self.period.id, str(uuid.uuid4()), max_parallel_units=1
+        )
+        generate.assert_called_once()
+
+    def test_slot_is_extended_while_unit_runs(self, mocker):
+        mocker.patch("src.goal.tasks.cards_generation.UNIT_SLOT_TTL", 1)
+        mocker.patch("src.goal.tasks.cards_generation.UNIT_SLOT_HEARTBEAT", 0.2)
+        task_id = str(uuid.uuid4())
+        slot = _acquire_unit_slot(task_id, 1)
+
+        with _hold_unit_slot(task_id, slot):
+            # Подразделение генерируется дольше таймаута слота
+            time.sleep(1.5)
+            assert _acquire_unit_slot(task_id, 1) is None
+
+        # Слот освобожден и снова доступен
+        assert _acquire_unit_slot(task_id, 1) == slot
+
+    def test_unit_is_requeued_while_hr_edw_is_unavailable(
+        self, create_period_settings, mocker
+    ):
+        mocker.patch(
+            "src.goal.tasks.cards_generation._hr_edw_unavailable_error",
+            return_value="HR EDW недоступна",
+        )
+        generate = mocker.patch(
+            "src.goal.tasks.cards_generation.generate_cards_for_unit"
+        )
+        retry = mocker.patch.object(
+            generate_cards_unit, "retry", side_effect=RuntimeError("retry")
+        )
+        task_id = str(uuid.uuid4())
+
+        with pytest.raises(RuntimeError):
+            generate_cards_unit(
+                BUS_UNIT_ID, self.period.id, task_id, max_parallel_units=1
+            )
+        assert retry.call_args.kwargs["kwargs"]["hr_requeues"] == 1
+
+        # Слот освобожден, после последнего повтора подразделение пропускается
+        result = generate_cards_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            task_id,
+            max_parallel_units=1,
+            hr_requeues=HR_EDW_MAX_REQUEUES,
+        )
+        assert result["error"] == "HR EDW недоступна"
+        generate.assert_not_called()
+
+    def test_action_log_counters_are_written_in_batches(
+        self, create_period_settings, mocker, settings
+    ):
+        settings.ACTION_LOG_FLUSH_UNITS = 3
+        mocker.patch(
+            "src.goal.tasks.cards_generation.generate_cards_for_unit",
+            return_value={"created": 1, "errors": 0},
+        )
+        mocker.patch("src.goal.tasks.cards_generation.create_notify")
+        action_log = OrgStructureActionsLog.objects.create(
+            action_type=OrgStructureActionsLog.GENERATE,
+            initiator_perno="1000001",
+            business_unit=BUS_UNIT_ID,
+            with_hierarchy=True,
+        )
+        task_id = str(uuid.uuid4())
+        units = [str(unit_id) for unit_id in range(53822110, 53822117)]
+
+        with CaptureQueriesContext(connection) as queries:
+            units_results = [
+                generate_cards_unit(
+                    unit_id,
+                    self.period.id,
+                    task_id,
+                    units_count=len(units),
+                    action_log=action_log.id,
+                )
+                for unit_id in units
+            ]
+            generate_cards_finish(
+                units_results,
+                BUS_UNIT_ID,
+                "1000001",
+                task_id,
+                period_id=self.period.id,
+                action_log=action_log.id,
+            )
+
+        updates = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+            and OrgStructureActionsLog._meta.db_table in query["sql"]
+        ]
+        # 7 подразделений: две пачки по 3 и остаток в итоговой задаче
+        assert len(updates) == 3
+        action_log.refresh_from_db()
+        assert action_log.created_count == 7
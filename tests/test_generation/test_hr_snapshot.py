@@ -0,0 +1,107 @@
+import copy
+import uuid
+
+import pytest
+
+from src.goal.services.card_generation.hr_snapshot import (
+    EmployeesSnapshot,
+    load_snapshot,
+    save_snapshot,
+)
+from src.goal.tasks.cards_generation import (
+    _generate_cards_for_unit,
+    generate_cards_for_unit,
+)
+from tests.test_generation.test_plan import BUS_UNIT_ID, employee_payload
+
+
+class TestEmployeesSnapshot:
+    def test_snapshot_is_reiterable(self, tmp_path):
+        employees = [employee_payload("2000001"), employee_payload("2000002")]
+        snapshot = EmployeesSnapshot.from_employees(iter(employees))
+
+        first = list(snapshot)
+        first[0]["historical_records"] = []
+        assert list(snapshot) == employees
+
+        path = tmp_path / "employees.json.gz"
+        snapshot.dump(str(path))
+        assert list(EmployeesSnapshot.from_file(str(path))) == employees
+
+    def test_empty_response(self):
+        assert list(EmployeesSnapshot.from_employees([])) == []
+
+    def test_oversized_snapshot_is_stored_in_file(self, tmp_path, settings):
+        settings.CARDS_GENERATION_SNAPSHOT_MAX_CACHE_SIZE = 10
+        settings.CARDS_GENERATION_SNAPSHOT_DIR = str(tmp_path)
+        employees = [employee_payload("2000001")]
+        task_id = uuid.uuid4()
+
+        save_snapshot(
+            task_id,
+            BUS_UNIT_ID,
+            1,
+            ["9GA1"],
+            EmployeesSnapshot.from_employees(employees),
+        )
+
+        assert len(list(tmp_path.iterdir())) == 1
+        assert list(load_snapshot(task_id, BUS_UNIT_ID, 1, ["9GA1"])) == employees
+
+    def test_oversized_snapshot_without_storage_is_not_cached(self, settings):
+        settings.CARDS_GENERATION_SNAPSHOT_MAX_CACHE_SIZE = 10
+        settings.CARDS_GENERATION_SNAPSHOT_DIR = None
+        task_id = uuid.uuid4()
+
+        save_snapshot(
+            task_id,
+            BUS_UNIT_ID,
+            1,
+            ["9GA1"],
+            EmployeesSnapshot.from_employees([employee_payload("2000001")]),
+        )
+
+        assert load_snapshot(task_id, BUS_UNIT_ID, 1, ["9GA1"]) is None
+
+
+@pytest.mark.django_db
+class TestGenerationSnapshot:
+    def test_rerun_reads_snapshot(self, create_period_settings, mocker):
+        get_employees = mocker.patch(
+            "src.goal.tasks.cards_generation.get_employees_by_orgstructure",
+            return_value=[employee_payload("2000001")],
+        )
+        task_id = uuid.uuid4()
+
+        data = _generate_cards_for_unit(BUS_UNIT_ID, self.period.id, task_id)
+        assert data["created"] == 1
+        _generate_cards_for_unit(BUS_UNIT_ID, self.period.id, task_id, dry_run=True)
+        _generate_cards_for_unit(BUS_UNIT_ID, self.period.id, uuid.uuid4())
+
+        # Повтор задачи читает снимок, другая задача запрашивает HR EDW заново
+        assert get_employees.call_count == 2
+
+    def test_retry_reads_unchanged_employees(self, mocker):
+        employees = [employee_payload("2000001"), employee_payload("2000002")]
+        expected = copy.deepcopy(employees)
+        attempts = []
+
+        def generate(bus_unit_id, period_id, task_id, employees=None, dry_run=False):
+            read = list(employees)
+            attempts.append(copy.deepcopy(read))
+            # Попытка меняет прочитанных сотрудников и падает
+            read[0]["historical_records"].clear()
+            if len(attempts) == 1:
+                raise Exception("generation error")
+            return {"created": len(read)}
+
+        mocker.patch(
+            "src.goal.tasks.cards_generation._generate_cards_for_unit",
+            side_effect=generate,
+        )
+
+        assert generate_cards_for_unit(
+            BUS_UNIT_ID, 1, uuid.uuid4(), employees=iter(employees)
+        ) == {"created": 2}
+        assert attempts == [expected, expected]
+        assert employees == expected
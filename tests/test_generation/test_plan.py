@@ -0,0 +1,156 @@
+import datetime
+import uuid
+
+import pytest
+
+from src.goal.models.card import Card
+from src.goal.models.outbox import CamundaOutboxMessage
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.plan import (
+    GenerationPlan,
+    PlanOwner,
+    apply_plan,
+    load_plans,
+    save_plans,
+)
+from src.goal.tasks.cards_generation import (
+    _generate_cards_for_unit,
+    apply_cards_generation_plan,
+)
+from tests.factories.card import CardNoSignalFactory
+
+
+BUS_UNIT_ID = "53822103"
+
+
+def employee_payload(per_no):
+    return {
+        "per_no": per_no,
+        "historical_records": [
+            {
+                "per_no": per_no,
+                "business_from_dttm": "2022-01-01T00:00:00+03:00",
+                "business_to_dttm": "9999-12-31T00:00:00+03:00",
+                "hire_dt": "2020-01-01",
+                "fire_dt": None,
+                "change_reason_type": None,
+                "position": {
+                    "employee_group": "2",
+                    "employee_status": "3",
+                    "employment_rate": 1,
+                    "staff_position_id": "50000001",
+                },
+                "division": {
+                    "unit": BUS_UNIT_ID,
+                    "hierarchy_txt": f"50611734\\\\{BUS_UNIT_ID}",
+                },
+                "bonus": [
+                    {
+                        "bonus_type": "9GA1",
+                        "bonus_percent": 15,
+                        "business_from_dttm": "2022-01-01 00:00:00",
+                        "business_to_dttm": "9999-12-31 00:00:00",
+                    }
+                ],
+            }
+        ],
+    }
+
+
+@pytest.mark.django_db
+class TestGenerationPlan:
+    def test_dry_run_writes_nothing_and_plan_is_applied(self, create_period_settings):
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            uuid.uuid4(),
+            employees=[employee_payload("2000001")],
+            dry_run=True,
+        )
+        assert data["created"] == 1
+        assert not Card.objects.filter(period=self.period).exists()
+        assert not CamundaOutboxMessage.objects.exists()
+
+        plan = GenerationPlan.from_dict(data["plan"])
+        assert plan.summary()["create"] == 1
+        counts = apply_plan(plan, PeriodGenerationConfig.from_period(self.period))
+
+        assert counts["created"] == 1
+        card = Card.objects.get(period=self.period, perno="2000001")
+        assert card.date_start == datetime.date(year=2022, month=7, day=1)
+        assert card.date_end == datetime.date(year=2022, month=12, day=31)
+        assert card.business_unit == BUS_UNIT_ID
+
+    def test_plan_create_of_existing_card_is_skipped(self, create_period_settings):
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            uuid.uuid4(),
+            employees=[employee_payload("2000001")],
+            dry_run=True,
+        )
+        plan = GenerationPlan.from_dict(data["plan"])
+        config = PeriodGenerationConfig.from_period(self.period)
+        apply_plan(plan, config)
+
+        counts = apply_plan(plan, config)
+
+        assert counts["created"] == 0
+        assert counts["conflicts"] == 1
+        assert Card.objects.filter(period=self.period, perno="2000001").count() == 1
+
+    def test_plan_actions_on_changed_card_are_skipped(self, create_period_settings):
+        card = CardNoSignalFactory.create(
+            perno="2000001",
+            business_unit=BUS_UNIT_ID,
+            state=Card.ACTIVE.key,
+            period=self.period,
+            date_start=datetime.date(year=2022, month=7, day=1),
+            date_end=datetime.date(year=2022, month=12, day=31),
+            bonus_type=self.bonus_type_ga,
+        )
+        plan = GenerationPlan(
+            task_id=str(uuid.uuid4()),
+            period_id=self.period.id,
+            business_unit=BUS_UNIT_ID,
+        )
+        plan.add_deactivate(card, Card.NON_ACTIVE.key, card.date_end)
+        # Карту изменили после расчета плана
+        Card.objects.filter(pk=card.pk).update(
+            date_end=datetime.date(year=2022, month=11, day=30)
+        )
+
+        counts = apply_plan(plan, PeriodGenerationConfig.from_period(self.period))
+
+        assert counts["conflicts"] == 1
+        assert counts["deactivated"] == 0
+        card.refresh_from_db()
+        assert card.state == Card.ACTIVE.key
+        assert not CamundaOutboxMessage.objects.exists()
+
+    def test_plan_is_applied_only_by_its_owner(self, create_period_settings, mocker):
+        create_notify = mocker.patch("src.goal.tasks.cards_generation.create_notify")
+        task_id = str(uuid.uuid4())
+        data = _generate_cards_for_unit(
+            BUS_UNIT_ID,
+            self.period.id,
+            task_id,
+            employees=[employee_payload("2000001")],
+            dry_run=True,
+        )
+        owner = PlanOwner("1000001", self.period.id, BUS_UNIT_ID)
+        save_plans(task_id, [GenerationPlan.from_dict(data["plan"])], owner)
+
+        apply_cards_generation_plan(task_id, "1000002", self.period.id, BUS_UNIT_ID)
+        apply_cards_generation_plan(task_id, "1000001", self.period.id, "50611734")
+
+        assert not Card.objects.filter(period=self.period).exists()
+        assert create_notify.call_count == 2
+
+        apply_cards_generation_plan(
+            task_id, "1000001", str(self.period.id), BUS_UNIT_ID
+        )
+
+        assert Card.objects.filter(period=self.period, perno="2000001").exists()
+        # План применяется один раз
+        assert load_plans(task_id, owner) is None
@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+
+from src.goal.models import Notify, OrgStructureActionsLog
+from src.goal.models.enums import ADMIN_ROLE
+from src.goal.services.progress import ProgressReporter, get_progress
+
+
+@pytest.mark.django_db
+class TestProgressReporter:
+    @pytest.fixture
+    def create_progress_targets(self, django_db_setup):
+        self.notify = Notify.objects.create(
+            perno="1000001", type=ADMIN_ROLE, message="Запущена генерация"
+        )
+        self.action_log = OrgStructureActionsLog.objects.create(
+            action_type=OrgStructureActionsLog.GENERATE,
+            initiator_perno="1000001",
+            business_unit="53822103",
+            with_hierarchy=True,
+        )
+
+    def test_progress_is_throttled_and_counters_are_batched(
+        self, create_progress_targets
+    ):
+        task_id = str(uuid.uuid4())
+        progress = ProgressReporter(
+            task_id,
+            5,
+            message="Запущена генерация",
+            notify_id=self.notify.id,
+            action_log=self.action_log.id,
+            notify_interval=3600,
+            flush_units=2,
+        )
+
+        for _ in range(3):
+            progress.unit_done({"created": 1, "errors": 1})
+        self.notify.refresh_from_db()
+        self.action_log.refresh_from_db()
+        assert self.notify.message.endswith("1/5 (20%)")
+        assert self.action_log.created_count == 2
+        assert get_progress(task_id)["done"] == 3
+
+        for _ in range(2):
+            progress.unit_done({"created": 1, "errors": 1})
+        progress.finish()
+        ProgressReporter.complete(task_id)
+
+        self.notify.refresh_from_db()
+        self.action_log.refresh_from_db()
+        assert self.notify.message.endswith("5/5 (100%)")
+        assert self.action_log.created_count == 5
+        assert self.action_log.errors == 5
+        assert get_progress(task_id) == {
+            "done": 5,
+            "total": 5,
+            "percent": 100,
+            "message": "Запущена генерация",
+            "finished": True,
+        }
+
+    def test_counters_are_flushed_by_interval(self, create_progress_targets, mocker):
+        now = mocker.patch("src.goal.services.progress.time.time", return_value=0.0)
+        progress = ProgressReporter(
+            str(uuid.uuid4()),
+            5,
+            action_log=self.action_log.id,
+            flush_units=50,
+            flush_interval=30,
+        )
+
+        progress.unit_done({"created": 1})
+        self.action_log.refresh_from_db()
+        assert self.action_log.created_count == 0
+
+        now.return_value = 30.0
+        progress.unit_done({"created": 1})
+        self.action_log.refresh_from_db()
+        assert self.action_log.created_count == 2
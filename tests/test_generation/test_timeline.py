@@ -0,0 +1,110 @@
+import datetime
+
+from src.goal.models.card import Card
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.dataclasses import HistoricalRecord
+from src.goal.services.card_generation.timeline import EmployeeTimeline
+
+
+CONFIG = PeriodGenerationConfig(
+    period_id=1,
+    period_type="Год",
+    date_start=datetime.date(year=2022, month=7, day=1),
+    date_end=datetime.date(year=2022, month=12, day=31),
+    cards_generation_end_date=datetime.date(year=2022, month=10, day=1),
+    cards_bonus_payout_date=datetime.date(year=2023, month=3, day=10),
+    bonus_type_keys=frozenset({"9GA1"}),
+    tc5_units=frozenset(),
+    bonus_types_by_key={},
+)
+
+
+def record(
+    date_from,
+    date_to,
+    status="3",
+    hire_dt="2020-01-01",
+    fire_dt=None,
+    staff_position_id="50000001",
+    employee_group="2",
+):
+    return HistoricalRecord.from_dict(
+        {
+            "per_no": "2000001",
+            "business_from_dttm": f"{date_from}T00:00:00+03:00",
+            "business_to_dttm": f"{date_to}T00:00:00+03:00",
+            "hire_dt": hire_dt,
+            "fire_dt": fire_dt,
+            "change_reason_type": None,
+            "position": {
+                "employee_group": employee_group,
+                "employee_status": status,
+                "staff_position_id": staff_position_id,
+            },
+            "division": {"unit": "53822103"},
+        }
+    )
+
+
+class TestEmployeeTimeline:
+    def test_quick_rehire_keeps_hire_date(self):
+        records = [
+            record("2022-01-01", "2022-07-31"),
+            record("2022-08-01", "2022-08-05", status="0", fire_dt="2022-07-31"),
+            record("2022-08-10", "9999-12-31", hire_dt="2022-08-10"),
+        ]
+        timeline = EmployeeTimeline("2000001", records, CONFIG)
+
+        assert timeline.quit_data == []
+        assert records[2].hire_dt == datetime.date(year=2020, month=1, day=1)
+        assert timeline.last_fired_record is records[1]
+        assert timeline.segments == [[records[0], records[1], records[2]]]
+        assert timeline.segments_after_fired == [[records[2]]]
+
+    def test_rehire_after_break_is_quit(self):
+        records = [
+            record("2022-01-01", "2022-07-31"),
+            record("2022-08-01", "2022-09-30", status="0", fire_dt="2022-07-31"),
+            record(
+                "2022-10-01",
+                "9999-12-31",
+                hire_dt="2022-10-01",
+                staff_position_id="50000002",
+            ),
+            record("2022-01-01", "9999-12-31", employee_group="9"),
+        ]
+        timeline = EmployeeTimeline("2000001", records, CONFIG)
+
+        assert timeline.records == records[:3]
+        assert timeline.quit_data == [
+            (datetime.date(year=2022, month=7, day=31), Card.NON_ACTIVE_Q.key)
+        ]
+        assert records[2].hire_dt == datetime.date(year=2022, month=10, day=1)
+        assert not timeline.last_record_fired
+        assert timeline.segments == [[records[0], records[1]], [records[2]]]
+        assert timeline.segments_after_fired == [[records[2]]]
+
+    def test_last_fired_record(self):
+        records = [
+            record("2022-01-01", "2022-09-30"),
+            record("2022-10-01", "9999-12-31", status="0", fire_dt="2022-09-30"),
+        ]
+        timeline = EmployeeTimeline("2000001", records, CONFIG)
+
+        assert timeline.last_record_fired
+        assert timeline.quit_data == [
+            (datetime.date(year=2022, month=9, day=30), Card.NON_ACTIVE_Q.key)
+        ]
+
+
+class TestHistoricalRecord:
+    def test_from_dict_parses_dates(self):
+        parsed = record("2022-01-01", "9999-12-31", fire_dt="2021-12-31")
+
+        assert parsed.date_from == datetime.date(year=2022, month=1, day=1)
+        assert parsed.date_to == datetime.date(year=9999, month=12, day=31)
+        assert parsed.hire_dt == datetime.date(year=2020, month=1, day=1)
+        assert parsed.fire_dt == datetime.date(year=2021, month=12, day=31)
+        assert parsed.employment_rate is None
+        assert parsed.bonus == ()
+        assert not hasattr(parsed, "__dict__")
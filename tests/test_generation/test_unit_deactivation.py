@@ -0,0 +1,251 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from src.goal.models.card import (
+    Card,
+    CardApprovalHistory,
+    CardsAssessment,
+    CardsStageHistory,
+)
+from src.goal.models.outbox import CamundaOutboxMessage
+from src.goal.services.camunda_outbox import START_PROCESS_MESSAGE, dispatch_pending
+from src.goal.services.card_generation.card_deactivate_manager import (
+    EmployeeCardDeactivateManager,
+    UnitCardDeactivateManager,
+)
+from src.goal.services.card_generation.config import PeriodGenerationConfig
+from src.goal.services.card_generation.existing_card_manager import (
+    ExistingCardManager,
+)
+from src.goal.services.card_generation.existing_cards import ExistingCardIndex
+from tests.factories.card import CardNoSignalFactory
+
+
+@pytest.mark.django_db
+class TestUnitDeactivation:
+    bus_unit_id = "53822103"
+
+    def create_card(self, perno, status):
+        card = CardNoSignalFactory.create(
+            perno=perno,
+            business_unit=self.bus_unit_id,
+            status=status,
+            state=Card.ACTIVE.key,
+            stage=Card.ON_SETTING.key,
+            period=self.period,
+            date_start=datetime.date(year=2022, month=7, day=1),
+            date_end=datetime.date(year=2022, month=12, day=31),
+            bonus_type=self.bonus_type_ga,
+        )
+        CardsAssessment.objects.create(card=card)
+        CardApprovalHistory.objects.create(card=card, perno="1000001", role="manager")
+        return card
+
+    def test_bulk_deactivation_enqueues_messages(self, create_period_settings):
+        kept = self.create_card("2000001", Card.IN_WORK.key)
+        approved = self.create_card("2000002", Card.APPROVED.key)
+        in_work = self.create_card("2000003", Card.IN_WORK.key)
+
+        manager = UnitCardDeactivateManager(
+            PeriodGenerationConfig.from_period(self.period)
+        )
+        manager.check_cards_for_deactivation([kept.pk], self.bus_unit_id)
+
+        assert manager.deactivated_cards_counter == 2
+        assert manager.deactivation_errors_counter == 0
+        states = dict(
+            Card.objects.filter(period=self.period).values_list("pk", "state")
+        )
+        assert states == {
+            kept.pk: Card.ACTIVE.key,
+            approved.pk: Card.NON_ACTIVE.key,
+            in_work.pk: Card.NON_ACTIVE.key,
+        }
+        # Утвержденная постановка деактивируется без сообщения в Camunda
+        assert list(
+            CamundaOutboxMessage.objects.values_list("business_key", "message_name")
+        ) == [(f"cardAgreement_{in_work.pk}", f"CardDeactivate-{in_work.pk}")]
+        assert set(
+            CardApprovalHistory.objects.values_list("card_id", flat=True)
+        ) == {kept.pk, approved.pk}
+
+    def test_repeated_deactivation_is_not_enqueued_twice(
+        self, create_period_settings
+    ):
+        card = self.create_card("2000001", Card.IN_WORK.key)
+        manager = UnitCardDeactivateManager(
+            PeriodGenerationConfig.from_period(self.period)
+        )
+        manager.deactivate_cards([(card, Card.NON_ACTIVE_Q.key, card.date_end)])
+        manager.deactivate_cards([(card, Card.NON_ACTIVE_Q.key, card.date_end)])
+
+        assert CamundaOutboxMessage.objects.count() == 1
+
+    def test_invalid_card_does_not_fail_batch(self, create_period_settings):
+        valid = self.create_card("2000001", Card.IN_WORK.key)
+        invalid = self.create_card("2000002", Card.IN_WORK.key)
+        # Дата окончания за пределами периода
+        invalid_date_end = datetime.date(year=2023, month=1, day=31)
+        manager = UnitCardDeactivateManager(
+            PeriodGenerationConfig.from_period(self.period)
+        )
+
+        deactivated, errors = manager.deactivate_cards(
+            [
+                (valid, Card.NON_ACTIVE.key, valid.date_end),
+                (invalid, Card.NON_ACTIVE.key, invalid_date_end),
+            ]
+        )
+
+        assert (deactivated, errors) == (1, 1)
+        assert invalid.state == Card.ACTIVE.key
+        states = dict(
+            Card.objects.filter(period=self.period).values_list("pk", "state")
+        )
+        assert states == {valid.pk: Card.NON_ACTIVE.key, invalid.pk: Card.ACTIVE.key}
+
+    def test_failed_batch_falls_back_to_card_deactivation(
+        self, create_period_settings, mocker
+    ):
+        cards = [
+            self.create_card("2000001", Card.IN_WORK.key),
+            self.create_card("2000002", Card.IN_WORK.key),
+        ]
+        mocker.patch.object(
+            Card.objects, "bulk_update", side_effect=Exception("bulk error")
+        )
+        manager = UnitCardDeactivateManager(
+            PeriodGenerationConfig.from_period(self.period)
+        )
+
+        deactivated, errors = manager.deactivate_cards(
+            [(card, Card.NON_ACTIVE.key, card.date_end) for card in cards]
+        )
+
+        assert (deactivated, errors) == (2, 0)
+        assert set(
+            Card.objects.filter(period=self.period).values_list("state", flat=True)
+        ) == {Card.NON_ACTIVE.key}
+        assert CamundaOutboxMessage.objects.count() == 2
+
+    def test_card_changed_by_other_unit_is_not_deactivated(
+        self, create_period_settings
+    ):
+        card = self.create_card("2000001", Card.IN_WORK.key)
+        existing_cards = ExistingCardIndex(self.period)
+        existing_cards.preload(self.bus_unit_id, ["2000001"])
+        # Сотрудник есть и в другом подразделении, его генерация уже изменила карту
+        Card.objects.filter(pk=card.pk).update(
+            date_end=datetime.date(year=2022, month=11, day=30)
+        )
+        manager = EmployeeCardDeactivateManager(
+            PeriodGenerationConfig.from_period(self.period),
+            existing_cards,
+            check_unchanged=True,
+        )
+
+        manager.check_cards_for_deactivation("2000001", None)
+
+        assert manager.deactivated_cards_counter == 0
+        assert manager.deactivation_errors_counter == 0
+        card.refresh_from_db()
+        assert card.state == Card.ACTIVE.key
+        assert not CamundaOutboxMessage.objects.exists()
+
+    def deactivate_and_reactivate(self, mocker, before_reactivation=None):
+        card = self.create_card("2000001", Card.IN_WORK.key)
+        CardsStageHistory.objects.create(
+            card=card, stage=Card.ON_SETTING.key, start_dt=timezone.now()
+        )
+        config = PeriodGenerationConfig.from_period(self.period)
+        UnitCardDeactivateManager(config).deactivate_cards(
+            [(card, Card.NON_ACTIVE.key, card.date_end)]
+        )
+        if before_reactivation:
+            before_reactivation()
+        start_process = mocker.patch("src.goal.services.camunda_outbox.start_process")
+        reactivated = ExistingCardManager(card, config).reactivate_card()
+        return card, reactivated, start_process
+
+    def test_reactivation_cancels_queued_deactivation(
+        self, create_period_settings, mocker
+    ):
+        card, reactivated, start_process = self.deactivate_and_reactivate(mocker)
+
+        assert reactivated
+        # Процесс запускается из очереди, запись о запуске сохранена вместе с картой
+        start_process.assert_not_called()
+        send_message = mocker.patch("src.goal.integrations.camunda.send_message")
+        assert dispatch_pending() == {"sent": 1, "retried": 0, "failed": 0}
+        # Сообщение о деактивации не завершит запущенный заново процесс
+        send_message.assert_not_called()
+        start_process.assert_called_once()
+        assert start_process.call_args.args[0].pk == card.pk
+        assert (
+            CamundaOutboxMessage.objects.exclude(message_name=START_PROCESS_MESSAGE)
+            .get()
+            .status
+            == CamundaOutboxMessage.CANCELLED
+        )
+        card.refresh_from_db()
+        assert card.state == Card.ACTIVE.key
+
+    def test_process_is_not_started_for_card_deactivated_again(
+        self, create_period_settings, mocker
+    ):
+        card, reactivated, start_process = self.deactivate_and_reactivate(mocker)
+        Card.objects.filter(pk=card.pk).update(state=Card.NON_ACTIVE.key)
+        mocker.patch("src.goal.integrations.camunda.send_message")
+
+        dispatch_pending()
+
+        assert reactivated
+        start_process.assert_not_called()
+        assert (
+            CamundaOutboxMessage.objects.get(message_name=START_PROCESS_MESSAGE).status
+            == CamundaOutboxMessage.SENT
+        )
+
+    def test_reactivation_waits_for_deactivation_being_sent(
+        self, create_period_settings, mocker
+    ):
+        def claim_message():
+            CamundaOutboxMessage.objects.update(
+                status=CamundaOutboxMessage.SENDING,
+                next_attempt_dttm=timezone.now() + datetime.timedelta(minutes=5),
+            )
+
+        card, reactivated, start_process = self.deactivate_and_reactivate(
+            mocker, before_reactivation=claim_message
+        )
+
+        assert not reactivated
+        start_process.assert_not_called()
+        card.refresh_from_db()
+        assert card.state == Card.NON_ACTIVE.key
+        assert (
+            CamundaOutboxMessage.objects.get().status == CamundaOutboxMessage.SENDING
+        )
+
+    def test_reactivation_is_skipped_while_camunda_is_unavailable(
+        self, create_period_settings, mocker
+    ):
+        def open_breaker():
+            mocker.patch(
+                "src.goal.services.card_generation.existing_card_manager"
+                ".get_camunda_breaker"
+            ).return_value.is_open = True
+
+        card, reactivated, start_process = self.deactivate_and_reactivate(
+            mocker, before_reactivation=open_breaker
+        )
+
+        assert not reactivated
+        start_process.assert_not_called()
+        card.refresh_from_db()
+        assert card.state == Card.NON_ACTIVE.key
+        assert (
+            CamundaOutboxMessage.objects.get().status == CamundaOutboxMessage.PENDING
+        )
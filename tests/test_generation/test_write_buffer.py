@@ -0,0 +1,69 @@
+import datetime
+import uuid
+
+import pytest
+
+from src.goal.models.card import Card
+from src.goal.services.card_generation.consts import CardActivity
+from src.goal.services.card_generation.service import CardGenerationService
+from tests.factories.card import CardNoSignalFactory
+
+
+@pytest.mark.django_db
+class TestCardWriteBuffer:
+    bus_unit_id = "53822103"
+
+    def new_card(self, service, perno, date_end):
+        return Card(
+            perno=perno,
+            business_unit=self.bus_unit_id,
+            bonus_type=self.bonus_type_ga,
+            period=self.period,
+            date_start=datetime.date(year=2022, month=7, day=1),
+            date_end=date_end,
+            generation_task_id=service.task_id,
+        )
+
+    def test_flush_counts_created_and_invalid_cards(self, create_period_settings):
+        service = CardGenerationService(self.period, uuid.uuid4())
+        for perno in ("2000001", "2000002"):
+            card = self.new_card(service, perno, datetime.date(2022, 12, 31))
+            service.write_buffer.create(card)
+            service.existing_cards.add(card)
+        # date_end outside of the period
+        invalid_card = self.new_card(service, "2000003", datetime.date(2023, 1, 31))
+        service.write_buffer.create(invalid_card)
+        service.existing_cards.add(invalid_card)
+
+        service.flush_writes()
+
+        assert service.results[CardActivity.created.value] == 2
+        assert service.results[CardActivity.errors.value] == 1
+        assert Card.objects.filter(period=self.period).count() == 2
+        assert all(service.employee_cards[perno] for perno in ("2000001", "2000002"))
+        assert (
+            service.existing_cards.get("2000003", datetime.date(2022, 7, 1)) is None
+        )
+
+    def test_flush_writes_buffered_updates(self, create_period_settings):
+        card = CardNoSignalFactory.create(
+            perno="2000001",
+            business_unit=self.bus_unit_id,
+            status=Card.APPROVED.key,
+            state=Card.ACTIVE.key,
+            period=self.period,
+            date_start=datetime.date(year=2022, month=7, day=1),
+            date_end=datetime.date(year=2022, month=12, day=31),
+            bonus_type=self.bonus_type_ga,
+        )
+        service = CardGenerationService(self.period, uuid.uuid4())
+        card.date_end = datetime.date(year=2022, month=11, day=30)
+        service.write_buffer.update(card, ["date_end"], CardActivity.updated.value)
+        service.results[CardActivity.updated.value] += 1
+
+        service.flush_writes()
+
+        card.refresh_from_db()
+        assert card.date_end == datetime.date(year=2022, month=11, day=30)
+        assert service.results[CardActivity.updated.value] == 1
+        assert service.results[CardActivity.errors.value] == 0
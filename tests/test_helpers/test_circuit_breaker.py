@@ -0,0 +1,109 @@
+import pytest
+
+from src.helpers import circuit_breaker
+from src.helpers.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from src.helpers.exceptions.circuit_breaker import CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def failing():
+    raise ConnectionError("unavailable")
+
+
+class TestCircuitBreaker:
+    def make_breaker(self, **kwargs):
+        options = {
+            "window_size": 4,
+            "min_calls": 4,
+            "failure_rate_threshold": 0.5,
+            "latency_budget": 1.0,
+            "open_duration": 10.0,
+        }
+        options.update(kwargs)
+        return CircuitBreaker("test", **options)
+
+    def test_opens_on_error_rate_and_rejects(self, clock):
+        breaker = self.make_breaker()
+        breaker.call(lambda: None)
+        breaker.call(lambda: None)
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                breaker.call(failing)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: None)
+        assert breaker.metrics()["rejected_count"] == 1
+
+    def test_slow_calls_count_against_latency_budget(self, clock):
+        breaker = self.make_breaker()
+
+        def slow():
+            clock.now += 2
+
+        for _ in range(4):
+            breaker.call(slow)
+
+        assert breaker.state == OPEN
+        assert breaker.metrics()["slow_rate"] == 1.0
+
+    def test_probe_after_open_duration(self, clock):
+        breaker = self.make_breaker(min_calls=1, window_size=1)
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+        assert breaker.state == OPEN
+
+        clock.now += 10
+        assert breaker.state == HALF_OPEN
+        breaker.call(lambda: None)
+        assert breaker.state == CLOSED
+
+    def test_retry_after(self, clock):
+        breaker = self.make_breaker(min_calls=1, window_size=1)
+        assert breaker.retry_after == 0
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+
+        clock.now += 4
+        assert breaker.retry_after == 6
+        clock.now += 6
+        assert breaker.retry_after == 0
+
+    def test_failed_probe_opens_again(self, clock):
+        breaker = self.make_breaker(min_calls=1, window_size=1)
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+        clock.now += 10
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+
+        assert breaker.state == OPEN
+        assert breaker.metrics()["opened_count"] == 2
+
+    def test_not_failures_do_not_open(self, clock):
+        breaker = self.make_breaker(
+            is_failure=lambda error: not isinstance(error, ValueError)
+        )
+
+        def invalid():
+            raise ValueError("bad request")
+
+        for _ in range(4):
+            with pytest.raises(ValueError):
+                breaker.call(invalid)
+
+        assert breaker.state == CLOSED
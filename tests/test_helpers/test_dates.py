@@ -0,0 +1,67 @@
+import datetime
+import timeit
+
+import pytest
+
+from src.helpers.dates import parse_date, parse_optional_date
+
+
+RECORD_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+BONUS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def record_dttm(day):
+    return day.strftime("%Y-%m-%dT00:00:00+03:00")
+
+
+@pytest.mark.parametrize(
+    "value, fmt",
+    [
+        ("2022-07-01T00:00:00+03:00", RECORD_FORMAT),
+        ("2022-12-31T23:59:59-05:00", RECORD_FORMAT),
+        ("9999-12-31T00:00:00+03:00", RECORD_FORMAT),
+        ("2022-07-01 00:00:00", BONUS_FORMAT),
+        ("2020-02-29", "%Y-%m-%d"),
+    ],
+)
+def test_parse_date_matches_strptime(value, fmt):
+    assert parse_date(value) == datetime.datetime.strptime(value, fmt).date()
+
+
+@pytest.mark.parametrize(
+    "value", ["", "2022-13-01T00:00:00+03:00", "2022-02-30", "01.07.2022"]
+)
+def test_parse_date_rejects_invalid_dates(value):
+    with pytest.raises(ValueError):
+        parse_date(value)
+
+
+def test_parse_optional_date():
+    assert parse_optional_date(None) is None
+    assert parse_optional_date("") is None
+    assert parse_optional_date("2020-01-01") == datetime.date(
+        year=2020, month=1, day=1
+    )
+
+
+@pytest.mark.benchmark
+def test_parse_date_is_faster_than_strptime():
+    # Даты записей за год, которые повторяются у сотрудников подразделения
+    start = datetime.date(year=2022, month=1, day=1)
+    values = [
+        record_dttm(start + datetime.timedelta(days=index % 365))
+        for index in range(20000)
+    ]
+    parse_date.cache_clear()
+
+    def parse_strptime():
+        for value in values:
+            datetime.datetime.strptime(value, RECORD_FORMAT).date()
+
+    def parse_fast():
+        for value in values:
+            parse_date(value)
+
+    strptime_time = min(timeit.repeat(parse_strptime, number=1, repeat=3))
+    fast_time = min(timeit.repeat(parse_fast, number=1, repeat=3))
+    assert fast_time * 5 < strptime_time
@@ -0,0 +1,93 @@
+import json
+import tracemalloc
+
+import pytest
+
+from src.helpers.json_stream import iter_json_array
+
+
+EMPLOYEES_COUNT = 20000
+CHUNK_SIZE = 64 * 1024
+
+
+def employee_payload(per_no):
+    record = {
+        "per_no": per_no,
+        "business_from_dttm": "2022-07-01T00:00:00+03:00",
+        "business_to_dttm": "2022-12-31T00:00:00+03:00",
+        "hire_dt": "2020-01-01",
+        "fire_dt": None,
+        "change_reason_type": None,
+        "position": {
+            "employee_group": "2",
+            "employee_status": "3",
+            "employment_rate": 1,
+            "staff_position_id": "50000001",
+        },
+        "division": {"unit": "53822103", "hierarchy_txt": "50611734\\\\53822103"},
+        "bonus": [
+            {
+                "bonus_type": "9GA1",
+                "bonus_percent": 15,
+                "business_from_dttm": "2022-07-01 00:00:00",
+                "business_to_dttm": "2022-12-31 00:00:00",
+            }
+        ],
+    }
+    return {"per_no": per_no, "historical_records": [record] * 3}
+
+
+def response_chunks(count):
+    """Тело ответа HR EDW, отдаваемое кусками, как iter_content"""
+    template = json.dumps(employee_payload("{per_no}"))
+    buffer = "["
+    for index in range(count):
+        if index:
+            buffer += ","
+        buffer += template.replace("{per_no}", str(2000000 + index))
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer[:CHUNK_SIZE].encode()
+            buffer = buffer[CHUNK_SIZE:]
+    yield (buffer + "]").encode()
+
+
+def measure_peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_json_array_splits_items_on_any_boundary(chunk_size):
+    data = [employee_payload(str(index)) for index in range(5)] + [12345, "]", 7]
+    raw = json.dumps(data, ensure_ascii=False).encode()
+    chunks = (raw[i : i + chunk_size] for i in range(0, len(raw), chunk_size))
+    assert list(iter_json_array(chunks)) == data
+
+
+def test_iter_json_array_raises_on_truncated_body():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"per_no": "1"}, {"per_no"']))
+
+
+def test_streaming_peak_memory_is_bounded_by_one_employee():
+    def consume_stream():
+        count = 0
+        for employee in iter_json_array(response_chunks(EMPLOYEES_COUNT)):
+            count += 1
+        assert count == EMPLOYEES_COUNT
+
+    def consume_whole_body():
+        employees = json.loads(b"".join(response_chunks(EMPLOYEES_COUNT)))
+        assert len(employees) == EMPLOYEES_COUNT
+
+    stream_peak = measure_peak(consume_stream)
+    whole_body_peak = measure_peak(consume_whole_body)
+
+    employee_size = len(json.dumps(employee_payload("2000000")))
+    # Несколько чанков (в т.ч. в генераторе ответа) и один сотрудник, а не весь ответ
+    assert stream_peak < 8 * CHUNK_SIZE + 20 * employee_size
+    assert stream_peak * 50 < whole_body_peak
@@ -0,0 +1,59 @@
+import pytest
+
+from src.goal.integrations import camunda
+from src.helpers.circuit_breaker import reset_breakers
+from src.helpers.exceptions.camunda import CamundaHTTPError
+from src.helpers.exceptions.circuit_breaker import CircuitOpenError
+
+
+@pytest.fixture
+def camunda_client(settings, monkeypatch):
+    settings.CAMUNDA_URL = "http://camunda.local"
+    settings.CAMUNDA_TIMEOUTS = {"message": 2}
+    monkeypatch.setenv("CAMUNDA_LOGINPASSWORD_BASE64", "login:password")
+    monkeypatch.setattr(camunda, "_client", None)
+    reset_breakers()
+    yield
+    if camunda._client is not None:
+        camunda._client.close()
+    monkeypatch.setattr(camunda, "_client", None)
+    reset_breakers()
+
+
+class TestCamundaClient:
+    def test_requests_share_session_and_auth(self, camunda_client, mocker):
+        response = mocker.Mock(status_code=204, content=b"")
+        request = mocker.patch("requests.Session.request", return_value=response)
+        b64encode = mocker.spy(camunda.base64, "b64encode")
+
+        camunda.send_message(business_key="cardAgreement_1", message_name="m-1")
+        camunda.send_message(business_key="cardAgreement_2", message_name="m-2")
+
+        assert request.call_count == 2
+        assert b64encode.call_count == 1
+        client = camunda.get_client()
+        assert client.session.headers["Authorization"].startswith("Basic ")
+        _, kwargs = request.call_args
+        assert kwargs["url"] == "http://camunda.local/engine-rest/message"
+        assert kwargs["timeout"] == 2
+
+    def test_error_status_raises(self, camunda_client, mocker):
+        response = mocker.Mock(status_code=500, content=b"error")
+        mocker.patch("requests.Session.request", return_value=response)
+
+        with pytest.raises(Exception, match="Camunda error: 500"):
+            camunda.send_message(business_key="cardAgreement_1", message_name="m-1")
+
+    def test_open_circuit_fails_fast(self, camunda_client, mocker, settings):
+        settings.CIRCUIT_BREAKERS = {"camunda.message": {"min_calls": 2}}
+        response = mocker.Mock(status_code=503, content=b"unavailable")
+        request = mocker.patch("requests.Session.request", return_value=response)
+
+        for _ in range(2):
+            with pytest.raises(CamundaHTTPError):
+                camunda.send_message(business_key="cardAgreement_1", message_name="m")
+        with pytest.raises(CircuitOpenError):
+            camunda.send_message(business_key="cardAgreement_1", message_name="m")
+
+        assert request.call_count == 2
+        assert camunda.get_camunda_breaker("message").metrics()["state"] == "open"
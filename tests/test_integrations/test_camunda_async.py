@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from src.goal.integrations.camunda_async import CamundaCall, dispatch_calls
+
+
+class TestDispatchCalls:
+    def test_results_are_returned_per_call(self):
+        def start(key):
+            if key == 2:
+                raise ConnectionError("camunda is unavailable")
+            return {"id": key}
+
+        results = dispatch_calls(
+            (CamundaCall(key, start, (key,)) for key in range(4)), concurrency=2
+        )
+
+        assert [result.key for result in results] == [0, 1, 2, 3]
+        assert [result.ok for result in results] == [True, True, False, True]
+        assert results[0].result == {"id": 0}
+        assert isinstance(results[2].error, ConnectionError)
+
+    @pytest.mark.parametrize("concurrency", [1, 3])
+    def test_concurrency_is_bounded(self, concurrency):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def send(key):
+            with lock:
+                running.append(key)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(key)
+
+        dispatch_calls(
+            (CamundaCall(key, send, (key,)) for key in range(10)),
+            concurrency=concurrency,
+        )
+
+        assert max(peak) == concurrency
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from src.goal.models.outbox import CamundaOutboxMessage
+from src.goal.services import camunda_outbox
+from src.goal.services.camunda_outbox import (
+    dispatch_pending,
+    enqueue_messages,
+    outbox_message,
+)
+
+
+@pytest.mark.django_db
+class TestCamundaOutbox:
+    def test_messages_are_sent_and_failures_retried(self, mocker):
+        enqueue_messages(
+            outbox_message(f"cardAgreement_{pk}", f"CardDeactivate-{pk}")
+            for pk in (1, 2)
+        )
+
+        def send_message(business_key, message_name, variables=None):
+            if business_key == "cardAgreement_2":
+                raise ConnectionError("camunda is unavailable")
+
+        send_message = mocker.patch(
+            "src.goal.integrations.camunda.send_message", side_effect=send_message
+        )
+        counts = dispatch_pending()
+
+        assert counts == {"sent": 1, "retried": 1, "failed": 0}
+        assert send_message.call_count == 2
+        statuses = dict(
+            CamundaOutboxMessage.objects.values_list("business_key", "status")
+        )
+        assert statuses == {
+            "cardAgreement_1": CamundaOutboxMessage.SENT,
+            "cardAgreement_2": CamundaOutboxMessage.PENDING,
+        }
+        retried = CamundaOutboxMessage.objects.get(business_key="cardAgreement_2")
+        assert retried.attempts == 1
+        assert "camunda is unavailable" in retried.last_error
+
+        # Повтор отложен, до его времени сообщение не отправляется
+        assert dispatch_pending() == {"sent": 0, "retried": 0, "failed": 0}
+
+    def test_message_fails_after_max_attempts(self, mocker, settings):
+        settings.CAMUNDA_OUTBOX_MAX_ATTEMPTS = 1
+        enqueue_messages([outbox_message("cardAgreement_1", "CardDeactivate-1")])
+        mocker.patch(
+            "src.goal.integrations.camunda.send_message",
+            side_effect=ConnectionError("camunda is unavailable"),
+        )
+
+        assert dispatch_pending() == {"sent": 0, "retried": 0, "failed": 1}
+        assert (
+            CamundaOutboxMessage.objects.get().status == CamundaOutboxMessage.FAILED
+        )
+
+    def test_message_sent_before_crash_is_reclaimed_after_lease(self, mocker):
+        enqueue_messages([outbox_message("cardAgreement_1", "CardDeactivate-1")])
+        send_message = mocker.patch("src.goal.integrations.camunda.send_message")
+        mocker.patch.object(
+            camunda_outbox, "_record_results", side_effect=RuntimeError("worker lost")
+        )
+        with pytest.raises(RuntimeError):
+            dispatch_pending()
+
+        # Отправка шла вне транзакции: сообщение осталось забранным, не откатилось
+        message = CamundaOutboxMessage.objects.get()
+        assert message.status == CamundaOutboxMessage.SENDING
+        assert message.attempts == 1
+        assert send_message.call_count == 1
+        mocker.stopall()
+        assert dispatch_pending() == {"sent": 0, "retried": 0, "failed": 0}
+
+        CamundaOutboxMessage.objects.update(
+            next_attempt_dttm=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        mocker.patch(
+            "src.goal.integrations.camunda.send_message",
+            side_effect=Exception("MismatchingMessageCorrelationException"),
+        )
+        assert dispatch_pending() == {"sent": 1, "retried": 0, "failed": 0}
+        assert CamundaOutboxMessage.objects.get().attempts == 2
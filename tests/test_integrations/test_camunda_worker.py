@@ -0,0 +1,65 @@
+import pytest
+
+from src.goal.integrations.camunda_worker import ExternalTaskWorker
+from src.helpers.exceptions.camunda import NoTask
+
+
+class TestExternalTaskWorker:
+    @pytest.fixture
+    def camunda(self, mocker):
+        return mocker.patch("src.goal.integrations.camunda_worker.camunda")
+
+    def test_tasks_are_finished_and_failures_reported(self, camunda, settings):
+        settings.CAMUNDA_TASK_BATCH = 10
+        tasks = [{"id": "ok", "retries": None}, {"id": "bad", "retries": 2}]
+
+        def handler(task):
+            if task["id"] == "bad":
+                raise ValueError("broken task")
+            return {"result": {"value": task["id"]}}
+
+        worker = ExternalTaskWorker("cardTopic", handler, max_workers=2)
+
+        def get_task(*args, **kwargs):
+            if tasks:
+                fetched = list(tasks)
+                tasks.clear()
+                return fetched
+            worker.stop()
+            raise NoTask
+
+        camunda.get_task.side_effect = get_task
+        worker.run()
+
+        _, kwargs = camunda.get_task.call_args_list[0]
+        assert kwargs["async_response_timeout"] == worker.long_poll
+        camunda.finish_task.assert_called_once_with(
+            "ok", worker.worker_id, {"result": {"value": "ok"}}
+        )
+        camunda.handle_failure.assert_called_once()
+        args, kwargs = camunda.handle_failure.call_args
+        assert args == ("bad", worker.worker_id)
+        assert kwargs["retries"] == 1
+        assert kwargs["error_message"] == "broken task"
+
+    def test_batch_size_follows_handler_duration(self, camunda, settings):
+        settings.CAMUNDA_TASK_BATCH = 50
+        worker = ExternalTaskWorker(
+            "cardTopic", lambda task: None, max_workers=4, lock_duration=10000
+        )
+        assert worker.batch_size(capacity=4) == 4
+        assert worker.batch_size(capacity=100) == 50
+
+        # 4 потока * 5 секунд / 2 секунды на задачу
+        worker.avg_duration = 2
+        assert worker.batch_size(capacity=100) == 10
+
+    def test_expiring_locks_are_extended(self, camunda, settings):
+        settings.CAMUNDA_TASK_BATCH = 10
+        worker = ExternalTaskWorker("cardTopic", lambda task: None, lock_duration=3000)
+        worker._locks = {"slow": 0.0}
+
+        worker.extend_locks()
+
+        camunda.extend_lock.assert_called_once_with("slow", worker.worker_id, 3000)
+        assert worker._locks["slow"] > 0